@@ -18,7 +18,7 @@ import numpy as np
 import pandas as pd
 
 from flasc.dataframe_operations import dataframe_manipulations as dfm
-from flasc.energy_ratio import energy_ratio_suite
+from flasc.energy_ratio import energy_ratio
 from flasc.visualization import plot_floris_layout
 
 from floris.tools.visualization import visualize_cut_plane
@@ -72,9 +72,6 @@ def _calculate_energy_ratios(df, test_turbines, wd_bins, N=1):
     # wake overlap, thus close to the value returned by _get_angle(). Then,
     # N defines the bootstrapping sample size, defaulting to 1.
 
-    # Load an energy ratio suite from FLASC
-    s = energy_ratio_suite.energy_ratio_suite(verbose=False)
-
     # Designate a reference wind turbine, being the most upstream in the array
     # in our case. Thus, the energy ratio of the most upstream turbine will
     # always be 1.0, and the energy ratios of the other turbines are normalized
@@ -88,27 +85,19 @@ def _calculate_energy_ratios(df, test_turbines, wd_bins, N=1):
     # We filter the data to a subset of wind speeds, from 6 to 10 m/s
     df = dfm.filter_df_by_ws(df, [6, 10])
 
-    # Finally, we add the dataframe to the energy ratio suite.
-    s.add_df(df, 'data')
+    # Finally, we load the dataframe into an energy ratio object.
+    era = energy_ratio.energy_ratio(df)
 
     # Now, we calculate the energy ratio for each turbine for the one wind
-    # direction and wind speed bin. We save those values to
-    # 'results_energy_ratio'.
-    results_energy_ratio = []
-    for ti in test_turbines:
-        # Get energy ratios
-        er = s.get_energy_ratios(
-            test_turbines=ti,
-            ws_bins=[[6.0, 10.0]],
-            wd_bins=wd_bins,
-            N=N,
-            percentiles=[5.0, 95.0],
-            verbose=False
-        )
-        results_energy_ratio.append(er[0]["er_results"].loc[0])
-
-    # Finally, combine all results into a single dataframe
-    results_energy_ratio = pd.concat(results_energy_ratio, axis=1).T
+    # direction and wind speed bin. Since the binning is identical for all
+    # turbines, we calculate all energy ratios in a single batch.
+    results_energy_ratio = era.get_energy_ratio_batch(
+        test_turbines_list=[[ti] for ti in test_turbines],
+        ws_bins=[[6.0, 10.0]],
+        wd_bins=wd_bins,
+        N=N,
+        percentiles=[5.0, 95.0],
+    )
     return results_energy_ratio
 
 
@@ -126,7 +126,6 @@ def get_bias_for_single_turbine(ti, opt_search_range=[-180.0, 180.0]):
             ws_array=np.arange(6.0, 10.01, 1.0),
             ti_array=None,
             num_workers=4,
-            num_threads=20,
         )
         df_approx.to_feather(fout_df_fi_approx)
 
@@ -176,7 +175,10 @@ def get_bias_for_single_turbine(ti, opt_search_range=[-180.0, 180.0]):
         # dataframe, for wind speeds in region II of turbine operation, with
         # in steps of 3.0 deg (wd) and 5.0 m/s (ws). We search over the entire
         # range from -180.0 deg to +180.0 deg, in steps of 5.0 deg. This has
-        # appeared to be a good stepsize empirically.
+        # appeared to be a good stepsize empirically. We evaluate the search
+        # from fine wind direction histograms that are binned only once for
+        # every set of upstream turbines, rather than rebuilding the energy
+        # ratios for every wind direction bias.
         wd_bias, _ = fsc.estimate_wd_bias(
             time_mask=None,  # For entire dataset
             ws_mask=(6.0, 10.0),
@@ -186,7 +188,8 @@ def get_bias_for_single_turbine(ti, opt_search_range=[-180.0, 180.0]):
             er_N_btstrp=1,
             opt_search_brute_dx=5.0,
             opt_search_range=opt_search_range,
-            plot_iter_path=plot_iter_path
+            plot_iter_path=plot_iter_path,
+            use_fine_histograms=True,
         )
         wd_bias = float(wd_bias[0])  # Convert to float
 
@@ -10,6 +10,9 @@ from pathlib import Path
 
 from . import (
     energy_ratio,
+    energy_ratio_accumulator,
+    energy_ratio_binning,
+    energy_ratio_cube,
     energy_ratio_suite,
     energy_ratio_visualization,
     energy_ratio_wd_bias_estimation
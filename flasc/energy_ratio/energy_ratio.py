@@ -11,14 +11,20 @@
 # the License.
 
 
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from multiprocessing import shared_memory
+import os
+import warnings
+
 import numpy as np
 import pandas as pd
-
-from floris.utilities import wrap_360
-from pandas.core.base import DataError
+from scipy import stats
 
 from ..dataframe_operations import dataframe_manipulations as dfm
+from ..energy_ratio import energy_ratio_binning as erb
 from ..energy_ratio import energy_ratio_visualization as ervis
+from .. import utilities as fsut
 
 
 class energy_ratio:
@@ -30,7 +36,13 @@ class energy_ratio:
     discretization.
     """
 
-    def __init__(self, df_in, inflow_freq_interpolant=None, verbose=False):
+    def __init__(
+        self,
+        df_in,
+        inflow_freq_interpolant=None,
+        verbose=False,
+        copy_df=True,
+    ):
         """Initialization of the class.
 
         Args:
@@ -47,11 +59,16 @@ class energy_ratio:
             of inflow conditions. If None is specified, the occurrence of each
             bin is derived from the provided data, df_in. Defaults to None.
             verbose (bool, optional): Print to console. Defaults to False.
+            copy_df (bool, optional): Store a copy of df_in in the class. If
+            False, df_in is stored as is and must not be modified by the
+            caller while this class is in use, which avoids copying
+            dataframes that the caller does not hold on to, such as the
+            masked data of an energy_ratio_suite. Defaults to True.
         """
         self.verbose = verbose
 
         # Initialize dataframe
-        self._set_df(df_in)
+        self._set_df(df_in, copy_df=copy_df)
 
         # Initialize frequency functions
         self._set_inflow_freq_interpolant(inflow_freq_interpolant)
@@ -61,7 +78,7 @@ class energy_ratio:
     def _set_inflow_freq_interpolant(self, inflow_freq_interpolant):
         self.inflow_freq_interpolant = inflow_freq_interpolant
 
-    def _set_df(self, df_in):
+    def _set_df(self, df_in, copy_df=True):
         """This function writes the dataframe provided by the user to the
         class as self.df_full. This full dataframe will be used to create
         a minimal dataframe called self.df which contains the minimum
@@ -77,6 +94,8 @@ class energy_ratio:
                 * Power production of every turbine: pow_000, pow_001, ...
                 * Reference power production used to normalize the energy
                     ratio: 'pow_ref'
+            copy_df (bool, optional): Store a copy of df_in rather than
+            df_in itself. Defaults to True.
         """
         if "pow_ref" not in df_in.columns:
             raise KeyError("pow_ref column not in dataframe. Cannot proceed.")
@@ -88,7 +107,7 @@ class energy_ratio:
             #   ...
 
         # Copy full dataframe to self
-        self.df_full = df_in.copy()  # Full dataframe
+        self.df_full = df_in.copy() if copy_df else df_in  # Full dataframe
         self.df = None
 
     def _set_test_turbines(self, test_turbines):
@@ -171,41 +190,22 @@ class energy_ratio:
                 Overlap between bins is supported for wind direction bins.
                 Defaults to None.
         """
-        if ((ws_bins is None) | (wd_bins is None)):
-            # Add a temporary variable
-            a = np.array([-0.5, 0.5], dtype=float)
-
-        # If ws_bins is not specified, automatically calculate the
-        # wind speed bins using ws_step as bin width, from ws_step / 2.0,
-        # which is bounded by [0.0, ws_step),  up to 30 m/s. If the user
-        # already provided the wind speed bins 'ws_bins', then we need not
-        # derive anything and we directly save the user-specified bins
-        # to self (after converting them to numpy arrays).
-        if wd_bins is None:
+        # Derive the bins from the step sizes, unless the user directly
+        # specified the bins 'ws_bins' and 'wd_bins'
+        if ws_bins is None:
             ws_step = float(ws_step)
-            ws_labels = np.arange(ws_step/2.0, 30.0001, ws_step)
-            ws_bins = np.array([ws + a * ws_step for ws in ws_labels])
-        else:
-            ws_labels = np.array([np.mean(b) for b in ws_bins], dtype=float)
-            ws_bins = np.array(ws_bins, dtype=float)
-
-        # If wd_bins is not specified, automatically calculate the wind
-        # direction bins using wd_step as bin width, from 0.0 deg to 360 deg.
-        # If the user has already provided the wind direction bins 'ws_bins',
-        # then we need not derive anything and we directly save the user
-        # specified bins to self (after converting them to numpy arrays).
+        ws_bins = erb.get_ws_bins(ws_step=ws_step, ws_bins=ws_bins)
+        ws_labels = np.mean(ws_bins, axis=1)
+
         if wd_bins is None:
             wd_step = float(wd_step)
             if wd_bin_width is None:
                 wd_bin_width = wd_step
             wd_bin_width = float(wd_bin_width)
-
-            wd_min = np.min([wd_step / 2.0, wd_bin_width / 2.0])
-            wd_labels = np.arange(wd_min, 360.0001, wd_step)
-            wd_bins = np.array([wd + a * wd_bin_width for wd in wd_labels])
-        else:
-            wd_labels = np.array([np.mean(b) for b in wd_bins], dtype=float)
-            wd_bins = np.array(wd_bins, dtype=float)
+        wd_bins = erb.get_wd_bins(
+            wd_step=wd_step, wd_bin_width=wd_bin_width, wd_bins=wd_bins
+        )
+        wd_labels = np.mean(wd_bins, axis=1)
 
         # Save variables
         self.ws_step = ws_step
@@ -218,73 +218,433 @@ class energy_ratio:
 
     def _calculate_bins(self):
         """This function bins the data in the minimal dataframe, self.df,
-        into the respective wind direction and wind speed bins. Note that
-        there might be bin overlap if the specified wd_bin_width is larger
-        than the bin step size. This code will copy dataframe rows that fall
-        into multiple bins, effectively increasing the sample size.
+        into the respective wind direction and wind speed bins. Rather than
+        adding bin columns to the dataframe, every row is assigned integer
+        bin indices in a single vectorized pass. Note that there might be
+        bin overlap if the specified wd_bin_width is larger than the bin
+        step size. To avoid duplicating rows that fall into multiple wind
+        direction bins, the wind rose is split into the elementary segments
+        between all bin edges. Every row falls into exactly one segment,
+        and every wind direction bin is a circular window of consecutive
+        segments. The bin labels and edges are stored in the small side
+        tables self.df_wd_bins and self.df_ws_bins.
         """
         # Bin according to wind speed. Note that data never falls into
         # multiple wind speed bins at the same time.
-        for ws_bin in self.ws_bins:
-            ws_interval = pd.Interval(ws_bin[0], ws_bin[1], "left")
-            ids = (self.df["ws"] >= ws_bin[0]) & (self.df["ws"] < ws_bin[1])
-            self.df.loc[ids, "ws_bin"] = np.mean(ws_bin)
-            self.df.loc[ids, "ws_bin_edges"] = ws_interval
+        self.ws_bin_idx = erb.get_ws_bin_indices(self.df["ws"], self.ws_bins)
+        self.df_ws_bins = erb.get_bin_table(self.ws_bins, "ws")
 
         # Bin according to wind direction. Note that data can fall into
         # multiple wind direction bins at the same time, if wd_bin_width is
-        # larger than the wind direction binning step size, wd_step. If so,
-        # data will be copied and the sample size is effectively increased
-        # so that every relevant bin has that particular measurement.
-        df_list = [None for _ in range(len(self.wd_labels))]
-        for ii, wd_bin in enumerate(self.wd_bins):
-            wd_interval = pd.Interval(wd_bin[0], wd_bin[1], "left")
-            lb = wrap_360(wd_bin[0])
-            ub = wrap_360(wd_bin[1])
-            if ub < lb:  # Deal with angle wrapping
-                ids = (self.df["wd"] >= lb) | (self.df["wd"] < ub)
-            else:
-                ids = (self.df["wd"] >= lb) & (self.df["wd"] < ub)
-            df_subset = self.df.loc[ids].copy()
-            df_subset["wd_bin"] = np.mean(wd_bin)
-            df_subset["wd_bin_edges"] = wd_interval
-            df_list[ii] = df_subset
-        self.df = pd.concat(df_list, copy=False)
-
-        # Make sure a float
-        self.df["ws_bin"] = self.df["ws_bin"].astype(float)
-        self.df["wd_bin"] = self.df["wd_bin"].astype(float)
-
-    def _get_df_freq(self):
+        # larger than the wind direction binning step size, wd_step.
+        edges, self.wd_seg_membership = erb.get_wd_bin_segments(self.wd_bins)
+        self.wd_seg_idx = erb.get_wd_segment_indices(self.df["wd"], edges)
+        self.df_wd_bins = erb.get_bin_table(self.wd_bins, "wd")
+
+    def _calculate_bin_sums(self):
+        """This function sums the reference and test power production and
+        counts the number of measurements in every wind direction and wind
+        speed bin. Only measurements without any NaN values are included in
+        these sums. Additionally, the bin occurrences are counted through
+        _calculate_bin_occurrences().
+        """
+        self._calculate_bin_occurrences()
+
+        # Sums over the valid measurements in every bin
+        is_valid = np.array(self.df.notna().all(axis=1), dtype=bool)
+        bin_sums = self._get_bin_sums(
+            is_valid=is_valid[:, None],
+            pow_test=np.array(self.df[["pow_test"]], dtype=float),
+        )
+        self.bin_count, self.bin_sum_ref, self.bin_sum_test = [
+            x[:, :, 0] for x in bin_sums
+        ]
+
+    def _calculate_bin_occurrences(self):
+        """This function counts the number of measurements in every wind
+        direction and wind speed bin, independent of the test turbines. The
+        observed bin frequencies count all measurements that fall into a
+        bin, including those with NaNs, and the wind direction bin counts
+        include all measurements in a wind direction bin regardless of their
+        wind speed.
+        """
+        n_seg = self.wd_seg_membership.shape[0]
+        n_ws = self.df_ws_bins.shape[0]
+
+        # First count the measurements per wind rose segment, so that
+        # every row is visited exactly once regardless of bin overlap
+        in_seg = self.wd_seg_idx >= 0
+        seg_count = np.bincount(self.wd_seg_idx[in_seg], minlength=n_seg)
+
+        ids = in_seg & (self.ws_bin_idx >= 0)
+        seg_bin_idx = self.wd_seg_idx[ids] * n_ws + self.ws_bin_idx[ids]
+        seg_freq = np.bincount(seg_bin_idx, minlength=n_seg * n_ws)
+
+        # Then sum the segments into the (overlapping) wind direction bins
+        membership = self.wd_seg_membership
+        self.wd_bin_count = erb.get_wd_bin_sums(seg_count, membership)
+        self.bin_freq_observed = erb.get_wd_bin_sums(
+            seg_freq.reshape(n_seg, n_ws), membership
+        )
+
+    def _get_bin_sums(self, is_valid, pow_test):
+        """This function sums the reference and test power production and
+        counts the number of valid measurements in every wind direction and
+        wind speed bin, for multiple sets of test power productions at once.
+        The rows are mapped onto the wind rose segments and wind speed bins
+        through a sparse incidence matrix, so that the sums for all sets
+        follow from a single sparse matrix product, see erb.get_bin_sums().
+
+        Args:
+            is_valid ([np.array]): Boolean array of shape (n_rows, n_sets)
+                which is True for the rows that are valid for each set.
+            pow_test ([np.array]): Array of shape (n_rows, n_sets) with the
+                test power production of every set.
+
+        Returns:
+            bin_count ([np.array]): Array of shape (n_wd_bins, n_ws_bins,
+                n_sets) with the number of valid measurements in every bin.
+            bin_sum_ref ([np.array]): Array of the same shape with the
+                summed reference power production in every bin.
+            bin_sum_test ([np.array]): Array of the same shape with the
+                summed test power production in every bin.
+        """
+        n_seg = self.wd_seg_membership.shape[0]
+        n_ws = self.df_ws_bins.shape[0]
+        n_sets = pow_test.shape[1]
+        pow_ref = np.array(self.df["pow_ref"], dtype=float)[:, None]
+
+        seg_bin_idx = self._get_seg_bin_idx()
+        values = np.hstack(
+            [np.where(is_valid, x, 0.0) for x in [1.0, pow_ref, pow_test]]
+        )
+        seg_sums = erb.get_bin_sums(seg_bin_idx, n_seg * n_ws, values)
+        bin_sums = erb.get_wd_bin_sums(
+            seg_sums.reshape(n_seg, n_ws, 3, n_sets), self.wd_seg_membership
+        )
+
+        bin_count = np.array(np.rint(bin_sums[:, :, 0, :]), dtype=int)
+        return bin_count, bin_sums[:, :, 1, :], bin_sums[:, :, 2, :]
+
+    def _get_bin_sums_resampler(self):
+        """This function prepares the stratified resampling of the valid
+        measurements used by _get_bin_sums_resampled(). The valid rows are
+        grouped by their wind rose segment and wind speed bin, such that
+        every row can be resampled from within its own group.
+
+        Returns:
+            resampler ([dict]): Dictionary with the group of every valid
+                row, and the first row and number of rows of every group,
+                together with the power productions of the grouped rows.
+        """
+        n_cells = self.wd_seg_membership.shape[0] * self.df_ws_bins.shape[0]
+        is_valid = np.array(self.df.notna().all(axis=1), dtype=bool)
+        seg_bin_idx = self._get_seg_bin_idx()
+
+        rows = np.flatnonzero(is_valid & (seg_bin_idx >= 0))
+        rows = rows[np.argsort(seg_bin_idx[rows], kind="stable")]
+        cell_idx = seg_bin_idx[rows]
+        cell_len = np.bincount(cell_idx, minlength=n_cells)
+        return {
+            "cell_idx": cell_idx,
+            "cell_start": np.cumsum(cell_len) - cell_len,
+            "cell_len": cell_len,
+            "pow_ref": np.array(self.df["pow_ref"], dtype=float)[rows],
+            "pow_test": np.array(self.df["pow_test"], dtype=float)[rows],
+        }
+
+    def _get_bin_sums_resampled(self, resampler, n_draws, rng):
+        """This function draws n_draws bootstrap samples of the summed
+        reference and test power productions in every wind direction and
+        wind speed bin. Each valid measurement is resampled with
+        replacement from within its wind rose segment and wind speed bin,
+        so that the number of measurements in every bin, self.bin_count,
+        is the same for every draw. All draws are summed at once using a
+        weighted bincount over the (draw, segment, wind speed bin) indices.
+
+        Args:
+            resampler ([dict]): Output of _get_bin_sums_resampler().
+            n_draws ([int]): Number of bootstrap draws.
+            rng ([np.random.Generator]): Random generator.
+
+        Returns:
+            bin_sum_ref ([np.array]): Array of shape (n_draws, n_wd_bins,
+                n_ws_bins) with the resampled sums of the reference power
+                production in every bin.
+            bin_sum_test ([np.array]): Array of the same shape with the
+                resampled sums of the test power production in every bin.
+        """
+        n_seg = self.wd_seg_membership.shape[0]
+        n_ws = self.df_ws_bins.shape[0]
+        n_cells = n_seg * n_ws
+        cell_idx = resampler["cell_idx"]
+
+        # Draw a row from the same group for every row and draw
+        offsets = np.floor(
+            rng.random((n_draws, len(cell_idx))) *
+            resampler["cell_len"][cell_idx]
+        ).astype(int)
+        rows_randomized = resampler["cell_start"][cell_idx] + offsets
+
+        bin_idx = (n_cells * np.arange(n_draws)[:, None] + cell_idx).ravel()
+        bin_sums = [
+            np.bincount(
+                bin_idx,
+                weights=resampler[c][rows_randomized].ravel(),
+                minlength=n_draws * n_cells,
+            ).reshape(n_draws, n_seg, n_ws)
+            for c in ["pow_ref", "pow_test"]
+        ]
+
+        # Sum the segments into the (overlapping) wind direction bins
+        return [
+            np.moveaxis(
+                erb.get_wd_bin_sums(
+                    np.moveaxis(x, 0, -1), self.wd_seg_membership
+                ),
+                -1,
+                0,
+            )
+            for x in bin_sums
+        ]
+
+    def _get_seg_bin_idx(self):
+        """Flattened index of every row into the wind rose segments and
+        wind speed bins, or -1 for rows outside of these bins."""
+        n_ws = self.df_ws_bins.shape[0]
+        return np.where(
+            (self.wd_seg_idx >= 0) & (self.ws_bin_idx >= 0),
+            self.wd_seg_idx * n_ws + self.ws_bin_idx,
+            -1,
+        )
+
+    def _get_block_idx(self, block_length):
+        """Time block index of every row for block bootstrapping, or None
+        if no block length is specified."""
+        if block_length is None:
+            return None
+        if "time" not in self.df_full.columns:
+            raise KeyError(
+                "time column not in dataframe. Cannot proceed with block "
+                "bootstrapping."
+            )
+        return erb.get_time_block_indices(self.df_full["time"], block_length)
+
+    def _get_bin_freq(self, bin_freq=None):
         """This function derives the frequency of occurrence of each bin
-        (wind direction and wind speed) from the binned dataframe. The
-        found values are used in the energy ratio equation to weigh the
-        power productions of each bin according to their frequency of
-        occurrence.
+        (wind direction and wind speed) from the binned data. The found
+        values are used in the energy ratio equation to weigh the power
+        productions of each bin according to their frequency of occurrence.
+        If an inflow frequency interpolant was specified, the frequency of
+        every observed bin is evaluated from that interpolant instead.
+
+        Args:
+            bin_freq ([np.array], optional): Array of shape (n_wd_bins,
+                n_ws_bins) with the frequency of every bin, e.g., balanced
+                between multiple dataframes. If specified, this overrules
+                the observed frequencies and the inflow frequency
+                interpolant. Defaults to None.
+
+        Returns:
+            bin_freq ([np.array]): Array of shape (n_wd_bins, n_ws_bins)
+                with the frequency of occurrence of every bin.
         """
+        if bin_freq is not None:
+            self.bin_freq = np.array(bin_freq, dtype=float)
+            return self.bin_freq
+
         # Determine observed frequency
-        cols = ["ws_bin", "wd_bin", "ws_bin_edges", "wd_bin_edges"]
-        df_freq_observed = self.df[cols].copy()
-        df_freq_observed["freq"] = 1
-        df_freq_observed = df_freq_observed.groupby(["wd_bin", "ws_bin"])
-        bin_edges = df_freq_observed[["ws_bin_edges", "wd_bin_edges"]].first()
-        bin_freq = df_freq_observed["freq"].sum()
-        df_freq_observed = pd.concat([bin_freq, bin_edges], axis=1)
-        df_freq_observed = df_freq_observed.reset_index(drop=False)
-        df_freq = df_freq_observed
+        bin_freq = np.array(self.bin_freq_observed, dtype=float)
 
         if self.inflow_freq_interpolant is not None:
             # Overwrite freq of bin occurrence with user-specified function
-            df_freq["freq"] = self.inflow_freq_interpolant(
-                df_freq["wd_bin"],
-                df_freq["ws_bin"],
+            wd_bin, ws_bin = np.meshgrid(
+                self.df_wd_bins["wd_bin"],
+                self.df_ws_bins["ws_bin"],
+                indexing="ij",
+            )
+            ids = bin_freq > 0
+            bin_freq[ids] = self.inflow_freq_interpolant(
+                wd_bin[ids],
+                ws_bin[ids],
+            )
+            bin_freq[np.isnan(bin_freq)] = 0.0
+
+        self.bin_freq = bin_freq
+        return bin_freq
+
+    def _get_bin_moments(self, cols, idx_a=None, idx_b=None):
+        """This function sums the variables in cols over the valid
+        measurements in every wind direction and wind speed bin, as well as
+        the products of their deviations from the bin means. For every pair
+        (idx_a[i], idx_b[i]), the deviations of the variables cols[idx_a[i]]
+        and cols[idx_b[i]] are multiplied. By default, these are the sums of
+        squared deviations of every variable. The deviations are first taken
+        from the mean of every wind rose segment and wind speed bin in a
+        second pass over the data, after which the segments are combined
+        into the (overlapping) wind direction bins. This is numerically
+        stable also for variables with small variances.
+
+        Args:
+            cols ([list]): Names of the variables.
+            idx_a ([iterable], optional): Index of the first variable of
+                every pair. Defaults to None.
+            idx_b ([iterable], optional): Index of the second variable of
+                every pair. Defaults to None.
+
+        Returns:
+            bin_sums ([np.array]): Array of shape (n_wd_bins, n_ws_bins,
+                n_vars) with the sum of every variable.
+            bin_sums_dev_prod ([np.array]): Array of shape (n_wd_bins,
+                n_ws_bins, n_pairs) with the sum of the products of
+                deviations of every pair of variables.
+        """
+        n_seg = self.wd_seg_membership.shape[0]
+        n_ws = self.df_ws_bins.shape[0]
+        if idx_a is None:
+            idx_a = idx_b = np.arange(len(cols))
+
+        # Number of valid measurements and sums per segment and ws bin
+        seg_bin_idx = self._get_seg_bin_idx()
+        is_valid = np.array(self.df.notna().all(axis=1), dtype=bool)
+        x = np.where(
+            is_valid[:, None], np.array(self.df[cols], dtype=float), 0.0
+        )
+        seg_sums = erb.get_bin_sums(
+            seg_bin_idx, n_seg * n_ws, np.hstack([is_valid[:, None], x])
+        )
+        seg_count = seg_sums[:, 0]
+        seg_sums = seg_sums[:, 1:]
+
+        # Products of deviations from the mean of every segment and ws bin
+        with np.errstate(divide="ignore", invalid="ignore"):
+            seg_means = np.nan_to_num(seg_sums / seg_count[:, None])
+        ids = seg_bin_idx >= 0
+        x[ids] = np.where(
+            is_valid[ids, None], x[ids] - seg_means[seg_bin_idx[ids]], 0.0
+        )
+        seg_sums_dev_prod = erb.get_bin_sums(
+            seg_bin_idx, n_seg * n_ws, x[:, idx_a] * x[:, idx_b]
+        )
+
+        # Combine the segments into the (overlapping) wind direction bins
+        membership = self.wd_seg_membership
+        bin_sums = erb.get_wd_bin_sums(
+            seg_sums.reshape(n_seg, n_ws, -1), membership
+        )
+        bin_sums_dev_prod = erb.get_wd_bin_sums(
+            seg_sums_dev_prod.reshape(n_seg, n_ws, -1), membership
+        )
+        bin_sums_dev_prod += _get_sums_dev_prod_between(
+            seg_count.reshape(n_seg, n_ws),
+            seg_means.reshape(n_seg, n_ws, -1),
+            bin_sums,
+            membership,
+            idx_a,
+            idx_b,
+        )
+        return bin_sums, bin_sums_dev_prod
+
+    def _get_detailed_output(self):
+        """This function calculates the detailed energy ratio information
+        for every wind direction bin and for every wind direction and wind
+        speed bin, useful for debugging and figuring out flaws in the data.
+        The sums and sums of squared deviations of all variables follow
+        from _get_bin_moments(), after which the means and standard
+        deviations of every bin follow from _get_detailed_output_from_sums().
+
+        Returns:
+            dict_out ([dict]): Dictionary with the fields 'df_per_wd_bin'
+                and 'df_per_ws_bin'.
+        """
+        if "ti" in self.df.columns:
+            mean_cols = ["wd", "ws", "ti", "pow_ref", "pow_test"]
+        else:
+            mean_cols = ["wd", "ws", "pow_ref", "pow_test"]
+        bin_sums, bin_sums_sq_dev = self._get_bin_moments(mean_cols)
+
+        return _get_detailed_output_from_sums(
+            df_wd_bins=self.df_wd_bins,
+            df_ws_bins=self.df_ws_bins,
+            wd_bin_count=self.wd_bin_count,
+            bin_freq=self.bin_freq,
+            bin_count=self.bin_count,
+            bin_sums=bin_sums,
+            bin_sums_sq_dev=bin_sums_sq_dev,
+            mean_cols=mean_cols,
+        )
+
+    def _get_energy_ratio_from_bins(
+        self,
+        N=1,
+        percentiles=[5.0, 95.0],
+        return_detailed_output=False,
+        n_jobs=1,
+        seed=None,
+        uq_method="bootstrap",
+        block_length=None,
+        bin_freq=None,
+    ):
+        """This function calculates the energy ratios from the binned data,
+        after _set_test_turbines(), _set_binning_properties(),
+        _calculate_bins() and _calculate_bin_sums() have been called. This
+        allows energy_ratio_suite to balance the bins between dataframes
+        without binning the data twice. See get_energy_ratio() for the
+        arguments. The bin frequencies can be overruled with bin_freq, see
+        _get_bin_freq().
+        """
+        if uq_method not in ["bootstrap", "analytic"]:
+            raise ValueError(
+                "uq_method must be 'bootstrap' or 'analytic'."
+            )
+
+        # Get probability distribution of bins
+        self._get_bin_freq(bin_freq)
+
+        # Calculate the energy ratio for all bins
+        if uq_method == "analytic":
+            _, bin_sums_dev_prod = self._get_bin_moments(
+                ["pow_ref", "pow_test"], idx_a=[0, 1, 0], idx_b=[0, 1, 1]
+            )
+            energy_ratios = _get_energy_ratios_all_wd_bins_analytic(
+                df_wd_bins=self.df_wd_bins,
+                wd_bin_count=self.wd_bin_count,
+                bin_freq=self.bin_freq,
+                bin_count=self.bin_count,
+                bin_sum_ref=self.bin_sum_ref,
+                bin_sum_test=self.bin_sum_test,
+                bin_sums_dev_prod=bin_sums_dev_prod,
+                percentiles=percentiles,
+            )
+        else:
+            energy_ratios = _get_energy_ratios_all_wd_bins_bootstrapping(
+                df_wd_bins=self.df_wd_bins,
+                wd_bin_count=self.wd_bin_count,
+                bin_freq=self.bin_freq,
+                bin_count=self.bin_count,
+                bin_sum_ref=self.bin_sum_ref,
+                bin_sum_test=self.bin_sum_test,
+                wd_seg_idx=self.wd_seg_idx,
+                wd_seg_membership=self.wd_seg_membership,
+                ws_bin_idx=self.ws_bin_idx,
+                is_valid=np.array(self.df.notna().all(axis=1), dtype=bool),
+                pow_ref=np.array(self.df["pow_ref"], dtype=float),
+                pow_test=np.array(self.df["pow_test"], dtype=float),
+                N=N,
+                percentiles=percentiles,
+                n_jobs=n_jobs,
+                seed=seed,
+                block_idx=self._get_block_idx(block_length),
             )
 
-        # Sort by 'ws_bin' as index
-        df_freq = df_freq.set_index("ws_bin")
-        self.df_freq = df_freq
+        self.energy_ratio_out = energy_ratios
+        self.energy_ratio_N = N
+
+        if return_detailed_output:
+            dict_out = self._get_detailed_output()
+            return energy_ratios, dict_out
 
-        return df_freq
+        return energy_ratios
 
     # Public methods
 
@@ -299,6 +659,10 @@ class energy_ratio:
         N=1,
         percentiles=[5.0, 95.0],
         return_detailed_output=False,
+        n_jobs=1,
+        seed=None,
+        uq_method="bootstrap",
+        block_length=None,
     ):
         """This is the main function used to calculate the energy ratios
         for dataframe provided to the class during initialization. One
@@ -349,8 +713,8 @@ class energy_ratio:
                 relevant if N > 1 is specified. Defaults to [5., 95.].
             return_detailed_output (bool, optional): Also calculate and
                 return detailed energy ratio information useful for debugging
-                and figuring out flaws in the data. This slows down the
-                calculations but can be very useful. The additional info is
+                and figuring out flaws in the data. This takes a single
+                additional pass over the data. The additional info is
                 written to self.df_lists[i]["er_results_info_dict"]. The
                 dictionary variable therein contains two fields, being
                 "df_per_wd_bin" and "df_per_ws_bin". The first gives an
@@ -361,6 +725,34 @@ class energy_ratio:
                 direction and wind speed bin, among others. This is
                 particularly helpful in figuring out if the bins are well
                 balanced. Defaults to False.
+            n_jobs (int, optional): Number of worker processes over which
+                the bootstrapping of the wind direction bins is distributed.
+                The binned data is shared with the workers through shared
+                memory. If n_jobs < 1, uses all available CPU cores. This
+                value is only relevant if N > 1 is specified. Defaults to 1.
+            seed (int or np.random.SeedSequence, optional): Seed for the
+                bootstrapping. Every wind direction bin draws from its own
+                random stream spawned from this seed, such that the results
+                are identical regardless of n_jobs. If None, the seed is
+                drawn from NumPy's global random state, meaning that
+                np.random.seed() still yields reproducible results.
+                Defaults to None.
+            uq_method (str, optional): Method for the uncertainty
+                quantification. Options are 'bootstrap', which performs N
+                bootstrap evaluations, and 'analytic', which derives the
+                confidence bounds from the variance of the balanced energy
+                ratio through the delta method. The analytic bounds cost
+                about as much as the nominal energy ratios, but assume a
+                normal distribution of the energy ratio. With 'analytic',
+                N is ignored. Defaults to 'bootstrap'.
+            block_length (str or pd.Timedelta, optional): If specified,
+                the bootstrapping resamples contiguous blocks of time of
+                this length, e.g., '1h', rather than individual data
+                entries. This accounts for the correlation between
+                measurements close in time, which otherwise leads to too
+                narrow confidence bounds for high-frequency data. Requires
+                the column 'time' in the dataframe. Only relevant if N > 1
+                and uq_method='bootstrap'. Defaults to None.
 
         Returns:
             energy_ratios ([pd.DataFrame]): Dataframe containing the found
@@ -383,7 +775,10 @@ class energy_ratio:
             return None
 
         if self.verbose:
-            print("Calculating energy ratios with N = %d." % N)
+            if uq_method == "analytic":
+                print("Calculating energy ratios with analytic bounds.")
+            else:
+                print("Calculating energy ratios with N = %d." % N)
 
         # Set up a 'pow_test' column in the dataframe
         self._set_test_turbines(test_turbines)
@@ -394,31 +789,266 @@ class energy_ratio:
             ws_bins=ws_bins, wd_bins=wd_bins
         )
         self._calculate_bins()
+        self._calculate_bin_sums()
 
-        # Get probability distribution of bins
-        self._get_df_freq()
-
-        # Calculate the energy ratio for all bins
-        out = _get_energy_ratios_all_wd_bins_bootstrapping(
-            df_binned=self.df,
-            df_freq=self.df_freq,
+        return self._get_energy_ratio_from_bins(
             N=N,
             percentiles=percentiles,
             return_detailed_output=return_detailed_output,
+            n_jobs=n_jobs,
+            seed=seed,
+            uq_method=uq_method,
+            block_length=block_length,
         )
-        if return_detailed_output:
-            energy_ratios = out[0]
-            dict_out = out[1]
+
+    def get_energy_ratio_batch(
+        self,
+        test_turbines_list,
+        wd_step=2.0,
+        ws_step=1.0,
+        wd_bin_width=None,
+        wd_bins=None,
+        ws_bins=None,
+        N=1,
+        percentiles=[5.0, 95.0],
+        n_jobs=1,
+        seed=None,
+        block_length=None,
+    ):
+        """This function calculates the energy ratios for multiple (sets
+        of) test turbines at once. Since the binning only depends on the
+        wind direction and wind speed, the data is binned only once. The
+        power productions of all sets of test turbines are then summed
+        simultaneously into a (bins x sets) matrix. This is much faster
+        than calling get_energy_ratio() for every set of test turbines.
+
+        Args:
+            test_turbines_list ([iteratible]): List with the sets of test
+                turbines for which the energy ratios must be calculated,
+                e.g., [[0], [1], [2, 3]]. Each set is handled like the
+                test_turbines argument of get_energy_ratio(). A single
+                turbine number is interpreted as a set with one turbine.
+            wd_step, ws_step, wd_bin_width, wd_bins, ws_bins, N,
+            percentiles, n_jobs, block_length: See get_energy_ratio().
+            seed (int or np.random.SeedSequence, optional): Seed for the
+                bootstrapping. A separate random stream is spawned from
+                this seed for every set of test turbines. If None, the
+                seeds are drawn from NumPy's global random state. Defaults
+                to None.
+
+        Returns:
+            energy_ratios ([pd.DataFrame]): Dataframe in long format, with
+                one row for every set of test turbines and wind direction
+                bin. Contains the column 'test_turbines', holding the set
+                of test turbines as a tuple, and further the same columns
+                as the output of get_energy_ratio().
+        """
+        if self.df_full.shape[0] < 1:
+            # Empty dataframe, do nothing
+            return pd.DataFrame()
+
+        test_turbines_list = [
+            t if (type(t) is list) else list(np.atleast_1d(t))
+            for t in test_turbines_list
+        ]
+        n_sets = len(test_turbines_list)
+        if self.verbose:
+            print(
+                "Calculating energy ratios for %d sets of test turbines "
+                "with N = %d." % (n_sets, N)
+            )
+
+        # Set up the minimal dataframe and the test power of every set
+        if "ti" in self.df_full.columns:
+            cols = ["wd", "ws", "ti", "pow_ref"]
         else:
-            energy_ratios = out
+            cols = ["wd", "ws", "pow_ref"]
+        self.df = self.df_full[cols].copy()
+        turbines = np.unique(np.hstack(test_turbines_list)).astype(int)
+        pow_cols = ["pow_{:03d}".format(t) for t in turbines]
+        pow_all = np.array(self.df_full[pow_cols], dtype=float)
+        pow_test = np.empty((self.df.shape[0], n_sets))
+        with warnings.catch_warnings():
+            # Average over test turbines, like dfm.get_column_mean()
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            for ii, t in enumerate(test_turbines_list):
+                ids = np.searchsorted(turbines, t)
+                pow_test[:, ii] = np.nanmean(pow_all[:, ids], axis=1)
+        is_valid = (
+            np.array(self.df.notna().all(axis=1), dtype=bool)[:, None] &
+            ~np.isnan(pow_test)
+        )
 
-        self.energy_ratio_out = energy_ratios
-        self.energy_ratio_N = N
+        # Bin the data once, and sum the power productions of all sets
+        self._set_binning_properties(
+            ws_step=ws_step, wd_step=wd_step, wd_bin_width=wd_bin_width,
+            ws_bins=ws_bins, wd_bins=wd_bins
+        )
+        self._calculate_bins()
+        self._calculate_bin_occurrences()
+        self._get_bin_freq()
+        bin_count, bin_sum_ref, bin_sum_test = self._get_bin_sums(
+            is_valid=is_valid, pow_test=pow_test
+        )
 
-        if return_detailed_output:
-            return energy_ratios, dict_out
+        # Calculate the energy ratios for every set of test turbines
+        if seed is None:
+            seeds = [None for _ in range(n_sets)]
+        else:
+            seeds = _get_seed_sequence(seed).spawn(n_sets)
+        pow_ref = np.array(self.df["pow_ref"], dtype=float)
+        block_idx = self._get_block_idx(block_length)
+
+        energy_ratios_list = []
+        for ii, test_turbines in enumerate(test_turbines_list):
+            energy_ratios = _get_energy_ratios_all_wd_bins_bootstrapping(
+                df_wd_bins=self.df_wd_bins,
+                wd_bin_count=self.wd_bin_count,
+                bin_freq=self.bin_freq,
+                bin_count=bin_count[:, :, ii],
+                bin_sum_ref=bin_sum_ref[:, :, ii],
+                bin_sum_test=bin_sum_test[:, :, ii],
+                wd_seg_idx=self.wd_seg_idx,
+                wd_seg_membership=self.wd_seg_membership,
+                ws_bin_idx=self.ws_bin_idx,
+                is_valid=is_valid[:, ii],
+                pow_ref=pow_ref,
+                pow_test=pow_test[:, ii],
+                N=N,
+                percentiles=percentiles,
+                n_jobs=n_jobs,
+                seed=seeds[ii],
+                block_idx=block_idx,
+            )
+            energy_ratios.insert(
+                0, "test_turbines", [tuple(test_turbines)] * len(energy_ratios)
+            )
+            energy_ratios_list.append(energy_ratios)
 
-        return energy_ratios
+        return pd.concat(energy_ratios_list, ignore_index=True)
+
+    def get_energy_ratio_matrix(
+        self,
+        test_turbines=None,
+        ref_turbines=None,
+        wd_step=2.0,
+        ws_step=1.0,
+        wd_bin_width=None,
+        wd_bins=None,
+        ws_bins=None,
+        max_chunk_size=10_000_000,
+    ):
+        """This function calculates the energy ratios of every test turbine
+        against every reference turbine at once, e.g., to map the wake
+        losses between all pairs of turbines. For each pair, the power
+        production of the reference turbine takes the place of 'pow_ref'
+        in the energy ratio equation, and only the measurements for which
+        both turbines are valid are included. The data is binned only once.
+        For every reference turbine, the power productions of all test
+        turbines and the number of measurements valid for both turbines
+        are then summed simultaneously into a (bins x test turbines)
+        matrix. The test turbines are processed in chunks of at most
+        max_chunk_size summed values, to limit memory usage for large wind
+        farms. The bin frequencies are derived from the data as in
+        get_energy_ratio(), and are identical for every pair.
+
+        Args:
+            test_turbines ([iteratible], optional): List with the test
+                turbines. If None, uses all turbines. Defaults to None.
+            ref_turbines ([iteratible], optional): List with the reference
+                turbines. If None, uses all turbines. Defaults to None.
+            wd_step, ws_step, wd_bin_width, wd_bins, ws_bins: Binning
+                properties, see get_energy_ratio().
+            max_chunk_size (int, optional): Maximum number of values summed
+                at once. Defaults to 10_000_000.
+
+        Returns:
+            energy_ratios ([np.array]): Array of shape (n_test_turbines,
+                n_ref_turbines, n_wd_bins) with the energy ratio of every
+                test turbine against every reference turbine in every wind
+                direction bin. Bins without valid measurements are NaN.
+            wd_bin ([np.array]): The mean wind direction of every wind
+                direction bin, in the order of the last axis of
+                energy_ratios.
+        """
+        num_turbines = fsut.get_num_turbines(self.df_full)
+        if test_turbines is None:
+            test_turbines = range(num_turbines)
+        if ref_turbines is None:
+            ref_turbines = range(num_turbines)
+        test_turbines = np.atleast_1d(test_turbines).astype(int)
+        ref_turbines = np.atleast_1d(ref_turbines).astype(int)
+        n_test = len(test_turbines)
+        if self.verbose:
+            print(
+                "Calculating energy ratios for %d test turbines against %d "
+                "reference turbines." % (n_test, len(ref_turbines))
+            )
+
+        # Set up the minimal dataframe and bin the data once
+        if "ti" in self.df_full.columns:
+            cols = ["wd", "ws", "ti"]
+        else:
+            cols = ["wd", "ws"]
+        self.df = self.df_full[cols].copy()
+        self._set_binning_properties(
+            ws_step=ws_step, wd_step=wd_step, wd_bin_width=wd_bin_width,
+            ws_bins=ws_bins, wd_bins=wd_bins
+        )
+        self._calculate_bins()
+        self._calculate_bin_occurrences()
+        bin_freq = self._get_bin_freq()
+
+        n_seg = self.wd_seg_membership.shape[0]
+        n_ws = self.df_ws_bins.shape[0]
+        seg_bin_idx = self._get_seg_bin_idx()
+        base_valid = np.array(self.df.notna().all(axis=1), dtype=bool)
+
+        def get_power(turbines):
+            pow_cols = ["pow_{:03d}".format(t) for t in turbines]
+            x = np.array(self.df_full[pow_cols], dtype=float)
+            is_valid = base_valid[:, None] & ~np.isnan(x)
+            return np.where(is_valid, x, 0.0), is_valid
+
+        pow_ref_all, is_valid_ref_all = get_power(ref_turbines)
+        n_rows = self.df.shape[0]
+        chunk_size = max_chunk_size // (3 * np.max([n_rows, 1]))
+        chunk_size = int(np.max([1, chunk_size]))
+
+        energy_ratios = np.zeros((n_test, len(ref_turbines), len(bin_freq)))
+        for i0 in range(0, n_test, chunk_size):
+            pow_test, is_valid_test = get_power(
+                test_turbines[i0:i0 + chunk_size]
+            )
+            for jj in range(len(ref_turbines)):
+                # Sums over the measurements valid for both turbines
+                is_valid = is_valid_test & is_valid_ref_all[:, [jj]]
+                values = np.hstack([
+                    is_valid,
+                    is_valid * pow_ref_all[:, [jj]],
+                    is_valid * pow_test,
+                ])
+                seg_sums = erb.get_bin_sums(seg_bin_idx, n_seg * n_ws, values)
+                bin_sums = erb.get_wd_bin_sums(
+                    seg_sums.reshape(n_seg, n_ws, 3, -1),
+                    self.wd_seg_membership,
+                )
+                energy_ratios[i0:i0 + chunk_size, jj, :] = (
+                    _get_energy_ratio_balanced(
+                        bin_freq=bin_freq,
+                        bin_count=np.moveaxis(bin_sums[:, :, 0, :], -1, 0),
+                        bin_sum_ref=np.moveaxis(bin_sums[:, :, 1, :], -1, 0),
+                        bin_sum_test=np.moveaxis(bin_sums[:, :, 2, :], -1, 0),
+                    )
+                )
+
+            if self.verbose:
+                print(
+                    "Calculated the energy ratios of %d out of %d test "
+                    "turbines." % (np.min([i0 + chunk_size, n_test]), n_test)
+                )
+
+        return energy_ratios, np.array(self.df_wd_bins["wd_bin"])
 
     def get_energy_ratio_fast(
         self, test_turbines, ws_step, wd_step, wd_bin_width=None, 
@@ -469,14 +1099,35 @@ class energy_ratio:
         )
         self._calculate_bins()
 
-        df = self.df.dropna(how="any", subset=["pow_ref", "pow_test"]).copy()
-        df.loc[df.index, "bin_count"] = 1
+        # Sum the power production over all valid entries in each segment
+        n_seg = self.wd_seg_membership.shape[0]
+        pow_ref = np.array(self.df["pow_ref"], dtype=float)
+        pow_test = np.array(self.df["pow_test"], dtype=float)
+        ids = ~np.isnan(pow_ref) & ~np.isnan(pow_test) & (self.wd_seg_idx >= 0)
+        seg_idx = self.wd_seg_idx[ids]
+        seg_sums = np.stack(
+            [
+                np.bincount(seg_idx, minlength=n_seg),
+                np.bincount(seg_idx, weights=pow_ref[ids], minlength=n_seg),
+                np.bincount(seg_idx, weights=pow_test[ids], minlength=n_seg),
+            ],
+            axis=-1,
+        )
 
-        df_summed = df.groupby("wd_bin")[["pow_ref", "pow_test", "bin_count"]].sum()
-        df_summed.loc[df_summed.index, ["baseline", "baseline_lb", "baseline_ub"]] = (
-            np.tile(df_summed["pow_test"] / df_summed["pow_ref"], (3, 1)).T
+        # Sum the segments into the (overlapping) wind direction bins
+        bin_sums = erb.get_wd_bin_sums(seg_sums, self.wd_seg_membership)
+        ids = (bin_sums[:, 0] > 0)
+        energy_ratios = pd.DataFrame(
+            {
+                "wd_bin": np.array(self.df_wd_bins["wd_bin"])[ids],
+                "pow_ref": bin_sums[ids, 1],
+                "pow_test": bin_sums[ids, 2],
+                "bin_count": np.array(bin_sums[ids, 0], dtype=int),
+            }
+        )
+        energy_ratios[["baseline", "baseline_lb", "baseline_ub"]] = (
+            np.tile(energy_ratios["pow_test"] / energy_ratios["pow_ref"], (3, 1)).T
         )
-        energy_ratios = df_summed.reset_index(drop=False)
         return energy_ratios
 
     def plot_energy_ratio(self):
@@ -495,52 +1146,76 @@ class energy_ratio:
 
 
 def _get_energy_ratios_all_wd_bins_bootstrapping(
-    df_binned,
-    df_freq,
+    df_wd_bins,
+    wd_bin_count,
+    bin_freq,
+    bin_count,
+    bin_sum_ref,
+    bin_sum_test,
+    wd_seg_idx,
+    wd_seg_membership,
+    ws_bin_idx,
+    is_valid,
+    pow_ref,
+    pow_test,
     N=1,
     percentiles=[5.0, 95.0],
-    return_detailed_output=False,
+    n_jobs=1,
+    seed=None,
+    block_idx=None,
 ):
     """Wrapper function that calculates the energy ratio for every wind
-    direction bin in the provided dataframe. This function wraps around
+    direction bin from the binned data. The nominal energy ratios are
+    calculated for all wind direction bins at once from the summed power
+    productions. For uncertainty quantification, this function wraps around
     the function '_get_energy_ratio_single_wd_bin_bootstrapping', which
-    calculates the energy ratio for a single wind direction bin.
+    calculates the bootstrapped energy ratio for a single wind direction
+    bin.
 
     Args:
-        df_binned ([pd.DataFrame]): Dataframe containing the binned
-        data. This dataframe must contain, at the minimum, the following
-        columns:
-            * ws_bin: The wind speed bin
-            * wd_bin: The wind direction bin
-            * pow_ref: The reference power production, previously specified
-                by the user outside of this function/class. This value
-                belongs in the denominator in the energy ratio equation.
-            * pow_test: The test power production. This value belongs in the
-                nominator in the energy ratio equation.
-        df_freq ([pd.DataFrame]): Dataframe containing the frequency of every
-            wind direction and wind speed bin. This dataframe is typically
-            derived from the data itself but can also be a separate dataframe
-            based on the wind rose of the site.
+        df_wd_bins ([pd.DataFrame]): Table with one row for every wind
+            direction bin, containing the bin label in the column 'wd_bin'.
+        wd_bin_count ([np.array]): Number of data entries in every wind
+            direction bin.
+        bin_freq ([np.array]): Array of shape (n_wd_bins, n_ws_bins)
+            containing the frequency of every wind direction and wind speed
+            bin. This is typically derived from the data itself but can
+            also be based on the wind rose of the site.
+        bin_count ([np.array]): Array of shape (n_wd_bins, n_ws_bins) with
+            the number of valid data entries in every bin.
+        bin_sum_ref ([np.array]): Array of shape (n_wd_bins, n_ws_bins) with
+            the summed reference power production in every bin. This value
+            belongs in the denominator in the energy ratio equation.
+        bin_sum_test ([np.array]): Array of shape (n_wd_bins, n_ws_bins)
+            with the summed test power production in every bin. This value
+            belongs in the nominator in the energy ratio equation.
+        wd_seg_idx ([np.array]): Wind rose segment index of every row, or
+            -1 if the wind direction is NaN.
+        wd_seg_membership ([np.array]): Boolean array of shape
+            (n_segments, n_wd_bins) which is True where a segment is part
+            of a wind direction bin.
+        ws_bin_idx ([np.array]): Wind speed bin index of every row, or -1
+            if the row does not fall into any wind speed bin.
+        is_valid ([np.array]): Boolean array which is True for every row
+            that does not contain any NaN values.
+        pow_ref ([np.array]): Reference power production of every row.
+        pow_test ([np.array]): Test power production of every row.
         N (int, optional): Number of bootstrap evaluations for
             uncertainty quantification (UQ). If N=1, will not perform any
             uncertainty quantification. Defaults to 1.
         percentiles (list, optional): Confidence bounds for the
             uncertainty quantification in percents. This value is only
             relevant if N > 1 is specified. Defaults to [5., 95.].
-        return_detailed_output (bool, optional): Also calculate and
-            return detailed energy ratio information useful for debugging
-            and figuring out flaws in the data. This slows down the
-            calculations but can be very useful. The additional info is
-            written to self.df_lists[i]["er_results_info_dict"]. The
-            dictionary variable therein contains two fields, being
-            "df_per_wd_bin" and "df_per_ws_bin". The first gives an
-            overview of the energy ratio for every wind direction bin,
-            covering the collective effect of all wind speeds in the
-            data. The latter one, "df_per_ws_bin", yields even more
-            information and displays the energy ratio for every wind
-            direction and wind speed bin, among others. This is
-            particularly helpful in figuring out if the bins are well
-            balanced. Defaults to False.
+        n_jobs (int, optional): Number of worker processes over which the
+            bootstrapping of the wind direction bins is distributed. If
+            n_jobs < 1, uses all available CPU cores. Defaults to 1.
+        seed (int or np.random.SeedSequence, optional): Seed from which the
+            random stream of every wind direction bin is spawned. If None,
+            the seed is drawn from NumPy's global random state. Defaults
+            to None.
+        block_idx ([np.array], optional): Time block index of every row.
+            If specified, whole time blocks are resampled rather than
+            individual rows. Defaults to None.
 
     Returns:
         energy_ratios ([pd.DataFrame]): Dataframe containing the found
@@ -556,282 +1231,631 @@ def _get_energy_ratios_all_wd_bins_bootstrapping(
                     value is equal to baseline without UQ and higher
                     with UQ.
     """
-    # Extract minimal dataframe
-    if "ti" in df_binned.columns:
-        min_cols = [
-            "wd",
-            "ws",
-            "ti",
-            "ws_bin",
-            "wd_bin",
-            "pow_ref",
-            "pow_test",
+    # Calculate the nominal energy ratios for all wind direction bins
+    energy_ratios_nominal = _get_energy_ratio_balanced(
+        bin_freq=bin_freq,
+        bin_count=bin_count,
+        bin_sum_ref=bin_sum_ref,
+        bin_sum_test=bin_sum_test,
+    )
+    result = np.tile(energy_ratios_nominal, (3, 1)).T
+
+    # Add bootstrapping results, if necessary
+    if N > 1:
+        # Group the rows by segment, so that the rows of every wind
+        # direction bin can be collected from its consecutive segments
+        n_seg = wd_seg_membership.shape[0]
+        rows_sorted = np.argsort(wd_seg_idx, kind="stable")
+        seg_ptr = np.searchsorted(
+            wd_seg_idx[rows_sorted], np.arange(n_seg + 1)
+        )
+        starts, lengths = erb.get_wd_bin_windows(wd_seg_membership)
+
+        # Every wind direction bin gets its own random stream, such that
+        # the results do not depend on how the bins are distributed
+        seeds = _get_seed_sequence(seed).spawn(len(wd_bin_count))
+        wd_ids = np.where(wd_bin_count > 0)[0]
+        tasks = [
+            (
+                (starts[wd_idx] + np.arange(lengths[wd_idx])) % n_seg,
+                energy_ratios_nominal[wd_idx],
+                bin_freq[wd_idx, :],
+                N,
+                percentiles,
+                seeds[wd_idx],
+            )
+            for wd_idx in wd_ids
         ]
-    else:
-        min_cols = ["wd", "ws", "ws_bin", "wd_bin", "pow_ref", "pow_test"]
-    df = df_binned[min_cols]
+        arrays = {
+            "rows_sorted": rows_sorted,
+            "seg_ptr": seg_ptr,
+            "ws_bin_idx": ws_bin_idx,
+            "is_valid": is_valid,
+            "pow_ref": pow_ref,
+            "pow_test": pow_test,
+        }
+        if block_idx is not None:
+            arrays["block_idx"] = block_idx
+
+        if (n_jobs is None) or (n_jobs < 1):
+            n_jobs = os.cpu_count()
+        if (n_jobs > 1) and (len(tasks) > 1):
+            bounds = _run_tasks_parallel(
+                _run_bootstrap_task, tasks, arrays, n_jobs
+            )
+        else:
+            bounds = [_run_bootstrap_task(task, arrays) for task in tasks]
+        if len(tasks) > 0:
+            result[wd_ids, 1:] = np.array(bounds)
 
-    # Save some relevant info
-    unique_wd_bins = np.unique(df.wd_bin)
-    # unique_ws_bins = np.unique(df.ws_bin)
+    return _format_energy_ratios(df_wd_bins, wd_bin_count, result)
 
-    # Now calculate the actual energy ratios
-    result = np.zeros([len(unique_wd_bins), 3])
-    dict_out_list = [None for _ in range(len(unique_wd_bins))]
 
-    for wd_idx, wd in enumerate(unique_wd_bins):
-        df_subset = df[df["wd_bin"] == wd]
-        df_freq_subset = df_freq[df_freq["wd_bin"] == wd]
+def _get_energy_ratios_all_wd_bins_analytic(
+    df_wd_bins,
+    wd_bin_count,
+    bin_freq,
+    bin_count,
+    bin_sum_ref,
+    bin_sum_test,
+    bin_sums_dev_prod,
+    percentiles=[5.0, 95.0],
+):
+    """Calculate the energy ratio for every wind direction bin with
+    analytic confidence bounds, as a fast alternative to bootstrapping.
+    The balanced energy ratio is a ratio of two weighted sums of the mean
+    reference and test power productions in every wind speed bin, which
+    are independent between wind speed bins. Its variance follows from the
+    delta method for ratio estimators,
+
+        var(R) = sum_ws (f**2 / n * var(P_test - R * P_ref)) / B**2,
+
+    with f the bin frequency, n the number of valid data entries and B the
+    weighted sum of the mean reference power productions. The confidence
+    bounds assume a normal distribution of the energy ratio, and are
+    therefore only reliable for wind direction bins with sufficient data.
+    Wind speed bins with a single data entry do not contribute to the
+    variance.
 
-        out = _get_energy_ratio_single_wd_bin_bootstrapping(
-                df_binned=df_subset,
-                df_freq=df_freq_subset,
-                N=N,
-                percentiles=percentiles,
-                return_detailed_output=return_detailed_output,
-        )
-        if return_detailed_output:
-            result[wd_idx, :] = out[0]
-            dict_out_list[wd_idx] = out[1]
-        else:
-            result[wd_idx, :] = out
+    Args:
+        df_wd_bins, wd_bin_count, bin_freq, bin_count, bin_sum_ref,
+            bin_sum_test: See _get_energy_ratios_all_wd_bins_bootstrapping.
+        bin_sums_dev_prod ([np.array]): Array of shape (n_wd_bins,
+            n_ws_bins, 3) with the sums of squared deviations of the
+            reference and test power productions from their bin means, and
+            the sum of the products of their deviations, in that order.
+        percentiles (list, optional): Confidence bounds in percents.
+            Defaults to [5., 95.].
+
+    Returns:
+        energy_ratios ([pd.DataFrame]): Dataframe containing the found
+            energy ratios, formatted like the output of
+            _get_energy_ratios_all_wd_bins_bootstrapping().
+    """
+    energy_ratios_nominal = _get_energy_ratio_balanced(
+        bin_freq=bin_freq,
+        bin_count=bin_count,
+        bin_sum_ref=bin_sum_ref,
+        bin_sum_test=bin_sum_test,
+    )
 
-    # Save energy ratios to the dataframe
+    with np.errstate(divide="ignore", invalid="ignore"):
+        weights = np.where(bin_count > 0, bin_freq / bin_count, 0.0)
+        denominator = np.sum(weights * bin_sum_ref, axis=-1)
+
+        # Sample variance of P_test - R * P_ref in every bin
+        r = energy_ratios_nominal[:, None]
+        s_ref, s_test, s_cross = np.moveaxis(bin_sums_dev_prod, -1, 0)
+        var_diff = (s_test - 2.0 * r * s_cross + r**2 * s_ref)
+        var_diff = np.where(bin_count > 1, var_diff / (bin_count - 1), 0.0)
+
+        var = np.sum(
+            np.where(bin_count > 0, bin_freq**2 * var_diff / bin_count, 0.0),
+            axis=-1,
+        ) / denominator**2
+
+    z = stats.norm.ppf(np.array(percentiles, dtype=float) / 100.0)
+    sigma = np.sqrt(np.clip(var, 0.0, None))
+    result = np.vstack(
+        [
+            energy_ratios_nominal,
+            energy_ratios_nominal + z[0] * sigma,
+            energy_ratios_nominal + z[1] * sigma,
+        ]
+    ).T
+    return _format_energy_ratios(df_wd_bins, wd_bin_count, result)
+
+
+def _get_energy_ratios_all_wd_bins_nominal(
+    df_wd_bins,
+    wd_bin_count,
+    bin_freq,
+    bin_count,
+    bin_sum_ref,
+    bin_sum_test,
+):
+    """Calculate the nominal energy ratio for every wind direction bin from
+    the binned data, without uncertainty quantification.
+
+    Args:
+        df_wd_bins, wd_bin_count, bin_freq, bin_count, bin_sum_ref,
+            bin_sum_test: See _get_energy_ratios_all_wd_bins_bootstrapping.
+
+    Returns:
+        energy_ratios ([pd.DataFrame]): Dataframe containing the found
+            energy ratios, formatted like the output of
+            _get_energy_ratios_all_wd_bins_bootstrapping() with N=1.
+    """
+    energy_ratios_nominal = _get_energy_ratio_balanced(
+        bin_freq=bin_freq,
+        bin_count=bin_count,
+        bin_sum_ref=bin_sum_ref,
+        bin_sum_test=bin_sum_test,
+    )
+    result = np.tile(energy_ratios_nominal, (3, 1)).T
+    return _format_energy_ratios(df_wd_bins, wd_bin_count, result)
+
+
+def _format_energy_ratios(df_wd_bins, wd_bin_count, result):
+    """Format the nominal energy ratios and their lower and upper bounds
+    as a dataframe, skipping empty wind direction bins and sorting the
+    rows by the wind direction bin.
+    """
+    # Save energy ratios to the dataframe, skipping empty bins
+    ids = (wd_bin_count > 0)
     df_out = pd.DataFrame(
-        result, columns=["baseline", "baseline_lb", "baseline_ub"]
+        result[ids], columns=["baseline", "baseline_lb", "baseline_ub"]
     )
 
     # Save wind direction bins and bin count to dataframe
-    df_out["wd_bin"] = unique_wd_bins
-    _, df_out["bin_count"] = np.unique(df["wd_bin"], return_counts=True)
-    df_out["bin_count"] = df_out["bin_count"].astype(int)
-
-    if return_detailed_output:
-        # Concatenate dataframes and produce a new dict_out
-        df_per_wd_bin = pd.concat([d["df_per_wd_bin"] for d in dict_out_list])
-        df_per_ws_bin = pd.concat([d["df_per_ws_bin"] for d in dict_out_list])
-        df_per_ws_bin = df_per_ws_bin.reset_index(drop=False)
-        df_per_ws_bin = df_per_ws_bin.set_index(["wd_bin"])
-        dict_out = {
-            "df_per_wd_bin": df_per_wd_bin,
-            "df_per_ws_bin": df_per_ws_bin,
-        }
-        return df_out, dict_out
+    df_out["wd_bin"] = np.array(df_wd_bins["wd_bin"], dtype=float)[ids]
+    df_out["bin_count"] = np.array(wd_bin_count[ids], dtype=int)
+    df_out = df_out.sort_values(by="wd_bin", kind="stable")
 
-    return df_out
+    return df_out.reset_index(drop=True)
 
 
 def _get_energy_ratio_single_wd_bin_bootstrapping(
-    df_binned,
-    df_freq,
+    energy_ratio_nominal,
+    rows,
+    ws_bin_idx,
+    is_valid,
+    pow_ref,
+    pow_test,
+    bin_freq,
     N=1,
     percentiles=[5.0, 95.0],
-    return_detailed_output=False,
+    rng=None,
+    max_chunk_size=10_000_000,
+    block_idx=None,
 ):
-    """Get the energy ratio for one particular wind direction bin and
-    an array of wind speed bins. This function also includes bootstrapping
-    functionality by increasing the number of bootstrap evaluations (N) to
-    larger than 1. The bootstrap percentiles default to 5 % and 95 %.
+    """Get the bootstrapped confidence bounds of the energy ratio for one
+    particular wind direction bin and an array of wind speed bins. The
+    data entries in this wind direction bin, identified by their row
+    indices, are resampled with replacement (N - 1) times. Rather than
+    copying the data for every bootstrap draw, each draw is described by
+    the number of times every row is resampled. The power productions are
+    then summed for all draws at once using weighted bincounts over the
+    (draw, wind speed bin) indices. The draws are processed in chunks of
+    at most max_chunk_size resampled entries to limit memory usage. The
+    draws are taken from the random generator rng, or from a freshly
+    seeded generator if rng is None. The bootstrap percentiles default to
+    5 % and 95 %. If block_idx is specified, whole blocks of rows are
+    resampled instead, see
+    _get_energy_ratio_single_wd_bin_block_bootstrapping().
     """
-    # Get results excluding uncertainty
-    if return_detailed_output:
-        energy_ratio_nominal, dict_info = _get_energy_ratio_single_wd_bin_nominal(
-            df_binned=df_binned,
-            df_freq=df_freq,
-            return_detailed_output=return_detailed_output,
-        )
-    else:
-        energy_ratio_nominal = _get_energy_ratio_single_wd_bin_nominal(
-            df_binned=df_binned,
-            df_freq=df_freq,
-            return_detailed_output=return_detailed_output,
+    if rng is None:
+        rng = np.random.default_rng()
+
+    if block_idx is not None:
+        return _get_energy_ratio_single_wd_bin_block_bootstrapping(
+            energy_ratio_nominal=energy_ratio_nominal,
+            rows=rows,
+            ws_bin_idx=ws_bin_idx,
+            is_valid=is_valid,
+            pow_ref=pow_ref,
+            pow_test=pow_test,
+            bin_freq=bin_freq,
+            block_idx=block_idx,
+            N=N,
+            percentiles=percentiles,
+            rng=rng,
+            max_chunk_size=max_chunk_size,
         )
 
-    # Add bootstrapping results, if necessary
-    if N <= 1:
-        results_array = np.array([energy_ratio_nominal] * 3, dtype=float)
-    else:
-        # Get a bootstrap sample of range
-        bootstrap_results = np.zeros(N)
-        bootstrap_results[0] = energy_ratio_nominal
-        for i in range(1, N):
-            df_randomized = df_binned.sample(frac=1, replace=True).copy()
-            bootstrap_results[i] = _get_energy_ratio_single_wd_bin_nominal(
-                df_binned=df_randomized,
-                df_freq=df_freq,
-                return_detailed_output=False,
-            )
+    n_ws = len(bin_freq)
+    n_rows = len(rows)
+
+    # Only rows without NaNs and inside a wind speed bin contribute
+    ids = is_valid[rows] & (ws_bin_idx[rows] >= 0)
+    rows_valid = rows[ids]
+    ws_idx = ws_bin_idx[rows_valid]
+    pow_ref = pow_ref[rows_valid]
+    pow_test = pow_test[rows_valid]
+
+    bootstrap_results = np.zeros(N)
+    bootstrap_results[0] = energy_ratio_nominal
+    chunk_size = int(np.max([1, max_chunk_size // np.max([n_rows, 1])]))
+    for i0 in range(1, N, chunk_size):
+        n_draws = np.min([chunk_size, N - i0])
+
+        # Resample counts of every row, for all draws in this chunk
+        rows_randomized = rng.integers(0, n_rows, (n_draws, n_rows))
+        rows_randomized += n_rows * np.arange(n_draws)[:, None]
+        weights = np.bincount(
+            rows_randomized.ravel(), minlength=n_draws * n_rows
+        ).reshape(n_draws, n_rows)[:, ids]
+
+        # Sum over rows for every (draw, wind speed bin)
+        bin_idx = (n_ws * np.arange(n_draws)[:, None] + ws_idx).ravel()
+        bin_sums = [
+            np.bincount(
+                bin_idx,
+                weights=(weights * x).ravel(),
+                minlength=n_draws * n_ws,
+            ).reshape(n_draws, n_ws)
+            for x in [1.0, pow_ref, pow_test]
+        ]
 
-        # Return the results in the order used in previous versions
-        results_array = np.array(
-            [
-                energy_ratio_nominal,
-                np.nanpercentile(bootstrap_results, percentiles)[0],
-                np.nanpercentile(bootstrap_results, percentiles)[1],
-            ]
+        bootstrap_results[i0:i0 + n_draws] = _get_energy_ratio_balanced(
+            bin_freq=bin_freq,
+            bin_count=bin_sums[0],
+            bin_sum_ref=bin_sums[1],
+            bin_sum_test=bin_sums[2],
         )
 
-    if return_detailed_output:
-        return results_array, dict_info
-    else:
-        return results_array
+    return np.nanpercentile(bootstrap_results, percentiles)
 
 
-def _get_energy_ratio_single_wd_bin_nominal(
-    df_binned, df_freq=None, return_detailed_output=False
+def _get_energy_ratio_single_wd_bin_block_bootstrapping(
+    energy_ratio_nominal,
+    rows,
+    ws_bin_idx,
+    is_valid,
+    pow_ref,
+    pow_test,
+    bin_freq,
+    block_idx,
+    N=1,
+    percentiles=[5.0, 95.0],
+    rng=None,
+    max_chunk_size=10_000_000,
 ):
-    """Get the energy ratio for one particular wind direction bin and
-    an array of wind speed bins. This function performs a single
-    calculation of the energy ratios without uncertainty quantification.
+    """Get the block-bootstrapped confidence bounds of the energy ratio for
+    one particular wind direction bin and an array of wind speed bins.
+    Rather than individual rows, the contiguous time blocks that the rows
+    of this wind direction bin belong to are resampled with replacement
+    (N - 1) times. This retains the correlation between measurements close
+    in time, which i.i.d. resampling ignores. The power productions are
+    first summed per block and wind speed bin, after which every draw is
+    described by the number of times every block is resampled. The sums of
+    all draws in a chunk then follow from a single matrix product between
+    these block weights and the block sums.
     """
-    # Copy minimal dataframe
-    if "ti" in df_binned.columns:
-        min_cols = [
-            "wd_bin",
-            "ws_bin",
-            "wd",
-            "ws",
-            "ti",
-            "pow_ref",
-            "pow_test",
+    if rng is None:
+        rng = np.random.default_rng()
+
+    n_ws = len(bin_freq)
+
+    # Blocks of this wind direction bin, and the block of every row
+    blocks, row_block_idx = np.unique(block_idx[rows], return_inverse=True)
+    n_blocks = len(blocks)
+
+    # Sums over the valid rows for every (block, wind speed bin)
+    ids = is_valid[rows] & (ws_bin_idx[rows] >= 0)
+    rows_valid = rows[ids]
+    bin_idx = row_block_idx[ids] * n_ws + ws_bin_idx[rows_valid]
+    block_sums = np.hstack([
+        np.bincount(
+            bin_idx, weights=x, minlength=n_blocks * n_ws
+        ).reshape(n_blocks, n_ws)
+        for x in [
+            np.ones(len(rows_valid)),
+            pow_ref[rows_valid],
+            pow_test[rows_valid],
         ]
-        mean_cols = ["wd", "ws", "ti", "pow_ref", "pow_test"]
-        std_cols = ["wd", "ws", "ti", "pow_ref", "pow_test"]
-
-    else:
-        min_cols = ["wd", "ws", "wd_bin", "ws_bin", "pow_ref", "pow_test"]
-        mean_cols = ["wd", "ws", "pow_ref", "pow_test"]
-        std_cols = ["wd", "ws", "pow_ref", "pow_test"]
-    df = df_binned[min_cols].copy()
-
-    # Drop any faulty measurements
-    df = df.dropna(how="any")
-
-    # Check if only one wd_bin present in data
-    wd_bin = df_binned["wd_bin"].unique()
-    if len(wd_bin) > 1:
-        raise DataError("More than one wd_bin present in data.")
-
-    # Reference and test turbine energy
-    df["freq"] = 1
-    df_sums = df.groupby("ws_bin")[["pow_ref", "pow_test", "freq"]].sum()
-    df_sums.columns = [
-        "energy_ref_unbalanced",
-        "energy_test_unbalanced",
-        "bin_count",
-    ]
-
-    if return_detailed_output:
-        # Calculate bin information
-        df_stds = df.groupby("ws_bin")[std_cols].std()
-        df_stds.columns = ["{}_std".format(c) for c in df_stds.columns]
-
-        # Mean values of bins and power values
-        df_means = df.groupby("ws_bin")[mean_cols].mean()
-        df_means.columns = ["{}_mean".format(c) for c in df_means.columns]
-
-        # Collect into a single dataframe
-        df_per_ws_bin = pd.concat([df_means, df_stds, df_sums], axis=1)
-        df_per_ws_bin["wd_bin"] = wd_bin[0]
-        df_per_ws_bin["wd_bin_edges"] = df_freq["wd_bin_edges"]
-        df_per_ws_bin["ws_bin_edges"] = df_freq["ws_bin_edges"]
-
-        # Calculate unbalanced energy ratio for each wind speed bin
-        df_per_ws_bin["energy_ratio_unbalanced"] = (
-            df_per_ws_bin["energy_test_unbalanced"]
-            / df_per_ws_bin["energy_ref_unbalanced"]
-        )
-
-        # Calculate (total) unbalanced energy ratio for all wind speeds
-        energy_ratio_total_unbalanced = (
-            df_per_ws_bin["energy_test_unbalanced"].sum()
-            / df_per_ws_bin["energy_ref_unbalanced"].sum()
-        )
-
-        # Calculate total statistics
-        total_means = df[mean_cols].mean()
-        total_means = total_means.rename(
-            dict(zip(mean_cols, ["{:s}_mean".format(c) for c in mean_cols]))
-        )
-        total_stds = df[std_cols].std()
-        total_stds = total_stds.rename(
-            dict(zip(std_cols, ["{:s}_std".format(c) for c in std_cols]))
-        )
-
-        # Get summation of energy and bin frequencies
-        total_sums = df[["pow_ref", "pow_test", "freq"]].sum()
-        total_sums = total_sums.rename(
-            {
-                "pow_ref": "energy_ref_unbalanced",
-                "pow_test": "energy_test_unbalanced",
-                "freq": "bin_count",
-            }
+    ])
+
+    bootstrap_results = np.zeros(N)
+    bootstrap_results[0] = energy_ratio_nominal
+    chunk_size = int(np.max([1, max_chunk_size // np.max([n_blocks, 1])]))
+    for i0 in range(1, N, chunk_size):
+        n_draws = np.min([chunk_size, N - i0])
+
+        # Resample counts of every block, for all draws in this chunk
+        blocks_randomized = rng.integers(0, n_blocks, (n_draws, n_blocks))
+        blocks_randomized += n_blocks * np.arange(n_draws)[:, None]
+        weights = np.bincount(
+            blocks_randomized.ravel(), minlength=n_draws * n_blocks
+        ).reshape(n_draws, n_blocks)
+
+        bin_sums = weights @ block_sums
+        bootstrap_results[i0:i0 + n_draws] = _get_energy_ratio_balanced(
+            bin_freq=bin_freq,
+            bin_count=bin_sums[:, :n_ws],
+            bin_sum_ref=bin_sums[:, n_ws:2 * n_ws],
+            bin_sum_test=bin_sums[:, 2 * n_ws:],
         )
 
-        df_per_wd_bin = pd.concat([total_means, total_stds, total_sums])
-        df_per_wd_bin["wd_bin"] = wd_bin[0]
-        df_per_wd_bin[
-            "energy_ratio_unbalanced"
-        ] = energy_ratio_total_unbalanced
+    return np.nanpercentile(bootstrap_results, percentiles)
 
-    else:
-        df_per_wd_bin = pd.DataFrame({"wd_bin": [wd_bin[0]]})
-        df_per_ws_bin = pd.DataFrame(
-            {
-                "pow_ref_mean": (
-                    df_sums["energy_ref_unbalanced"] / df_sums["bin_count"]
-                ),
-                "pow_test_mean": (
-                    df_sums["energy_test_unbalanced"] / df_sums["bin_count"]
-                ),
-                "bin_count": df_sums["bin_count"],
-            }
-        )
 
-    # Write bin frequencies to the dataframe and ensure normalization
-    df_per_ws_bin["freq_balanced"] = df_freq["freq"] / df_freq["freq"].sum()
-    df_per_ws_bin["freq_balanced"] = df_per_ws_bin["freq_balanced"].fillna(0)
+def _get_seed_sequence(seed=None):
+    """Convert a user-specified seed into a np.random.SeedSequence. If no
+    seed is specified, the seed is drawn from NumPy's global random state.
+    """
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    if seed is None:
+        seed = np.random.randint(np.iinfo(np.int32).max)
+    return np.random.SeedSequence(seed)
+
 
-    # Calculate normalized balanced energy for ref and test turbine
-    df_per_ws_bin["energy_ref_balanced_norm"] = (
-        df_per_ws_bin["pow_ref_mean"] * df_per_ws_bin["freq_balanced"]
-    )
-    df_per_ws_bin["energy_test_balanced_norm"] = (
-        df_per_ws_bin["pow_test_mean"] * df_per_ws_bin["freq_balanced"]
+def _run_bootstrap_task(task, arrays):
+    """Collect the rows of a single wind direction bin from its segments
+    and calculate the bootstrapped confidence bounds of its energy ratio.
+    """
+    segs, energy_ratio_nominal, bin_freq, N, percentiles, seed_seq = task
+    rows_sorted = arrays["rows_sorted"]
+    seg_ptr = arrays["seg_ptr"]
+    rows = np.sort(np.concatenate(
+        [rows_sorted[seg_ptr[ii]:seg_ptr[ii + 1]] for ii in segs]
+    ))
+    return _get_energy_ratio_single_wd_bin_bootstrapping(
+        energy_ratio_nominal=energy_ratio_nominal,
+        rows=rows,
+        ws_bin_idx=arrays["ws_bin_idx"],
+        is_valid=arrays["is_valid"],
+        pow_ref=arrays["pow_ref"],
+        pow_test=arrays["pow_test"],
+        bin_freq=bin_freq,
+        N=N,
+        percentiles=percentiles,
+        rng=np.random.default_rng(seed_seq),
+        block_idx=arrays.get("block_idx", None),
     )
 
-    # Compute total balanced energy ratio over all wind speeds
-    df_per_wd_bin["energy_test_balanced_norm"] = (
-        df_per_ws_bin["energy_test_balanced_norm"].sum()
-    )
-    df_per_wd_bin["energy_ref_balanced_norm"] = (
-        df_per_ws_bin["energy_ref_balanced_norm"].sum()
-    )
 
-    energy_ratio_total_balanced = float(
-        df_per_wd_bin["energy_test_balanced_norm"] /
-        df_per_wd_bin["energy_ref_balanced_norm"]
-    )
+# Arrays shared with the worker processes, attached by _attach_shared_arrays
+_shared_arrays = {}
 
-    if return_detailed_output:
-        df_per_ws_bin["energy_ratio_balanced"] = (
-            df_per_ws_bin["energy_test_balanced_norm"]
-            / df_per_ws_bin["energy_ref_balanced_norm"]
+
+def _attach_shared_arrays(specs):
+    """Initializer of the worker processes, attaching to the shared
+    memory blocks holding the binned data.
+    """
+    for key, (name, shape, dtype) in specs.items():
+        shm = shared_memory.SharedMemory(name=name)
+        _shared_arrays[key] = (shm, np.ndarray(shape, dtype, buffer=shm.buf))
+
+
+def _run_task_shared(func, task):
+    arrays = {key: x for key, (_, x) in _shared_arrays.items()}
+    return func(task, arrays)
+
+
+def _run_tasks_parallel(func, tasks, arrays, n_jobs):
+    """Distribute the evaluation of func(task, arrays) for every task over
+    a pool of worker processes. The arrays are copied once into shared
+    memory, so that only the small task descriptions are sent to the
+    workers. func must be a module-level function so it can be pickled.
+    """
+    shms = []
+    try:
+        specs = {}
+        for key, x in arrays.items():
+            x = np.ascontiguousarray(x)
+            shm = shared_memory.SharedMemory(
+                create=True, size=np.max([x.nbytes, 1])
+            )
+            shms.append(shm)
+            np.ndarray(x.shape, x.dtype, buffer=shm.buf)[:] = x
+            specs[key] = (shm.name, x.shape, x.dtype.str)
+
+        with ProcessPoolExecutor(
+            max_workers=n_jobs,
+            initializer=_attach_shared_arrays,
+            initargs=(specs,),
+        ) as executor:
+            return list(executor.map(partial(_run_task_shared, func), tasks))
+    finally:
+        for shm in shms:
+            shm.close()
+            shm.unlink()
+
+
+def _get_energy_ratio_balanced(bin_freq, bin_count, bin_sum_ref, bin_sum_test):
+    """Calculate the balanced energy ratio from the summed reference and
+    test power productions in each wind speed bin. The mean power
+    production of every wind speed bin is weighed by the frequency of
+    occurrence of that bin. Wind speed bins without any valid data are
+    ignored. The last axis of every input array corresponds to the wind
+    speed bins, and the energy ratio is calculated over all other axes
+    simultaneously.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        weights = np.where(bin_count > 0, bin_freq / bin_count, 0.0)
+        energy_ratio = (
+            np.sum(weights * bin_sum_test, axis=-1) /
+            np.sum(weights * bin_sum_ref, axis=-1)
         )
-        df_per_wd_bin["energy_ratio_balanced"] = energy_ratio_total_balanced
+    return energy_ratio
 
-        # Formatting
-        df_per_wd_bin = pd.DataFrame(df_per_wd_bin).T
-        df_per_wd_bin["bin_count"] = df_per_wd_bin["bin_count"].astype(int)
 
-        df_per_wd_bin["wd_bin_edges"] = df_freq.iloc[0]["wd_bin_edges"]
-        df_per_wd_bin = df_per_wd_bin.set_index("wd_bin")
+def _get_sums_dev_prod_between(
+    seg_count, seg_means, bin_sums, membership, idx_a, idx_b
+):
+    """Calculate the part of the sums of products of deviations in every
+    wind direction bin that is due to the differences between the means of
+    its segments and the mean of the bin, being
+    sum(n_s * (mean_a_s - mean_a) * (mean_b_s - mean_b)) over its segments.
+    Together with the sums of products of deviations within every segment,
+    this yields those of the bins without loss of precision.
 
-        df_per_ws_bin["bin_count"] = df_per_ws_bin["bin_count"].astype(int)
-        dict_out = {
-            "df_per_wd_bin": df_per_wd_bin,
-            "df_per_ws_bin": df_per_ws_bin,
-        }
-        return energy_ratio_total_balanced, dict_out
+    Args:
+        seg_count ([np.array]): Array of shape (n_segments, n_ws_bins) with
+            the number of valid data entries in every segment and bin.
+        seg_means ([np.array]): Array of shape (n_segments, n_ws_bins,
+            n_vars) with the mean of every variable.
+        bin_sums ([np.array]): Array of shape (n_wd_bins, n_ws_bins,
+            n_vars) with the sum of every variable in every bin.
+        membership ([np.array]): Boolean array of shape (n_segments,
+            n_bins) which is True where a segment is part of a bin.
+        idx_a ([iterable]): Index of the first variable of every pair.
+        idx_b ([iterable]): Index of the second variable of every pair.
+
+    Returns:
+        sums_dev_prod ([np.array]): Array of shape (n_wd_bins, n_ws_bins,
+            n_pairs).
+    """
+    bin_count = erb.get_wd_bin_sums(seg_count, membership)[:, :, None]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        bin_means = np.nan_to_num(bin_sums / bin_count)
+
+    seg_ids, bin_ids = np.nonzero(membership)
+    dev = seg_means[seg_ids] - bin_means[bin_ids]
+    sums_dev_prod = np.zeros(bin_sums.shape[:2] + (len(idx_a),))
+    np.add.at(
+        sums_dev_prod,
+        bin_ids,
+        seg_count[seg_ids, :, None] * dev[:, :, idx_a] * dev[:, :, idx_b],
+    )
+    return sums_dev_prod
+
+
+def _get_detailed_output_from_sums(
+    df_wd_bins,
+    df_ws_bins,
+    wd_bin_count,
+    bin_freq,
+    bin_count,
+    bin_sums,
+    bin_sums_sq_dev,
+    mean_cols,
+):
+    """Calculate the detailed energy ratio information for every wind
+    direction bin and for every wind direction and wind speed bin, from
+    the number of valid data entries in every bin, the sums of the variables
+    in every bin and their sums of squared deviations from the bin means.
+    The output is formatted like the detailed output of
+    energy_ratio.get_energy_ratio().
+
+    Args:
+        df_wd_bins ([pd.DataFrame]): Table with one row for every wind
+            direction bin, with the columns 'wd_bin' and 'wd_bin_edges'.
+        df_ws_bins ([pd.DataFrame]): Table with one row for every wind
+            speed bin, with the columns 'ws_bin' and 'ws_bin_edges'.
+        wd_bin_count ([np.array]): Number of data entries in every wind
+            direction bin. Only bins with data entries are reported.
+        bin_freq ([np.array]): Array of shape (n_wd_bins, n_ws_bins) with
+            the frequency of every wind direction and wind speed bin.
+        bin_count ([np.array]): Array of shape (n_wd_bins, n_ws_bins) with
+            the number of valid data entries in every bin.
+        bin_sums ([np.array]): Array of shape (n_wd_bins, n_ws_bins,
+            n_vars) with the sum of every variable in mean_cols.
+        bin_sums_sq_dev ([np.array]): Array of the same shape with the sum
+            of squared deviations from the bin mean of every variable.
+        mean_cols ([list]): Names of the variables, which must include
+            'pow_ref' and 'pow_test'.
 
-    return energy_ratio_total_balanced
+    Returns:
+        dict_out ([dict]): Dictionary with the fields 'df_per_wd_bin'
+            and 'df_per_ws_bin'.
+    """
+    wd_labels = np.array(df_wd_bins["wd_bin"], dtype=float)
+    ws_labels = np.array(df_ws_bins["ws_bin"], dtype=float)
+    wd_edges = np.array(df_wd_bins["wd_bin_edges"])
+    ws_edges = np.array(df_ws_bins["ws_bin_edges"])
+    i_ref = mean_cols.index("pow_ref")
+    i_test = mean_cols.index("pow_test")
+
+    def get_statistics(n, s, s_sq_dev):
+        # Mean and sample standard deviation from the sums of each variable
+        n = np.array(n, dtype=float)[..., None]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = s / n
+            var = s_sq_dev / (n - 1.0)
+        std = np.where(n > 1.0, np.sqrt(np.clip(var, 0.0, None)), np.nan)
+        return mean, std
+
+    # Statistics for every wind direction and wind speed bin with data
+    wd_idx, ws_idx = np.nonzero(bin_count > 0)
+    order = np.lexsort((ws_labels[ws_idx], wd_labels[wd_idx]))
+    wd_idx, ws_idx = wd_idx[order], ws_idx[order]
+    n = bin_count[wd_idx, ws_idx]
+    s = bin_sums[wd_idx, ws_idx]
+    mean, std = get_statistics(n, s, bin_sums_sq_dev[wd_idx, ws_idx])
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        freq_total = np.sum(bin_freq, axis=1)
+        freq_balanced = bin_freq[wd_idx, ws_idx] / freq_total[wd_idx]
+    freq_balanced = np.nan_to_num(freq_balanced, nan=0.0)
+    energy_ref_balanced_norm = mean[:, i_ref] * freq_balanced
+    energy_test_balanced_norm = mean[:, i_test] * freq_balanced
+
+    df_per_ws_bin = pd.DataFrame({"wd_bin": wd_labels[wd_idx]})
+    df_per_ws_bin["ws_bin"] = ws_labels[ws_idx]
+    for ii, c in enumerate(mean_cols):
+        df_per_ws_bin["{:s}_mean".format(c)] = mean[:, ii]
+    for ii, c in enumerate(mean_cols):
+        df_per_ws_bin["{:s}_std".format(c)] = std[:, ii]
+    df_per_ws_bin["energy_ref_unbalanced"] = s[:, i_ref]
+    df_per_ws_bin["energy_test_unbalanced"] = s[:, i_test]
+    df_per_ws_bin["bin_count"] = np.array(n, dtype=int)
+    df_per_ws_bin["wd_bin_edges"] = wd_edges[wd_idx]
+    df_per_ws_bin["ws_bin_edges"] = ws_edges[ws_idx]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        df_per_ws_bin["energy_ratio_unbalanced"] = s[:, i_test] / s[:, i_ref]
+        df_per_ws_bin["freq_balanced"] = freq_balanced
+        df_per_ws_bin["energy_ref_balanced_norm"] = energy_ref_balanced_norm
+        df_per_ws_bin["energy_test_balanced_norm"] = energy_test_balanced_norm
+        df_per_ws_bin["energy_ratio_balanced"] = (
+            energy_test_balanced_norm / energy_ref_balanced_norm
+        )
+    df_per_ws_bin = df_per_ws_bin.set_index("wd_bin")
+
+    # Statistics for every wind direction bin with data, over all ws bins
+    wd_ids = np.where(wd_bin_count > 0)[0]
+    wd_ids = wd_ids[np.argsort(wd_labels[wd_ids], kind="stable")]
+    n = np.sum(bin_count[wd_ids], axis=1)
+    s = np.sum(bin_sums[wd_ids], axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dev = np.nan_to_num(
+            bin_sums[wd_ids] / bin_count[wd_ids, :, None] -
+            s[:, None, :] / n[:, None, None]
+        )
+    s_sq_dev = np.sum(
+        bin_sums_sq_dev[wd_ids] + bin_count[wd_ids, :, None] * dev**2, axis=1
+    )
+    mean, std = get_statistics(n, s, s_sq_dev)
+    n_wd = len(wd_labels)
+    energy_ref_balanced_norm = np.bincount(
+        wd_idx, weights=energy_ref_balanced_norm, minlength=n_wd
+    )[wd_ids]
+    energy_test_balanced_norm = np.bincount(
+        wd_idx, weights=energy_test_balanced_norm, minlength=n_wd
+    )[wd_ids]
+
+    df_per_wd_bin = pd.DataFrame({"wd_bin": wd_labels[wd_ids]})
+    for ii, c in enumerate(mean_cols):
+        df_per_wd_bin["{:s}_mean".format(c)] = mean[:, ii]
+    for ii, c in enumerate(mean_cols):
+        df_per_wd_bin["{:s}_std".format(c)] = std[:, ii]
+    df_per_wd_bin["energy_ref_unbalanced"] = s[:, i_ref]
+    df_per_wd_bin["energy_test_unbalanced"] = s[:, i_test]
+    df_per_wd_bin["bin_count"] = np.array(n, dtype=int)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        df_per_wd_bin["energy_ratio_unbalanced"] = s[:, i_test] / s[:, i_ref]
+        df_per_wd_bin["energy_test_balanced_norm"] = energy_test_balanced_norm
+        df_per_wd_bin["energy_ref_balanced_norm"] = energy_ref_balanced_norm
+        df_per_wd_bin["energy_ratio_balanced"] = (
+            energy_test_balanced_norm / energy_ref_balanced_norm
+        )
+    df_per_wd_bin["wd_bin_edges"] = wd_edges[wd_ids]
+    df_per_wd_bin = df_per_wd_bin.set_index("wd_bin")
+
+    dict_out = {
+        "df_per_wd_bin": df_per_wd_bin,
+        "df_per_ws_bin": df_per_ws_bin,
+    }
+    return dict_out
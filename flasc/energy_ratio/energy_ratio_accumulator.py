@@ -0,0 +1,203 @@
+# Copyright 2021 NREL
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+
+import numpy as np
+
+from ..energy_ratio.energy_ratio_cube import energy_ratio_cube
+
+
+class energy_ratio_accumulator:
+    """This class calculates energy ratios for a stream of measurements,
+    e.g., a live SCADA feed. New data is folded into the per-bin sufficient
+    statistics using update(), and data that has expired from a rolling
+    window is removed again using subtract(). The energy ratios are then
+    obtained from the accumulated statistics using result(), at a cost that
+    does not depend on the amount of data seen so far.
+
+    Since the raw data is not retained, the energy ratios are calculated
+    without bootstrapping.
+    """
+
+    def __init__(
+        self,
+        test_turbines_list=None,
+        wd_step=2.0,
+        ws_step=1.0,
+        wd_bin_width=None,
+        wd_bins=None,
+        ws_bins=None,
+        ti_bins=None,
+        store_moments=False,
+        verbose=False,
+    ):
+        """Initialization of the class. The statistics are empty until the
+        first call to update().
+
+        Args:
+            test_turbines_list ([iteratible], optional): List with the sets
+                of test turbines for which the statistics are accumulated,
+                e.g., [[0], [1], [2, 3]]. If None is specified, every
+                turbine in the first data chunk is accumulated as a separate
+                set. Defaults to None.
+            wd_step, ws_step, wd_bin_width, wd_bins, ws_bins: Binning
+                properties, see energy_ratio.get_energy_ratio().
+            ti_bins, store_moments: See energy_ratio_cube.
+            verbose (bool, optional): Print to console. Defaults to False.
+        """
+        self.cube_kwargs = {
+            "test_turbines_list": test_turbines_list,
+            "wd_step": wd_step,
+            "ws_step": ws_step,
+            "wd_bin_width": wd_bin_width,
+            "wd_bins": wd_bins,
+            "ws_bins": ws_bins,
+            "ti_bins": ti_bins,
+            "store_moments": store_moments,
+        }
+        self.cube = None
+        self.num_entries = 0
+        self.verbose = verbose
+
+    # Private methods
+
+    def _get_chunk_cube(self, df_chunk):
+        """Bin a chunk of data into a cube with the same binning and sets
+        of test turbines as the accumulated statistics."""
+        kwargs = dict(self.cube_kwargs)
+        if self.cube is not None:
+            kwargs["test_turbines_list"] = self.cube.test_turbines_list
+            kwargs["wd_bins"] = self.cube.wd_bins
+            kwargs["ws_bins"] = self.cube.ws_bins
+        return energy_ratio_cube(df_chunk, **kwargs)
+
+    def _check_cube(self):
+        if self.cube is None:
+            raise ValueError(
+                "No data accumulated yet. Please call update() first."
+            )
+
+    # Public methods
+
+    def update(self, df_chunk):
+        """Fold a chunk of new data into the accumulated statistics.
+
+        Args:
+            df_chunk ([pd.DataFrame]): Dataframe with new data, formatted
+                like the dataframe provided to energy_ratio.energy_ratio().
+        """
+        chunk_cube = self._get_chunk_cube(df_chunk)
+        if self.cube is None:
+            self.cube = chunk_cube
+        else:
+            self.cube._add_cube(chunk_cube, sign=1)
+        self.num_entries += df_chunk.shape[0]
+
+        if self.verbose:
+            print(
+                "Added %d entries. Accumulated %d entries in total."
+                % (df_chunk.shape[0], self.num_entries)
+            )
+
+    def subtract(self, df_chunk):
+        """Remove a chunk of data from the accumulated statistics, e.g.,
+        data that has expired from a rolling window. The chunk must have
+        been added through update() before, with identical values.
+
+        Args:
+            df_chunk ([pd.DataFrame]): Dataframe with the data to remove.
+
+        Raises:
+            ValueError: This error is raised if the statistics become
+                negative, which means that df_chunk contained data that was
+                never added.
+        """
+        self._check_cube()
+        chunk_cube = self._get_chunk_cube(df_chunk)
+        self.cube._add_cube(chunk_cube, sign=-1)
+        if np.any(self.cube.seg_count < 0) or np.any(self.cube.count < 0):
+            self.cube._add_cube(chunk_cube, sign=1)  # Undo subtraction
+            raise ValueError(
+                "Cannot subtract data that was never added to the "
+                "accumulated statistics."
+            )
+        self.num_entries -= df_chunk.shape[0]
+
+        if self.verbose:
+            print(
+                "Removed %d entries. Accumulated %d entries in total."
+                % (df_chunk.shape[0], self.num_entries)
+            )
+
+    def get_bin_freq(self, ti_range=None):
+        """Return the observed frequency of occurrence of every wind
+        direction and wind speed bin in the accumulated data. See
+        energy_ratio_cube.get_bin_freq().
+        """
+        self._check_cube()
+        return self.cube.get_bin_freq(ti_range=ti_range)
+
+    def result(
+        self,
+        test_turbines=None,
+        ti_range=None,
+        bin_freq=None,
+        return_detailed_output=False,
+    ):
+        """Calculate the balanced energy ratios from the accumulated
+        statistics.
+
+        Args:
+            test_turbines ([iteratible], optional): Set of test turbines,
+                which must be in test_turbines_list. If None is specified,
+                the energy ratios of all sets are returned in long format,
+                like energy_ratio.get_energy_ratio_batch(). Defaults to
+                None.
+            ti_range ([iteratible], optional): Only include the turbulence
+                intensity bins that lie within [ti_range[0], ti_range[1]].
+                Defaults to None.
+            bin_freq ([np.array], optional): Array of shape (n_wd_bins,
+                n_ws_bins) with the frequency of every bin used to balance
+                the energy ratios. If None, the observed bin frequencies are
+                used. Defaults to None.
+            return_detailed_output (bool, optional): Also return the
+                detailed energy ratio information. Requires a single set of
+                test turbines and store_moments=True. Defaults to False.
+
+        Returns:
+            energy_ratios ([pd.DataFrame]): Dataframe containing the found
+                energy ratios, formatted like the output of
+                energy_ratio.get_energy_ratio() without uncertainty
+                quantification.
+            dict_out ([dict]): Dictionary with the detailed energy ratio
+                information. Only returned if return_detailed_output=True.
+        """
+        self._check_cube()
+        if test_turbines is None:
+            if return_detailed_output:
+                raise ValueError(
+                    "Detailed output requires a single set of test turbines."
+                )
+            return self.cube.get_energy_ratio_batch(
+                ti_range=ti_range, bin_freq=bin_freq
+            )
+
+        energy_ratios = self.cube.get_energy_ratio(
+            test_turbines, ti_range=ti_range, bin_freq=bin_freq
+        )
+        if return_detailed_output:
+            dict_out = self.cube.get_detailed_output(
+                test_turbines, ti_range=ti_range, bin_freq=bin_freq
+            )
+            return energy_ratios, dict_out
+
+        return energy_ratios
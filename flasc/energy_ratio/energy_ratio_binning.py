@@ -0,0 +1,375 @@
+# Copyright 2021 NREL
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from floris.utilities import wrap_360
+
+
+def get_ws_bins(ws_step=None, ws_bins=None):
+    """Get the wind speed bins. If ws_bins is not specified, the wind
+    speed bins are derived using ws_step as bin width, from ws_step / 2.0,
+    which is bounded by [0.0, ws_step), up to 30 m/s. If the user already
+    provided the wind speed bins, these are returned as a numpy array.
+
+    Args:
+        ws_step (float, optional): Wind speed bin width. Ignored if ws_bins
+            is specified. Defaults to None.
+        ws_bins (iterable, optional): Array of shape (n_bins, 2) containing
+            the lower and upper bound of every wind speed bin. Defaults to
+            None.
+
+    Returns:
+        ws_bins ([np.array]): Array of shape (n_bins, 2) with the lower and
+            upper bound of every wind speed bin.
+    """
+    if ws_bins is not None:
+        return np.array(ws_bins, dtype=float)
+
+    a = np.array([-0.5, 0.5], dtype=float)
+    ws_step = float(ws_step)
+    ws_labels = np.arange(ws_step / 2.0, 30.0001, ws_step)
+    return np.array([ws + a * ws_step for ws in ws_labels])
+
+
+def get_wd_bins(wd_step=None, wd_bin_width=None, wd_bins=None):
+    """Get the wind direction bins. If wd_bins is not specified, the wind
+    direction bins are derived using wd_step as step size from 0.0 deg to
+    360 deg, each with a width of wd_bin_width. If the user already
+    provided the wind direction bins, these are returned as a numpy array.
+
+    Args:
+        wd_step (float, optional): Wind direction step size. Ignored if
+            wd_bins is specified. Defaults to None.
+        wd_bin_width (float, optional): Width of each wind direction bin.
+            If None is specified, defaults to the same value as wd_step.
+            Ignored if wd_bins is specified. Defaults to None.
+        wd_bins (iterable, optional): Array of shape (n_bins, 2) containing
+            the lower and upper bound of every wind direction bin. Defaults
+            to None.
+
+    Returns:
+        wd_bins ([np.array]): Array of shape (n_bins, 2) with the lower and
+            upper bound of every wind direction bin.
+    """
+    if wd_bins is not None:
+        return np.array(wd_bins, dtype=float)
+
+    a = np.array([-0.5, 0.5], dtype=float)
+    wd_step = float(wd_step)
+    if wd_bin_width is None:
+        wd_bin_width = wd_step
+    wd_bin_width = float(wd_bin_width)
+
+    wd_min = np.min([wd_step / 2.0, wd_bin_width / 2.0])
+    wd_labels = np.arange(wd_min, 360.0001, wd_step)
+    return np.array([wd + a * wd_bin_width for wd in wd_labels])
+
+
+def get_ws_bin_indices(ws, ws_bins):
+    """Assign every wind speed measurement to a wind speed bin in a single
+    vectorized pass. Each bin includes its lower bound and excludes its
+    upper bound. Wind speed bins may not overlap.
+
+    Args:
+        ws ([iterable]): Array with wind speed measurements.
+        ws_bins ([iterable]): Array of shape (n_bins, 2) containing the
+            lower and upper bound of every wind speed bin.
+
+    Returns:
+        ws_bin_idx ([np.array]): Integer array with the index of the wind
+            speed bin that every measurement falls in. Measurements that
+            do not fall into any bin, or are NaN, are assigned -1.
+    """
+    ws = np.asarray(ws, dtype=float)
+    ws_bins = np.asarray(ws_bins, dtype=float)
+
+    # Sort bins by their lower bound and find the last bin that starts
+    # at or before each measurement. Then verify it also ends after it.
+    order = np.argsort(ws_bins[:, 0], kind="stable")
+    lb = ws_bins[order, 0]
+    ub = ws_bins[order, 1]
+    idx = np.searchsorted(lb, ws, side="right") - 1
+    idx_c = np.clip(idx, 0, len(lb) - 1)
+    is_in_bin = (idx >= 0) & (ws < ub[idx_c])
+
+    return np.where(is_in_bin, order[idx_c], -1).astype(int)
+
+
+def get_time_block_indices(time, block_length):
+    """Assign every measurement to a contiguous block of time, for block
+    bootstrapping. The blocks have a fixed length and start at the first
+    timestamp. Measurements without a timestamp are each assigned their own
+    block, after all time blocks.
+
+    Args:
+        time ([iterable]): Array with the timestamps of the measurements.
+        block_length (str or pd.Timedelta): Length of every block, e.g.,
+            '1h' or pd.Timedelta(minutes=30).
+
+    Returns:
+        block_idx ([np.array]): Integer array with the block index of every
+            measurement.
+    """
+    time = pd.to_datetime(pd.Series(time)).reset_index(drop=True)
+    block_length = pd.Timedelta(block_length)
+    block_idx = np.floor(
+        np.array((time - time.min()) / block_length, dtype=float)
+    )
+
+    is_nat = np.isnan(block_idx)
+    n_blocks = int(np.nanmax(block_idx)) + 1 if np.any(~is_nat) else 0
+    block_idx[is_nat] = n_blocks + np.arange(np.sum(is_nat))
+    return block_idx.astype(int)
+
+
+def get_wd_bin_segments(wd_bins):
+    """Split the wind rose into the smallest set of contiguous segments
+    such that every (possibly overlapping) wind direction bin is exactly a
+    union of segments. The segment edges are all unique bin edges, wrapped
+    to [0, 360) deg. The last segment wraps around 360 deg to the first
+    edge.
+
+    Args:
+        wd_bins ([iterable]): Array of shape (n_bins, 2) containing the
+            lower and upper bound of every wind direction bin.
+
+    Returns:
+        edges ([np.array]): Sorted lower edges of the segments.
+        membership ([np.array]): Boolean array of shape (n_segments,
+            n_bins) which is True where a segment is part of a bin.
+    """
+    wd_bins = np.asarray(wd_bins, dtype=float)
+    lb = wrap_360(wd_bins[:, 0])
+    ub = wrap_360(wd_bins[:, 1])
+    edges = np.unique(np.hstack([lb, ub]))
+
+    # Evaluate bin membership at the center of each segment
+    upper_edges = np.append(edges[1:], edges[0] + 360.0)
+    centers = wrap_360(0.5 * (edges + upper_edges))[:, None]
+    membership = np.where(
+        ub < lb,  # Deal with angle wrapping
+        (centers >= lb) | (centers < ub),
+        (centers >= lb) & (centers < ub),
+    )
+    return edges, membership
+
+
+def get_wd_segment_indices(wd, edges):
+    """Assign every wind direction measurement to a segment of the wind
+    rose, as defined by get_wd_bin_segments(), in a single vectorized pass.
+
+    Args:
+        wd ([iterable]): Array with wind direction measurements.
+        edges ([iterable]): Sorted lower edges of the segments.
+
+    Returns:
+        segment_idx ([np.array]): Integer array with the segment index of
+            every measurement. NaN measurements are assigned -1.
+    """
+    wd = np.asarray(wd, dtype=float)
+    idx = np.searchsorted(edges, wd, side="right") - 1
+    idx[idx < 0] = len(edges) - 1  # Wraps around into the last segment
+    idx[np.isnan(wd)] = -1
+    return idx.astype(int)
+
+
+def get_wd_bin_windows(membership):
+    """Describe every wind direction bin as a circular window of
+    consecutive segments, by its first segment and number of segments.
+
+    Args:
+        membership ([np.array]): Boolean array of shape (n_segments,
+            n_bins) which is True where a segment is part of a bin.
+
+    Returns:
+        starts ([np.array]): Index of the first segment of every bin.
+        lengths ([np.array]): Number of segments in every bin.
+    """
+    lengths = np.sum(membership, axis=0)
+    is_start = membership & ~np.roll(membership, 1, axis=0)
+    starts = np.where(np.any(is_start, axis=0), np.argmax(is_start, axis=0), 0)
+    return starts.astype(int), lengths.astype(int)
+
+
+def get_wd_bin_sums(segment_sums, membership):
+    """Sum values accumulated per wind rose segment into the (possibly
+    overlapping) wind direction bins. Every bin is a circular sliding
+    window over consecutive segments, so the memory and computational cost
+    depend on the number of bins and segments rather than on the number of
+    measurements.
+
+    Args:
+        segment_sums ([np.array]): Array with values summed per segment
+            along its first axis, of shape (n_segments, ...).
+        membership ([np.array]): Boolean array of shape (n_segments,
+            n_bins) which is True where a segment is part of a bin.
+
+    Returns:
+        bin_sums ([np.array]): Array of shape (n_bins, ...) with the
+            values summed per wind direction bin.
+    """
+    segment_sums = np.asarray(segment_sums)
+    n_seg = membership.shape[0]
+    starts, lengths = get_wd_bin_windows(membership)
+
+    # Segment indices of all windows, concatenated
+    offsets = np.cumsum(lengths) - lengths
+    seg_idx = (
+        np.repeat(starts, lengths) +
+        np.arange(np.sum(lengths)) -
+        np.repeat(offsets, lengths)
+    ) % n_seg
+
+    bin_sums = np.zeros(
+        (membership.shape[1],) + segment_sums.shape[1:],
+        dtype=segment_sums.dtype,
+    )
+    ids = (lengths > 0)
+    if np.any(ids):
+        bin_sums[ids] = np.add.reduceat(
+            segment_sums[seg_idx], offsets[ids], axis=0
+        )
+    return bin_sums
+
+
+def get_wd_edge_indices(edges, new_edges, tol=1e-6):
+    """Find the index of every new wind direction edge among the existing
+    segment edges, so that the segments between the new edges can be
+    composed from the existing segments.
+
+    Args:
+        edges ([iterable]): Sorted lower edges of the existing segments.
+        new_edges ([iterable]): Sorted lower edges of the new segments.
+        tol (float, optional): Tolerance in deg for matching edges.
+            Defaults to 1e-6.
+
+    Raises:
+        ValueError: This error is raised if a new edge does not coincide
+            with any of the existing edges.
+
+    Returns:
+        edge_idx ([np.array]): Index of every new edge in edges.
+    """
+    edges = np.asarray(edges, dtype=float)
+    new_edges = np.asarray(new_edges, dtype=float)
+    dist = wrap_360(edges[None, :] - new_edges[:, None] + 180.0) - 180.0
+    dist = np.abs(dist)
+    edge_idx = np.argmin(dist, axis=1)
+    if np.any(dist[np.arange(len(new_edges)), edge_idx] > tol):
+        raise ValueError(
+            "Wind direction bin edges do not align with the base bins."
+        )
+    return edge_idx.astype(int)
+
+
+def get_ws_bin_ranges(ws_bins, new_ws_bins, tol=1e-6):
+    """Describe every new wind speed bin as a range of consecutive existing
+    wind speed bins. The existing bins must be sorted and may not overlap.
+
+    Args:
+        ws_bins ([iterable]): Array of shape (n_bins, 2) containing the
+            lower and upper bound of every existing wind speed bin.
+        new_ws_bins ([iterable]): Array of shape (n_new_bins, 2) containing
+            the lower and upper bound of every new wind speed bin.
+        tol (float, optional): Tolerance in m/s for matching bin edges.
+            Defaults to 1e-6.
+
+    Raises:
+        ValueError: This error is raised if a new bin is not exactly the
+            union of consecutive, adjacent existing bins.
+
+    Returns:
+        start_idx ([np.array]): Index of the first existing bin of every
+            new bin.
+        end_idx ([np.array]): Index after the last existing bin of every
+            new bin.
+    """
+    ws_bins = np.asarray(ws_bins, dtype=float)
+    new_ws_bins = np.asarray(new_ws_bins, dtype=float)
+    if np.any(np.diff(ws_bins[:, 0]) <= 0.0):
+        raise ValueError("The base wind speed bins must be sorted.")
+
+    start_idx = np.argmin(
+        np.abs(ws_bins[None, :, 0] - new_ws_bins[:, 0, None]), axis=1
+    )
+    end_idx = np.argmin(
+        np.abs(ws_bins[None, :, 1] - new_ws_bins[:, 1, None]), axis=1
+    ) + 1
+    is_aligned = (
+        (np.abs(ws_bins[start_idx, 0] - new_ws_bins[:, 0]) <= tol) &
+        (np.abs(ws_bins[end_idx - 1, 1] - new_ws_bins[:, 1]) <= tol) &
+        (end_idx > start_idx)
+    )
+
+    # Every new bin must be covered by existing bins without gaps
+    has_gap = np.abs(ws_bins[1:, 0] - ws_bins[:-1, 1]) > tol
+    n_gaps = np.concatenate([[0], np.cumsum(has_gap)])
+    is_aligned &= (n_gaps[end_idx - 1] == n_gaps[start_idx])
+
+    if not np.all(is_aligned):
+        raise ValueError(
+            "Wind speed bin edges do not align with the base bins."
+        )
+    return start_idx.astype(int), end_idx.astype(int)
+
+
+def get_bin_sums(bin_idx, n_bins, values):
+    """Sum every column of values over the rows in each bin. The rows are
+    mapped onto the bins through a sparse incidence matrix, so that all
+    columns are summed in a single sparse matrix product.
+
+    Args:
+        bin_idx ([np.array]): Bin index of every row. Rows with a negative
+            bin index are ignored.
+        n_bins ([int]): Total number of bins.
+        values ([np.array]): Array of shape (n_rows, n_columns) with the
+            values to sum. Any NaN values must be masked beforehand.
+
+    Returns:
+        bin_sums ([np.array]): Array of shape (n_bins, n_columns) with the
+            summed values in every bin.
+    """
+    rows = np.where(bin_idx >= 0)[0]
+    incidence = sparse.csr_matrix(
+        (np.ones(len(rows)), (bin_idx[rows], rows)),
+        shape=(n_bins, len(bin_idx)),
+    )
+    return np.asarray(incidence @ values)
+
+
+def get_bin_table(bins, varname):
+    """Create a small table describing the bins, with one row per bin.
+    This table contains the bin label, being the center of the bin, and
+    the bin edges as a pd.Interval.
+
+    Args:
+        bins ([iterable]): Array of shape (n_bins, 2) containing the lower
+            and upper bound of every bin.
+        varname ([str]): Variable name, typically 'wd' or 'ws'.
+
+    Returns:
+        df_bins ([pd.DataFrame]): Dataframe with columns '<varname>_bin'
+            and '<varname>_bin_edges'.
+    """
+    bins = np.asarray(bins, dtype=float)
+    return pd.DataFrame(
+        {
+            "{:s}_bin".format(varname): np.mean(bins, axis=1),
+            "{:s}_bin_edges".format(varname): [
+                pd.Interval(b[0], b[1], "left") for b in bins
+            ],
+        }
+    )
@@ -0,0 +1,882 @@
+# Copyright 2021 NREL
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+
+import numpy as np
+import pandas as pd
+
+from ..dataframe_operations import dataframe_manipulations as dfm
+from ..energy_ratio import energy_ratio as er
+from ..energy_ratio import energy_ratio_binning as erb
+from .. import utilities as fsut
+
+
+class energy_ratio_cube:
+    """This class holds the sufficient statistics to calculate energy
+    ratios for a dataframe with measurements, being the number of valid
+    data entries and the summed reference and test power productions.
+    These are stored for every set of test turbines over a grid of wind
+    direction segments, wind speed bins, and optionally turbulence
+    intensity bins and time buckets. The cube is built once from the
+    dataframe, after which energy ratios, bin frequencies and detailed
+    tables are derived from the cube without touching the raw data again.
+
+    The wind direction axis of the cube consists of the elementary segments
+    of the wind rose between all wind direction bin edges. Every (possibly
+    overlapping) wind direction bin is a circular window of consecutive
+    segments, so that the cube size does not depend on the bin overlap.
+    """
+
+    def __init__(
+        self,
+        df_in,
+        test_turbines_list=None,
+        wd_step=2.0,
+        ws_step=1.0,
+        wd_bin_width=None,
+        wd_bins=None,
+        ws_bins=None,
+        ti_bins=None,
+        time_bucket=None,
+        store_moments=False,
+        max_chunk_size=10_000_000,
+        verbose=False,
+    ):
+        """Initialization of the class, building the cube from df_in.
+
+        Args:
+            df_in ([pd.DataFrame]): The dataframe provided by the user. This
+            dataframe should have the following columns:
+                * Reference wind direction for the test turbine, 'wd'
+                * Reference wind speed for the test turbine, 'ws'
+                * Power production of every turbine: pow_000, pow_001, ...
+                * Reference power production used to normalize the energy
+                    ratio: 'pow_ref'
+                * Optionally, the turbulence intensity, 'ti'
+                * Optionally, the timestamps, 'time'
+            test_turbines_list ([iteratible], optional): List with the sets
+                of test turbines for which the statistics are stored, e.g.,
+                [[0], [1], [2, 3]]. The power production of a set is the
+                average over its turbines. If None is specified, every
+                turbine is stored as a separate set. Defaults to None.
+            wd_step, ws_step, wd_bin_width, wd_bins, ws_bins: Binning
+                properties, see energy_ratio.get_energy_ratio().
+            ti_bins (array, optional): Array containing the turbulence
+                intensity bins. Each entry of the provided array must
+                contain exactly two float values, being the lower and upper
+                bound of that bin. Overlap between bins is not supported.
+                Data entries outside of these bins are excluded from the
+                cube. If None, the cube has no turbulence intensity axis.
+                Defaults to None.
+            time_bucket (str or pd.Timedelta, optional): Width of the time
+                buckets, e.g., '1D' or '7D'. Requires the column 'time' in
+                df_in. If None, the cube has no time axis. Defaults to None.
+            store_moments (bool, optional): Also store the sums and sums of
+                squares of the wind direction, wind speed, turbulence
+                intensity and power productions, needed for the detailed
+                tables. This multiplies the cube size by about four times
+                the number of variables. Defaults to False.
+            max_chunk_size (int, optional): Maximum number of values
+                processed at once when building the cube. The sets of test
+                turbines are processed in chunks accordingly. Defaults to
+                10_000_000.
+            verbose (bool, optional): Print to console. Defaults to False.
+        """
+        self.verbose = verbose
+        if "pow_ref" not in df_in.columns:
+            raise KeyError("pow_ref column not in dataframe. Cannot proceed.")
+
+        # Sets of test turbines
+        if test_turbines_list is None:
+            test_turbines_list = range(fsut.get_num_turbines(df_in))
+        self.test_turbines_list = [
+            [int(t) for t in np.atleast_1d(tt)] for tt in test_turbines_list
+        ]
+
+        # Bins
+        self.ws_bins = erb.get_ws_bins(ws_step=ws_step, ws_bins=ws_bins)
+        self.wd_bins = erb.get_wd_bins(
+            wd_step=wd_step, wd_bin_width=wd_bin_width, wd_bins=wd_bins
+        )
+        self.ti_bins = None if ti_bins is None else np.array(ti_bins, float)
+        self.wd_seg_edges, self.wd_seg_membership = erb.get_wd_bin_segments(
+            self.wd_bins
+        )
+        self.has_ti = "ti" in df_in.columns
+        self.time_bucket = None
+        self.time_bucket_start = None
+        if time_bucket is not None:
+            self.time_bucket = pd.Timedelta(time_bucket)
+
+        self._build(df_in, store_moments, max_chunk_size)
+
+    # Private methods
+
+    def _build(self, df_in, store_moments, max_chunk_size):
+        """This function bins all data entries and accumulates the sums of
+        every set of test turbines into the cube.
+        """
+        n_seg = self.wd_seg_membership.shape[0]
+        n_ws = self.ws_bins.shape[0]
+        n_rows = df_in.shape[0]
+
+        # Bin indices of every data entry along every axis of the cube
+        wd = np.array(df_in["wd"], dtype=float)
+        ws = np.array(df_in["ws"], dtype=float)
+        seg_idx = erb.get_wd_segment_indices(wd, self.wd_seg_edges)
+        ws_idx = erb.get_ws_bin_indices(ws, self.ws_bins)
+
+        if self.ti_bins is None:
+            n_ti = 1
+            ti_idx = np.zeros(n_rows, dtype=int)
+        else:
+            # Turbulence intensity bins do not overlap, like ws bins
+            n_ti = self.ti_bins.shape[0]
+            ti_idx = erb.get_ws_bin_indices(df_in["ti"], self.ti_bins)
+
+        if self.time_bucket is None:
+            n_time = 1
+            time_idx = np.zeros(n_rows, dtype=int)
+        else:
+            time = pd.to_datetime(df_in["time"])
+            t0 = time.min().floor(self.time_bucket)
+            time_idx = np.floor(
+                np.array((time - t0) / self.time_bucket, dtype=float)
+            )
+            time_idx = np.where(np.isnan(time_idx), -1, time_idx).astype(int)
+            n_time = int(np.max(time_idx)) + 1
+            self.time_bucket_start = np.array(
+                t0 + np.arange(n_time) * self.time_bucket,
+                dtype="datetime64[ns]",
+            )
+
+        # Number of entries per segment, and per segment and ws bin
+        in_cube = (seg_idx >= 0) & (ti_idx >= 0) & (time_idx >= 0)
+        flat_idx = np.where(
+            in_cube, (seg_idx * n_ti + ti_idx) * n_time + time_idx, -1
+        )
+        self.seg_count = np.bincount(
+            flat_idx[in_cube], minlength=n_seg * n_ti * n_time
+        ).reshape(n_seg, n_ti, n_time)
+
+        flat_idx = np.where(
+            in_cube & (ws_idx >= 0),
+            ((seg_idx * n_ws + ws_idx) * n_ti + ti_idx) * n_time + time_idx,
+            -1,
+        )
+        n_bins = n_seg * n_ws * n_ti * n_time
+        self.freq = np.bincount(
+            flat_idx[flat_idx >= 0], minlength=n_bins
+        ).reshape(n_seg, n_ws, n_ti, n_time)
+
+        # Variables that must be valid, and variables for the moments
+        cols = ["wd", "ws", "ti", "pow_ref"] if self.has_ti else [
+            "wd", "ws", "pow_ref"
+        ]
+        base_valid = np.array(df_in[cols].notna().all(axis=1), dtype=bool)
+        base_vars = np.array(df_in[cols], dtype=float)
+        self.moment_vars = cols + ["pow_test"] if store_moments else None
+
+        # Accumulate the sums for chunks of sets of test turbines
+        n_sets = len(self.test_turbines_list)
+        shape = (n_seg, n_ws, n_ti, n_time, n_sets)
+        self.count = np.zeros(shape, dtype=int)
+        self.sum_ref = np.zeros(shape)
+        self.sum_test = np.zeros(shape)
+        if store_moments:
+            n_vars = len(self.moment_vars)
+            self.sum_moments = np.zeros(shape + (n_vars, 2))
+        else:
+            self.sum_moments = None
+
+        pow_ref = base_vars[:, cols.index("pow_ref")]
+        n_values = 3 if not store_moments else 3 + 2 * len(self.moment_vars)
+        chunk_size = max_chunk_size // (n_values * np.max([n_rows, 1]))
+        chunk_size = int(np.max([1, chunk_size]))
+        for i0 in range(0, n_sets, chunk_size):
+            sets = self.test_turbines_list[i0:i0 + chunk_size]
+            pow_test = np.stack(
+                [
+                    dfm.get_column_mean(
+                        df=df_in,
+                        col_prefix="pow",
+                        turbine_list=tt,
+                        circular_mean=False,
+                    )
+                    for tt in sets
+                ],
+                axis=1,
+            )
+            is_valid = base_valid[:, None] & ~np.isnan(pow_test)
+
+            values = [
+                np.where(is_valid, 1.0, 0.0),
+                np.where(is_valid, pow_ref[:, None], 0.0),
+                np.where(is_valid, pow_test, 0.0),
+            ]
+            if store_moments:
+                for ii in range(len(cols)):
+                    x = np.where(is_valid, base_vars[:, [ii]], 0.0)
+                    values.extend([x, x**2])
+                x = values[2]
+                values.extend([x, x**2])
+
+            sums = erb.get_bin_sums(flat_idx, n_bins, np.hstack(values))
+            sums = sums.reshape(n_seg, n_ws, n_ti, n_time, -1, len(sets))
+            sums = np.moveaxis(sums, 4, -1)  # Sets before the quantities
+            ids = slice(i0, i0 + len(sets))
+            self.count[..., ids] = np.rint(sums[..., 0])
+            self.sum_ref[..., ids] = sums[..., 1]
+            self.sum_test[..., ids] = sums[..., 2]
+            if store_moments:
+                self.sum_moments[..., ids, :, :] = sums[..., 3:].reshape(
+                    sums.shape[:-1] + (-1, 2)
+                )
+
+            if self.verbose:
+                print(
+                    "Accumulated %d out of %d sets of test turbines."
+                    % (i0 + len(sets), n_sets)
+                )
+
+    def _get_set_index(self, test_turbines):
+        if not (type(test_turbines) is list):
+            test_turbines = list(np.atleast_1d(test_turbines))
+        test_turbines = [int(t) for t in test_turbines]
+        for ii, tt in enumerate(self.test_turbines_list):
+            if tt == test_turbines:
+                return ii
+        raise KeyError(
+            "Test turbines {} not in the cube.".format(test_turbines)
+        )
+
+    def _get_axis_selection(self, ti_range=None, time_range=None):
+        """This function returns boolean masks for the turbulence intensity
+        bins that lie fully within ti_range, and for the time buckets that
+        start within time_range, i.e., in [time_range[0], time_range[1]).
+        """
+        n_ti = self.seg_count.shape[1]
+        n_time = self.seg_count.shape[2]
+
+        ti_mask = np.ones(n_ti, dtype=bool)
+        if ti_range is not None:
+            if self.ti_bins is None:
+                raise ValueError("This cube has no turbulence intensity axis.")
+            ti_mask = (
+                (self.ti_bins[:, 0] >= ti_range[0]) &
+                (self.ti_bins[:, 1] <= ti_range[1])
+            )
+
+        time_mask = np.ones(n_time, dtype=bool)
+        if time_range is not None:
+            if self.time_bucket is None:
+                raise ValueError("This cube has no time axis.")
+            t = self.time_bucket_start
+            time_mask = (
+                (t >= np.datetime64(pd.Timestamp(time_range[0]))) &
+                (t < np.datetime64(pd.Timestamp(time_range[1])))
+            )
+
+        return ti_mask, time_mask
+
+    def _reduce(self, x, ti_mask, time_mask, n_trailing=0):
+        """Sum an array of the cube over the selected turbulence intensity
+        bins and time buckets, and then sum the wind rose segments into the
+        (overlapping) wind direction bins. The turbulence intensity and
+        time axes are followed by n_trailing further axes.
+        """
+        ti_axis = x.ndim - n_trailing - 2
+        x = np.compress(ti_mask, x, axis=ti_axis)
+        x = np.compress(time_mask, x, axis=ti_axis + 1)
+        x = np.sum(x, axis=(ti_axis, ti_axis + 1))
+        return erb.get_wd_bin_sums(x, self.wd_seg_membership)
+
+    def _add_cube(self, other, sign=1):
+        """Add (sign=1) or subtract (sign=-1) the statistics of another
+        cube with identical binning and sets of test turbines to this cube.
+        Cubes with a time axis cannot be combined, since their time buckets
+        need not be aligned.
+        """
+        if (self.time_bucket is not None) or (other.time_bucket is not None):
+            raise ValueError("Cannot combine cubes with a time axis.")
+        if not (
+            (self.test_turbines_list == other.test_turbines_list) and
+            np.array_equal(self.wd_bins, other.wd_bins) and
+            np.array_equal(self.ws_bins, other.ws_bins) and
+            ((self.ti_bins is None) == (other.ti_bins is None)) and
+            ((self.sum_moments is None) == (other.sum_moments is None))
+        ):
+            raise ValueError("Cubes have different binning or test turbines.")
+        if (self.ti_bins is not None) and not np.array_equal(
+            self.ti_bins, other.ti_bins
+        ):
+            raise ValueError("Cubes have different binning or test turbines.")
+
+        self.seg_count = self.seg_count + sign * other.seg_count
+        self.freq = self.freq + sign * other.freq
+        self.count = self.count + sign * other.count
+        self.sum_ref = self.sum_ref + sign * other.sum_ref
+        self.sum_test = self.sum_test + sign * other.sum_test
+        if self.sum_moments is not None:
+            self.sum_moments = self.sum_moments + sign * other.sum_moments
+
+        # Invalidate the cached prefix sums of the previous statistics
+        self._prefix_sums = None
+        self._time_prefix_sums = None
+
+    def _get_prefix_sums(self):
+        """Calculate the cumulative sums of the cube along the wind rose
+        segments and wind speed bins, so that the sums over any range of
+        segments and bins follow from a few differences. These are cached,
+        since they only depend on the cube itself.
+        """
+        if getattr(self, "_prefix_sums", None) is not None:
+            return self._prefix_sums
+
+        def cumsum(x, n_axes):
+            x = np.asarray(x)
+            for axis in range(n_axes):
+                x = np.cumsum(x, axis=axis)
+                pad = [(0, 0)] * x.ndim
+                pad[axis] = (1, 0)
+                x = np.pad(x, pad)
+            return x
+
+        self._prefix_sums = {"seg_count": cumsum(self.seg_count, 1)}
+        for name in ["freq", "count", "sum_ref", "sum_test", "sum_moments"]:
+            x = getattr(self, name)
+            self._prefix_sums[name] = None if x is None else cumsum(x, 2)
+        return self._prefix_sums
+
+    def _get_time_prefix_sums(self):
+        """Calculate the cumulative sums of the cube along the time buckets,
+        so that the sums over any contiguous range of time buckets follow
+        from a single difference. These are cached, since they only depend
+        on the cube itself.
+        """
+        if getattr(self, "_time_prefix_sums", None) is not None:
+            return self._time_prefix_sums
+
+        self._time_prefix_sums = {}
+        for name in ["freq", "count", "sum_ref", "sum_test"]:
+            x = np.cumsum(getattr(self, name), axis=3)
+            pad = [(0, 0)] * x.ndim
+            pad[3] = (1, 0)
+            self._time_prefix_sums[name] = np.pad(x, pad)
+        return self._time_prefix_sums
+
+    # Public methods
+
+    def rebin(
+        self,
+        wd_step=2.0,
+        ws_step=1.0,
+        wd_bin_width=None,
+        wd_bins=None,
+        ws_bins=None,
+    ):
+        """This function derives a cube with coarser, and possibly
+        overlapping, wind direction and wind speed bins from this cube,
+        without touching the raw data. Every bin edge of the new bins must
+        coincide with a bin edge of this cube. This is typically used with
+        a fine base cube from get_fine_cube(), so that the binning
+        properties can be tuned at a cost that scales with the number of
+        new bins rather than the amount of data.
+
+        Args:
+            wd_step, ws_step, wd_bin_width, wd_bins, ws_bins: Binning
+                properties, see energy_ratio.get_energy_ratio().
+
+        Raises:
+            ValueError: This error is raised if the new bin edges do not
+                align with the bin edges of this cube.
+
+        Returns:
+            cube ([energy_ratio_cube]): Cube with the new binning, with the
+                same turbulence intensity bins, time buckets and sets of
+                test turbines as this cube.
+        """
+        ws_bins = erb.get_ws_bins(ws_step=ws_step, ws_bins=ws_bins)
+        wd_bins = erb.get_wd_bins(
+            wd_step=wd_step, wd_bin_width=wd_bin_width, wd_bins=wd_bins
+        )
+        wd_seg_edges, wd_seg_membership = erb.get_wd_bin_segments(wd_bins)
+
+        # Ranges of existing segments and ws bins spanned by the new ones.
+        # The last segment wraps around 360 deg, as does any segment that
+        # spans the full wind rose.
+        seg_start = erb.get_wd_edge_indices(self.wd_seg_edges, wd_seg_edges)
+        seg_end = np.roll(seg_start, -1)
+        is_wrapped = (seg_end <= seg_start)
+        ws_start, ws_end = erb.get_ws_bin_ranges(self.ws_bins, ws_bins)
+
+        def window_sums(x, has_ws_axis=True):
+            if has_ws_axis:
+                x = x[:, ws_end] - x[:, ws_start]
+            wrap = is_wrapped.reshape((-1,) + (1,) * (x.ndim - 1))
+            return x[seg_end] - x[seg_start] + wrap * x[-1]
+
+        prefix_sums = self._get_prefix_sums()
+        cube = self.__class__.__new__(self.__class__)
+        cube.verbose = self.verbose
+        cube.test_turbines_list = self.test_turbines_list
+        cube.wd_bins = wd_bins
+        cube.ws_bins = ws_bins
+        cube.ti_bins = self.ti_bins
+        cube.has_ti = self.has_ti
+        cube.wd_seg_edges = wd_seg_edges
+        cube.wd_seg_membership = wd_seg_membership
+        cube.time_bucket = self.time_bucket
+        cube.time_bucket_start = self.time_bucket_start
+        cube.moment_vars = self.moment_vars
+        cube.seg_count = window_sums(prefix_sums["seg_count"], False)
+        for name in ["freq", "count", "sum_ref", "sum_test", "sum_moments"]:
+            x = prefix_sums[name]
+            setattr(cube, name, None if x is None else window_sums(x))
+        return cube
+
+    def get_bin_freq(self, ti_range=None, time_range=None):
+        """This function returns the observed frequency of occurrence of
+        every wind direction and wind speed bin, being the number of data
+        entries in every bin, including entries with NaN values. For bin
+        balancing between multiple cubes, see get_balanced_bin_freq().
+
+        Args:
+            ti_range ([iteratible], optional): Only include the turbulence
+                intensity bins that lie within [ti_range[0], ti_range[1]].
+                Defaults to None.
+            time_range ([iteratible], optional): Only include the time
+                buckets that start within [time_range[0], time_range[1]).
+                Defaults to None.
+
+        Returns:
+            bin_freq ([np.array]): Array of shape (n_wd_bins, n_ws_bins)
+                with the number of data entries in every bin.
+        """
+        ti_mask, time_mask = self._get_axis_selection(ti_range, time_range)
+        return self._reduce(self.freq, ti_mask, time_mask)
+
+    def get_bin_counts(self, ti_range=None, time_range=None):
+        """This function returns the number of data entries in every
+        observed wind direction and wind speed bin as a dataframe.
+
+        Args:
+            ti_range, time_range: See get_bin_freq().
+
+        Returns:
+            df_counts ([pd.DataFrame]): Dataframe indexed by the wind
+                direction and wind speed bin labels, with the number of
+                data entries in each bin as the column 'bin_count'.
+        """
+        bin_freq = self.get_bin_freq(ti_range, time_range)
+        wd_idx, ws_idx = np.nonzero(bin_freq)
+        df_counts = pd.DataFrame(
+            {
+                "wd_bin": np.mean(self.wd_bins, axis=1)[wd_idx],
+                "ws_bin": np.mean(self.ws_bins, axis=1)[ws_idx],
+                "bin_count": bin_freq[wd_idx, ws_idx],
+            }
+        )
+        return df_counts.set_index(["wd_bin", "ws_bin"])
+
+    def get_energy_ratio_batch(
+        self,
+        test_turbines_list=None,
+        ti_range=None,
+        time_range=None,
+        bin_freq=None,
+    ):
+        """This function calculates the balanced energy ratios for multiple
+        sets of test turbines at once, directly from the cube.
+
+        Args:
+            test_turbines_list ([iteratible], optional): List with the sets
+                of test turbines, each of which must be in the cube. If None
+                is specified, uses all sets in the cube. Defaults to None.
+            ti_range, time_range: See get_bin_freq().
+            bin_freq ([np.array], optional): Array of shape (n_wd_bins,
+                n_ws_bins) with the frequency of every bin used to balance
+                the energy ratios, e.g., from get_balanced_bin_freq(). If
+                None, the observed bin frequencies are used. Defaults to
+                None.
+
+        Returns:
+            energy_ratios ([pd.DataFrame]): Dataframe in long format, with
+                one row for every set of test turbines and wind direction
+                bin, formatted like energy_ratio.get_energy_ratio_batch().
+        """
+        if test_turbines_list is None:
+            test_turbines_list = self.test_turbines_list
+        set_ids = [self._get_set_index(tt) for tt in test_turbines_list]
+
+        ti_mask, time_mask = self._get_axis_selection(ti_range, time_range)
+        wd_bin_count = self._reduce(self.seg_count, ti_mask, time_mask)
+        if bin_freq is None:
+            bin_freq = self._reduce(self.freq, ti_mask, time_mask)
+        bin_count, bin_sum_ref, bin_sum_test = [
+            self._reduce(x[..., set_ids], ti_mask, time_mask, n_trailing=1)
+            for x in [self.count, self.sum_ref, self.sum_test]
+        ]
+
+        df_wd_bins = erb.get_bin_table(self.wd_bins, "wd")
+        energy_ratios_list = []
+        for ii, set_id in enumerate(set_ids):
+            energy_ratios = er._get_energy_ratios_all_wd_bins_nominal(
+                df_wd_bins=df_wd_bins,
+                wd_bin_count=wd_bin_count,
+                bin_freq=bin_freq,
+                bin_count=bin_count[:, :, ii],
+                bin_sum_ref=bin_sum_ref[:, :, ii],
+                bin_sum_test=bin_sum_test[:, :, ii],
+            )
+            energy_ratios.insert(
+                0,
+                "test_turbines",
+                [tuple(self.test_turbines_list[set_id])] * len(energy_ratios),
+            )
+            energy_ratios_list.append(energy_ratios)
+
+        return pd.concat(energy_ratios_list, ignore_index=True)
+
+    def get_energy_ratio(
+        self, test_turbines, ti_range=None, time_range=None, bin_freq=None
+    ):
+        """This function calculates the balanced energy ratio for a single
+        set of test turbines, directly from the cube.
+
+        Args:
+            test_turbines ([iteratible]): Set of test turbines, which must
+                be in the cube.
+            ti_range, time_range, bin_freq: See get_energy_ratio_batch().
+
+        Returns:
+            energy_ratios ([pd.DataFrame]): Dataframe containing the found
+                energy ratios, formatted like the output of
+                energy_ratio.get_energy_ratio() without uncertainty
+                quantification.
+        """
+        energy_ratios = self.get_energy_ratio_batch(
+            test_turbines_list=[test_turbines],
+            ti_range=ti_range,
+            time_range=time_range,
+            bin_freq=bin_freq,
+        )
+        return energy_ratios.drop(columns="test_turbines")
+
+    def get_energy_ratio_time_series(
+        self, test_turbines, window=1, step=1, ti_range=None, bin_freq=None
+    ):
+        """This function calculates the balanced energy ratio of every wind
+        direction bin over a sequence of (rolling) time windows, e.g., to
+        track the evolution of the energy ratios month by month. Every
+        window spans a contiguous range of time buckets. The sums over
+        each window follow from the cumulative sums of the cube along its
+        time axis, so the cost of a window does not depend on its length.
+
+        Args:
+            test_turbines ([iteratible]): Set of test turbines, which must
+                be in the cube.
+            window (int, str or pd.Timedelta, optional): Length of every
+                window, either as a number of time buckets or as a duration
+                that is a multiple of the time bucket width, e.g., '30D'.
+                Defaults to 1.
+            step (int, str or pd.Timedelta, optional): Offset between the
+                starts of consecutive windows, specified like window. Use
+                step=window for non-overlapping windows. Defaults to 1.
+            ti_range ([iteratible], optional): Only include the turbulence
+                intensity bins that lie within [ti_range[0], ti_range[1]].
+                Defaults to None.
+            bin_freq ([np.array], optional): Array of shape (n_wd_bins,
+                n_ws_bins) with the frequency of every bin used to balance
+                the energy ratios. If None, the observed bin frequencies
+                over all time buckets are used, so that the energy ratios
+                of different windows are weighed identically. Defaults to
+                None.
+
+        Returns:
+            energy_ratios ([pd.DataFrame]): Dataframe of shape (n_windows,
+                n_wd_bins) with the energy ratios, indexed by the start of
+                every window, 'time', and with the wind direction bins as
+                columns. Wind direction bins without data in a window are
+                NaN.
+        """
+        if self.time_bucket is None:
+            raise ValueError("This cube has no time axis.")
+
+        def get_num_buckets(x):
+            if isinstance(x, (int, np.integer)):
+                n = int(x)
+            else:
+                n = pd.Timedelta(x) / self.time_bucket
+                if not float(n).is_integer():
+                    raise ValueError(
+                        "The window and step must be multiples of the time "
+                        "bucket width."
+                    )
+                n = int(n)
+            if n < 1:
+                raise ValueError("The window and step must be positive.")
+            return n
+
+        window = get_num_buckets(window)
+        step = get_num_buckets(step)
+        n_time = self.seg_count.shape[2]
+        t0 = np.arange(0, np.max([n_time - window + 1, 0]), step)
+
+        set_id = self._get_set_index(test_turbines)
+        ti_mask, _ = self._get_axis_selection(ti_range, None)
+        if bin_freq is None:
+            bin_freq = self.get_bin_freq(ti_range=ti_range)
+
+        # Sums over every window, of shape (n_windows, n_wd_bins, n_ws_bins)
+        prefix_sums = self._get_time_prefix_sums()
+        bin_sums = []
+        for name in ["count", "sum_ref", "sum_test"]:
+            x = prefix_sums[name][..., set_id]
+            x = x[..., t0 + window] - x[..., t0]
+            x = np.sum(np.compress(ti_mask, x, axis=2), axis=2)
+            x = erb.get_wd_bin_sums(x, self.wd_seg_membership)
+            bin_sums.append(np.moveaxis(x, -1, 0))
+
+        energy_ratios = er._get_energy_ratio_balanced(
+            bin_freq=bin_freq,
+            bin_count=bin_sums[0],
+            bin_sum_ref=bin_sums[1],
+            bin_sum_test=bin_sums[2],
+        )
+        df_out = pd.DataFrame(
+            energy_ratios,
+            index=pd.Index(self.time_bucket_start[t0], name="time"),
+            columns=pd.Index(np.mean(self.wd_bins, axis=1), name="wd_bin"),
+        )
+        return df_out.sort_index(axis=1, kind="stable")
+
+    def get_detailed_output(
+        self, test_turbines, ti_range=None, time_range=None, bin_freq=None
+    ):
+        """This function calculates the detailed energy ratio information
+        for a single set of test turbines, directly from the cube. This
+        requires the cube to be built with store_moments=True.
+
+        Args:
+            test_turbines ([iteratible]): Set of test turbines, which must
+                be in the cube.
+            ti_range, time_range, bin_freq: See get_energy_ratio_batch().
+
+        Returns:
+            dict_out ([dict]): Dictionary with the fields 'df_per_wd_bin'
+                and 'df_per_ws_bin', formatted like the detailed output of
+                energy_ratio.get_energy_ratio().
+        """
+        if self.sum_moments is None:
+            raise ValueError(
+                "Detailed output requires a cube built with "
+                "store_moments=True."
+            )
+
+        set_id = self._get_set_index(test_turbines)
+        ti_mask, time_mask = self._get_axis_selection(ti_range, time_range)
+        if bin_freq is None:
+            bin_freq = self._reduce(self.freq, ti_mask, time_mask)
+        moments = self._reduce(
+            self.sum_moments[..., set_id, :, :], ti_mask, time_mask, 2
+        )
+
+        bin_count = self._reduce(self.count[..., set_id], ti_mask, time_mask)
+
+        # The cube holds sums of squares, which unlike sums of squared
+        # deviations can be added and subtracted between cubes
+        with np.errstate(divide="ignore", invalid="ignore"):
+            bin_sums_sq_dev = np.nan_to_num(
+                moments[..., 1] - moments[..., 0]**2 / bin_count[..., None]
+            )
+
+        return er._get_detailed_output_from_sums(
+            df_wd_bins=erb.get_bin_table(self.wd_bins, "wd"),
+            df_ws_bins=erb.get_bin_table(self.ws_bins, "ws"),
+            wd_bin_count=self._reduce(self.seg_count, ti_mask, time_mask),
+            bin_freq=bin_freq,
+            bin_count=bin_count,
+            bin_sums=moments[..., 0],
+            bin_sums_sq_dev=bin_sums_sq_dev,
+            mean_cols=self.moment_vars,
+        )
+
+    def to_dataframe(self):
+        """This function formats the cube as a dataframe in long format,
+        with one row for every nonzero combination of wind rose segment,
+        wind speed bin, turbulence intensity bin, time bucket and set of
+        test turbines.
+
+        Returns:
+            df ([pd.DataFrame]): Dataframe with the columns 'wd_seg_lb',
+                'ws_bin', 'ti_bin', 'time_bucket', 'test_turbines', 'count',
+                'sum_pow_ref' and 'sum_pow_test'. The columns 'ti_bin' and
+                'time_bucket' are only included if the cube has these axes.
+        """
+        idx = np.nonzero(self.count)
+        df = pd.DataFrame({"wd_seg_lb": self.wd_seg_edges[idx[0]]})
+        df["ws_bin"] = np.mean(self.ws_bins, axis=1)[idx[1]]
+        if self.ti_bins is not None:
+            df["ti_bin"] = np.mean(self.ti_bins, axis=1)[idx[2]]
+        if self.time_bucket is not None:
+            df["time_bucket"] = self.time_bucket_start[idx[3]]
+        df["test_turbines"] = [
+            "-".join("{:03d}".format(t) for t in self.test_turbines_list[ii])
+            for ii in idx[4]
+        ]
+        df["count"] = self.count[idx]
+        df["sum_pow_ref"] = self.sum_ref[idx]
+        df["sum_pow_test"] = self.sum_test[idx]
+        return df
+
+    def save(self, filename):
+        """Save the cube to disk. If the filename ends with '.ftr' or
+        '.feather', the cube is exported in long format through
+        to_dataframe(), which cannot be loaded back into a cube. Otherwise,
+        the full cube is saved as a NumPy .npz archive, which can be loaded
+        using energy_ratio_cube.load().
+
+        Args:
+            filename ([str]): Path to the output file.
+        """
+        if str(filename).endswith((".ftr", ".feather")):
+            self.to_dataframe().to_feather(filename)
+            return
+
+        # Pad the sets of test turbines with -1 to a rectangular array
+        n_max = np.max([len(tt) for tt in self.test_turbines_list])
+        test_turbines = -np.ones((len(self.test_turbines_list), n_max), int)
+        for ii, tt in enumerate(self.test_turbines_list):
+            test_turbines[ii, :len(tt)] = tt
+
+        arrays = {
+            "test_turbines": test_turbines,
+            "wd_bins": self.wd_bins,
+            "ws_bins": self.ws_bins,
+            "has_ti": self.has_ti,
+            "seg_count": self.seg_count,
+            "freq": self.freq,
+            "count": self.count,
+            "sum_ref": self.sum_ref,
+            "sum_test": self.sum_test,
+        }
+        if self.ti_bins is not None:
+            arrays["ti_bins"] = self.ti_bins
+        if self.time_bucket is not None:
+            arrays["time_bucket"] = self.time_bucket.value
+            arrays["time_bucket_start"] = self.time_bucket_start
+        if self.sum_moments is not None:
+            arrays["sum_moments"] = self.sum_moments
+            arrays["moment_vars"] = np.array(self.moment_vars)
+        np.savez_compressed(filename, **arrays)
+
+    @classmethod
+    def load(cls, filename, verbose=False):
+        """Load a cube previously saved as a NumPy .npz archive.
+
+        Args:
+            filename ([str]): Path to the .npz file.
+            verbose (bool, optional): Print to console. Defaults to False.
+
+        Returns:
+            cube ([energy_ratio_cube]): The loaded cube.
+        """
+        cube = cls.__new__(cls)
+        cube.verbose = verbose
+        with np.load(filename, allow_pickle=False) as f:
+            cube.test_turbines_list = [
+                [int(t) for t in tt if t >= 0] for tt in f["test_turbines"]
+            ]
+            cube.wd_bins = f["wd_bins"]
+            cube.ws_bins = f["ws_bins"]
+            cube.ti_bins = f["ti_bins"] if "ti_bins" in f else None
+            cube.has_ti = bool(f["has_ti"])
+            cube.wd_seg_edges, cube.wd_seg_membership = (
+                erb.get_wd_bin_segments(cube.wd_bins)
+            )
+            cube.time_bucket = None
+            cube.time_bucket_start = None
+            if "time_bucket" in f:
+                cube.time_bucket = pd.Timedelta(int(f["time_bucket"]))
+                cube.time_bucket_start = f["time_bucket_start"]
+            cube.seg_count = f["seg_count"]
+            cube.freq = f["freq"]
+            cube.count = f["count"]
+            cube.sum_ref = f["sum_ref"]
+            cube.sum_test = f["sum_test"]
+            cube.sum_moments = None
+            cube.moment_vars = None
+            if "sum_moments" in f:
+                cube.sum_moments = f["sum_moments"]
+                cube.moment_vars = [str(v) for v in f["moment_vars"]]
+        return cube
+
+
+def get_balanced_bin_freq(cube_list, ti_range=None, time_range=None):
+    """Balance the bins between multiple cubes with identical binning. The
+    frequency of every wind direction and wind speed bin is equal to the
+    minimum number of occurrences among all the cubes, consistent with the
+    bin balancing in energy_ratio_suite.
+
+    Args:
+        cube_list ([iteratible]): List of energy_ratio_cube objects.
+        ti_range, time_range: See energy_ratio_cube.get_bin_freq().
+
+    Returns:
+        bin_freq ([np.array]): Array of shape (n_wd_bins, n_ws_bins) with
+            the balanced frequency of every bin.
+    """
+    return np.min(
+        [c.get_bin_freq(ti_range, time_range) for c in cube_list], axis=0
+    )
+
+
+def get_fine_cube(
+    df_in, wd_resolution=0.1, ws_resolution=0.1, ws_max=40.0, **kwargs
+):
+    """Build a cube with fine, non-overlapping wind direction and wind
+    speed bins, from which cubes with coarser and overlapping bins are
+    derived through energy_ratio_cube.rebin(). The edges of the fine bins
+    are multiples of the resolution, so any bins whose edges are multiples
+    of the resolution can be derived. Note that data entries are binned at
+    the fine resolution, so that an entry exactly on a bin edge is assigned
+    to a bin by its rounded fine bin edge.
+
+    Args:
+        df_in ([pd.DataFrame]): The dataframe provided by the user, see
+            energy_ratio_cube.
+        wd_resolution (float, optional): Width of the fine wind direction
+            bins in deg. Must divide 360 deg. Defaults to 0.1.
+        ws_resolution (float, optional): Width of the fine wind speed bins
+            in m/s. Defaults to 0.1.
+        ws_max (float, optional): Upper bound of the highest fine wind
+            speed bin in m/s. Defaults to 40.0.
+        **kwargs: Further keyword arguments for energy_ratio_cube, such as
+            test_turbines_list, ti_bins, time_bucket and store_moments.
+
+    Returns:
+        cube ([energy_ratio_cube]): Cube with the fine bins.
+    """
+    n_wd = int(np.round(360.0 / wd_resolution))
+    if np.abs(n_wd * wd_resolution - 360.0) > 1e-6:
+        raise ValueError("wd_resolution must divide 360 deg.")
+    n_ws = int(np.ceil(ws_max / ws_resolution - 1e-6))
+
+    wd_edges = np.round(np.arange(n_wd + 1) * wd_resolution, 10)
+    ws_edges = np.round(np.arange(n_ws + 1) * ws_resolution, 10)
+    return energy_ratio_cube(
+        df_in,
+        wd_bins=np.vstack([wd_edges[:-1], wd_edges[1:]]).T,
+        ws_bins=np.vstack([ws_edges[:-1], ws_edges[1:]]).T,
+        **kwargs,
+    )
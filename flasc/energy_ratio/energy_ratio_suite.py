@@ -11,14 +11,15 @@
 # the License.
 
 
+import warnings
+
 import numpy as np
 import pandas as pd
 from pandas.core.base import DataError
-from scipy.interpolate import NearestNDInterpolator
 
 from ..energy_ratio import energy_ratio as er
 from ..energy_ratio import energy_ratio_visualization as vis
-from .. import time_operations as fsato, utilities as fsut
+from .. import utilities as fsut
 
 
 class energy_ratio_suite:
@@ -51,6 +52,8 @@ class energy_ratio_suite:
         self.ti_range_ids = []
         self.time_range = None
         self.time_range_ids = []
+        self.time_index = []
+        self.subset_ids = []
         self.verbose = verbose
 
         if verbose:
@@ -99,11 +102,13 @@ class energy_ratio_suite:
         new_entry = dict({"df": df, "name": name})
         self.df_list.append(new_entry)
 
-        default_ids = np.array([True for _ in range(df.shape[0])])
+        default_ids = np.ones(df.shape[0], dtype=bool)
         self.wd_range_ids.append(default_ids)
         self.ws_range_ids.append(default_ids)
         self.ti_range_ids.append(default_ids)
         self.time_range_ids.append(default_ids)
+        self.time_index.append(_get_time_index(df))
+        self.subset_ids.append(None)
 
         # Force update mask for new dataframe
         idx = len(self.df_list) - 1
@@ -144,6 +149,8 @@ class energy_ratio_suite:
         self.ws_range_ids.pop(index)
         self.ti_range_ids.pop(index)
         self.time_range_ids.pop(index)
+        self.time_index.pop(index)
+        self.subset_ids.pop(index)
 
         if len(self.df_list) < 1:
             # Reset variables
@@ -200,18 +207,19 @@ class energy_ratio_suite:
                 defining the lower and upper bound, respectively. If not
                 specified, will not mask the data based on this variable.
                 Defaults to None.
-            time_range ([iterable], optional): Wind speed mask. Should be an
+            time_range ([iterable], optional): Time mask. Should be an
                 iterable of length 2, e.g., [pd.to_datetime("2019-01-01"),
-                pd.to_datetime("2019-04-01")], defining the lower and upper
-                bound, respectively. If not specified, will not mask the data
-                based on this variable. Defaults to None.
+                pd.to_datetime("2019-04-01")], defining the lower (inclusive)
+                and upper (exclusive) bound, respectively. Requires a column
+                'time' in the dataframes. If not specified, will not mask the
+                data based on this variable. Defaults to None.
             df_ids ([iterable], optional): List of turbine indices depicting
                 which dataframes should be masked based on the specified
                 criteria. If not specified, will apply the masks to all
                 datasets. Defaults to None.
         """
         if self.verbose:
-            print("Extracting a mask over the df: 'df_subset'.")
+            print("Updating the masks over the dataframes.")
 
         if df_ids is None:
             df_ids = range(len(self.df_list))
@@ -221,45 +229,93 @@ class energy_ratio_suite:
         if (ws_range is not None) and not (ws_range == self.ws_range):
             self.ws_range = ws_range
             for ii in df_ids:
-                df = self.df_list[ii]["df"]
-                ids = (df["ws"] > ws_range[0]) & (df["ws"] <= ws_range[1])
-                self.ws_range_ids[ii] = np.array(ids)
+                ws = self.df_list[ii]["df"]["ws"].to_numpy()
+                ids = (ws > ws_range[0]) & (ws <= ws_range[1])
+                self.ws_range_ids[ii] = ids
+                self.subset_ids[ii] = None
 
         if (wd_range is not None) and not (wd_range == self.wd_range):
             self.wd_range = wd_range
             for ii in df_ids:
-                df = self.df_list[ii]["df"]
-                ids = (df["wd"] > wd_range[0]) & (df["wd"] <= wd_range[1])
-                self.wd_range_ids[ii] = np.array(ids)
+                wd = self.df_list[ii]["df"]["wd"].to_numpy()
+                ids = (wd > wd_range[0]) & (wd <= wd_range[1])
+                self.wd_range_ids[ii] = ids
+                self.subset_ids[ii] = None
 
         if (ti_range is not None) and not (ti_range == self.ti_range):
             self.ti_range = ti_range
             for ii in df_ids:
-                df = self.df_list[ii]["df"]
-                ids = (df["ti"] > ti_range[0]) & (df["ti"] <= ti_range[1])
-                self.ti_range_ids[ii] = np.array(ids)
+                ti = self.df_list[ii]["df"]["ti"].to_numpy()
+                ids = (ti > ti_range[0]) & (ti <= ti_range[1])
+                self.ti_range_ids[ii] = ids
+                self.subset_ids[ii] = None
 
         if (time_range is not None) and not (time_range == self.time_range):
             self.time_range = time_range
             for ii in df_ids:
-                df = self.df_list[ii]["df"]
-                ids = np.array([False for _ in range(df.shape[0])])
-                indices_out = fsato.find_window_in_time_array(
-                    df["time"], seek_time_windows=[list(time_range)]
+                self.time_range_ids[ii] = _get_time_range_mask(
+                    self.time_index[ii],
+                    self.df_list[ii]["df"].shape[0],
+                    time_range,
                 )
-                ids[indices_out[0]] = True
-                self.time_range_ids[ii] = ids
+                self.subset_ids[ii] = None
+
+    def get_subset_ids(self, ii):
+        """Return the row indices of the ii'th dataframe that lie within
+        all masks set through set_masks(). The masks are only combined
+        when this function is called, and the result is cached until the
+        masks change.
 
-        # Update masked dataframe(s)
-        for ii in df_ids:
+        Args:
+            ii ([int]): Dataset number/identifier
+
+        Returns:
+            subset_ids ([np.array]): Array with the (positional) row indices
+                of the masked data, in their original order.
+        """
+        if self.subset_ids[ii] is None:
             mask = (
                 (self.wd_range_ids[ii])
                 & (self.ws_range_ids[ii])
                 & (self.ti_range_ids[ii])
                 & (self.time_range_ids[ii])
             )
-            df_full = self.df_list[ii]["df"]
-            self.df_list[ii]["df_subset"] = df_full[mask]
+            self.subset_ids[ii] = np.flatnonzero(mask)
+        return self.subset_ids[ii]
+
+    def get_df_subset(self, ii, columns=None):
+        """Return the masked data of the ii'th dataframe. Rather than
+        storing a masked copy of every dataframe, the copy is made on
+        request and only for the columns of interest.
+
+        Args:
+            ii ([int]): Dataset number/identifier
+            columns ([iterable], optional): Columns to include. If None is
+                specified, returns all columns. Defaults to None.
+
+        Returns:
+            df_subset ([pd.DataFrame]): The masked dataframe.
+        """
+        df = self.df_list[ii]["df"]
+        ids = self.get_subset_ids(ii)
+        if columns is None:
+            if len(ids) == df.shape[0]:
+                return df.copy()  # No data masked away
+            return df.take(ids)
+
+        # Select the rows and columns at once, making a single copy
+        col_ids = np.flatnonzero(df.columns.isin(columns))
+        if len(ids) == df.shape[0]:
+            return df.take(col_ids, axis=1)  # No data masked away
+        return df.iloc[ids, col_ids]
+
+    def _get_df_subset_for_energy_ratio(self, ii, test_turbines):
+        """Masked data of the ii'th dataframe, limited to the columns
+        required to calculate the energy ratios of test_turbines."""
+        test_turbines = np.atleast_1d(test_turbines).astype(int)
+        columns = ["time", "wd", "ws", "ti", "pow_ref"]
+        columns += ["pow_{:03d}".format(t) for t in test_turbines]
+        return self.get_df_subset(ii, columns=columns)
 
     def set_turbine_names(self, turbine_names):
         """Assign turbine names/labels instead of just their index number.
@@ -315,6 +371,10 @@ class energy_ratio_suite:
         percentiles=[5.0, 95.0],
         balance_bins_between_dfs=True,
         return_detailed_output=False,
+        n_jobs=1,
+        seed=None,
+        uq_method="bootstrap",
+        block_length=None,
         verbose=True,
     ):
         """This is the main function used to calculate the energy ratios
@@ -386,8 +446,8 @@ class energy_ratio_suite:
                 Defaults to True.
             return_detailed_output (bool, optional): Also calculate and
                 return detailed energy ratio information useful for debugging
-                and figuring out flaws in the data. This slows down the
-                calculations but can be very useful. The additional info is
+                and figuring out flaws in the data. This takes a single
+                additional pass over the data. The additional info is
                 written to self.df_lists[i]["er_results_info_dict"]. The
                 dictionary variable therein contains two fields, being
                 "df_per_wd_bin" and "df_per_ws_bin". The first gives an
@@ -398,6 +458,22 @@ class energy_ratio_suite:
                 direction and wind speed bin, among others. This is
                 particularly helpful in figuring out if the bins are well
                 balanced. Defaults to False.
+            n_jobs (int, optional): Number of worker processes over which
+                the bootstrapping of the wind direction bins is distributed.
+                If n_jobs < 1, uses all available CPU cores. This value is
+                only relevant if N > 1 is specified. Defaults to 1.
+            seed (int or np.random.SeedSequence, optional): Seed for the
+                bootstrapping. A separate random stream is spawned from
+                this seed for every dataframe. Results are identical
+                regardless of n_jobs. If None, the seeds are drawn from
+                NumPy's global random state. Defaults to None.
+            uq_method (str, optional): Method for the uncertainty
+                quantification, either 'bootstrap' or 'analytic'. See
+                energy_ratio.get_energy_ratio(). Defaults to 'bootstrap'.
+            block_length (str or pd.Timedelta, optional): If specified,
+                the bootstrapping resamples contiguous blocks of time of
+                this length rather than individual data entries. See
+                energy_ratio.get_energy_ratio(). Defaults to None.
             verbose (bool, optional): Print to console. Defaults to True.
 
         Returns:
@@ -419,85 +495,80 @@ class energy_ratio_suite:
         # Define number of dataframes specified by user
         N_df = len(self.df_list)
 
-        # Load energy ratio class for dfs without bin frequency interpolant
+        # Load energy ratio class for every df and bin the data once
         era_list = [None for _ in range(N_df)]
         for ii in range(N_df):
-            df_subset = self.df_list[ii]["df_subset"]
-            era_list[ii] = er.energy_ratio(df_in=df_subset, verbose=verbose)
+            df_subset = self._get_df_subset_for_energy_ratio(
+                ii, test_turbines
+            )
+            era = er.energy_ratio(
+                df_in=df_subset, verbose=verbose, copy_df=False
+            )
+            era._set_test_turbines(test_turbines)
+            era._set_binning_properties(
+                ws_step=ws_step,
+                wd_step=wd_step,
+                wd_bin_width=wd_bin_width,
+                ws_bins=ws_bins,
+                wd_bins=wd_bins,
+            )
+            era._calculate_bins()
+            era._calculate_bin_sums()
+            era_list[ii] = era
 
+        bin_freq = None
         if balance_bins_between_dfs:
             # First check if necessary
             balance_bins_between_dfs = False
-            wd_ref = np.array(self.df_list[0]["df_subset"]["wd"])
-            ws_ref = np.array(self.df_list[0]["df_subset"]["ws"])
-            for d in self.df_list:
+            wd_ref = np.array(era_list[0].df["wd"])
+            ws_ref = np.array(era_list[0].df["ws"])
+            for era in era_list:
                 if (
-                    (not np.array_equal(wd_ref, d["df_subset"]["wd"])) or
-                    (not np.array_equal(ws_ref, d["df_subset"]["ws"]))
+                    (not np.array_equal(wd_ref, era.df["wd"])) or
+                    (not np.array_equal(ws_ref, era.df["ws"]))
                 ):
                     balance_bins_between_dfs = True
 
             if balance_bins_between_dfs:
                 print("Dataframes differ in wd and ws. Rebalancing.")
-                df_binned_list = [None for _ in range(N_df)]
-                for ii, era in enumerate(era_list):
-                    # Calculate how data would be binned in era
-                    era._set_test_turbines(test_turbines)
-                    era._set_binning_properties(
-                        ws_step=ws_step,
-                        wd_step=wd_step,
-                        wd_bin_width=wd_bin_width,
-                        ws_bins=ws_bins,
-                        wd_bins=wd_bins,
-                    )
-                    era._calculate_bins()
-
-                    # Extract dataframe and calculate bin counts
-                    df_binned = era.df[["wd_bin", "ws_bin"]].copy()
-                    df_binned["bin_count_df{:d}".format(ii)] = 1
-                    df_binned = df_binned.groupby(["wd_bin", "ws_bin"]).sum()
-                    df_binned_list[ii] = df_binned
-
-                # Now merge bin counts from each separate dataframe
-                df_binned_merged = pd.concat(df_binned_list, axis=1)
-                df_binned_merged = df_binned_merged.fillna(0).astype(int)
-
-                # Determine minimum bin count for every ws/wd
-                df_binned_merged["bin_count_balanced"] = (
-                    df_binned_merged.min(axis=1)
+                # The bins are identical for every df, so the balanced
+                # frequency of every bin is the minimum count over the dfs
+                bin_freq = np.min(
+                    [era.bin_freq_observed for era in era_list], axis=0
                 )
 
-                # Define a bin frequency interpolant. Can be nearest-neighbor
-                # since every data point from all dataframes is covered.
-                df_binned_merged = df_binned_merged.reset_index(drop=False)
-                freq_interpolant = NearestNDInterpolator(
-                    x=df_binned_merged[["wd_bin", "ws_bin"]],
-                    y=df_binned_merged["bin_count_balanced"],
-                )
-
-                # Assign frequency interpolant to each energy ratio object
-                for era in era_list:
-                    era._set_inflow_freq_interpolant(freq_interpolant)
-
             else:
                 print(
                     "Dataframes share underlying wd and ws." +
                     " Skipping rebalancing -- not necessary."
                 )
 
+        # Spawn an independent random stream for every dataframe
+        if seed is None:
+            seeds = [None for _ in range(N_df)]
+        else:
+            seeds = er._get_seed_sequence(seed).spawn(N_df)
+
         # Now calculate energy ratios using each object
         for ii, era in enumerate(era_list):
-            out = era.get_energy_ratio(
-                test_turbines=test_turbines,
-                wd_step=wd_step,
-                ws_step=ws_step,
-                wd_bin_width=wd_bin_width,
-                ws_bins=ws_bins,
-                wd_bins=wd_bins,
-                N=N,
-                percentiles=percentiles,
-                return_detailed_output=return_detailed_output,
-            )
+            if era.df_full.shape[0] < 1:
+                # Empty dataframe, nothing to calculate
+                out = era.get_energy_ratio(
+                    test_turbines=test_turbines,
+                    N=N,
+                    return_detailed_output=return_detailed_output,
+                )
+            else:
+                out = era._get_energy_ratio_from_bins(
+                    N=N,
+                    percentiles=percentiles,
+                    return_detailed_output=return_detailed_output,
+                    n_jobs=n_jobs,
+                    seed=seeds[ii],
+                    uq_method=uq_method,
+                    block_length=block_length,
+                    bin_freq=bin_freq,
+                )
 
             # Save each output to self
             if return_detailed_output:
@@ -510,6 +581,7 @@ class energy_ratio_suite:
             self.df_list[ii]["er_ws_step"] = ws_step
             self.df_list[ii]["er_wd_bin_width"] = era.wd_bin_width
             self.df_list[ii]["er_bootstrap_N"] = N
+            self.df_list[ii]["er_uq_method"] = uq_method
 
         return self.df_list
 
@@ -601,8 +673,12 @@ class energy_ratio_suite:
         # Load energy ratio class for dfs without bin frequency interpolant
         era_list = [None for _ in range(N_df)]
         for ii in range(N_df):
-            df_subset = self.df_list[ii]["df_subset"]
-            era_list[ii] = er.energy_ratio(df_in=df_subset, verbose=verbose)
+            df_subset = self._get_df_subset_for_energy_ratio(
+                ii, test_turbines
+            )
+            era_list[ii] = er.energy_ratio(
+                df_in=df_subset, verbose=verbose, copy_df=False
+            )
 
         # Now calculate energy ratios using fast method for each object
         for ii, era in enumerate(era_list):
@@ -625,6 +701,111 @@ class energy_ratio_suite:
 
         return self.df_list
 
+    def get_energy_ratio_uplift(
+        self,
+        test_turbines,
+        baseline_id=0,
+        controlled_id=1,
+        wd_step=3.0,
+        ws_step=5.0,
+        wd_bin_width=None,
+        ws_bins=None,
+        wd_bins=None,
+        N=1,
+        percentiles=[5.0, 95.0],
+        seed=None,
+        verbose=True,
+    ):
+        """Calculate the change in energy ratio between a baseline and a
+        controlled dataset, e.g., a period without and a period with wake
+        steering, for every wind direction bin and in total. The bins are
+        balanced between both datasets, with the frequency of every wind
+        direction and wind speed bin equal to the minimum number of valid
+        measurements among the two datasets. The uncertainty of the change
+        is quantified through a paired bootstrap, in which both datasets
+        are resampled within the same balanced bins in every draw, see
+        _get_uplift_paired_bootstrapping().
+
+        Args:
+            test_turbines ([iteratible]): List with the test turbine(s)
+                used to calculate the power production in the nominator of
+                the energy ratio equation.
+            baseline_id (int, optional): Index of the baseline dataframe.
+                Defaults to 0.
+            controlled_id (int, optional): Index of the controlled
+                dataframe. Defaults to 1.
+            wd_step, ws_step, wd_bin_width, ws_bins, wd_bins: Binning
+                properties, see get_energy_ratios().
+            N (int, optional): Number of bootstrap evaluations for
+                uncertainty quantification (UQ). If N=1, will not perform
+                any uncertainty quantification. Defaults to 1.
+            percentiles (list, optional): Confidence bounds for the
+                uncertainty quantification in percents. This value is only
+                relevant if N > 1 is specified. Defaults to [5., 95.].
+            seed (int, optional): Seed for the random generator used for
+                bootstrapping. Defaults to None.
+            verbose (bool, optional): Print to console. Defaults to True.
+
+        Returns:
+            df_uplift ([pd.DataFrame]): Dataframe with one row for every
+                wind direction bin with data in both datasets, containing
+                the columns:
+                    * wd_bin: The mean wind direction for this bin
+                    * bin_count: Balanced number of data entries in this bin
+                    * er_baseline: Energy ratio of the baseline dataset
+                    * er_controlled: Energy ratio of the controlled dataset
+                    * delta: Change in the energy ratio, er_controlled -
+                        er_baseline, with its bounds delta_lb and delta_ub
+                    * uplift: Relative change in the energy ratio in
+                        percent, with its bounds uplift_lb and uplift_ub
+            df_uplift_total ([pd.DataFrame]): Dataframe with a single row
+                with the same columns, except for 'wd_bin', for the energy
+                ratios over all wind direction and wind speed bins. Its
+                bin_count counts every entry once, also if it falls into
+                multiple overlapping wind direction bins.
+        """
+        # Bin both dataframes identically
+        era_list = []
+        for ii in [baseline_id, controlled_id]:
+            df_subset = self._get_df_subset_for_energy_ratio(
+                ii, test_turbines
+            )
+            era = er.energy_ratio(
+                df_in=df_subset, verbose=verbose, copy_df=False
+            )
+            era._set_test_turbines(test_turbines)
+            era._set_binning_properties(
+                ws_step=ws_step,
+                wd_step=wd_step,
+                wd_bin_width=wd_bin_width,
+                ws_bins=ws_bins,
+                wd_bins=wd_bins,
+            )
+            era._calculate_bins()
+            era._calculate_bin_sums()
+            era_list.append(era)
+
+        if verbose:
+            print(
+                "Calculating the energy ratio uplift of '%s' over '%s' "
+                "with N = %d." % (
+                    self.df_list[controlled_id]["name"],
+                    self.df_list[baseline_id]["name"],
+                    N,
+                )
+            )
+
+        # Balance the bins on the valid measurements of both dataframes
+        bin_freq = np.min([era.bin_count for era in era_list], axis=0)
+        return _get_uplift_paired_bootstrapping(
+            era_baseline=era_list[0],
+            era_controlled=era_list[1],
+            bin_freq=bin_freq,
+            N=N,
+            percentiles=percentiles,
+            seed=seed,
+        )
+
     def plot_energy_ratios(self, superimpose=True):
         """This function plots the energy ratios of each dataset against
         the wind direction, potentially with uncertainty bounds if N > 1
@@ -693,3 +874,178 @@ class energy_ratio_suite:
             hide_unbalanced_cols=hide_unbalanced_cols,
             fi=fi,
         )
+
+
+def _get_time_index(df):
+    """Sorted time index of a dataframe used to resolve time masks with a
+    binary search. Returns None if the dataframe has no 'time' column.
+
+    Args:
+        df ([pd.DataFrame]): Dataframe with a column 'time'.
+
+    Returns:
+        time_index ([tuple]): Tuple (time_sorted, order), with time_sorted
+            a pd.Index with the sorted, valid timestamps and order the row
+            indices corresponding to time_sorted. order is None if the time
+            array is already sorted and free of NaNs.
+    """
+    if "time" not in df.columns:
+        return None
+
+    time = pd.Index(df["time"])
+    if time.is_monotonic_increasing and not time.hasnans:
+        return time, None
+
+    valid_ids = np.flatnonzero(~time.isna())
+    order = valid_ids[np.argsort(time[valid_ids], kind="stable")]
+    return time[order], order
+
+
+def _get_time_range_mask(time_index, num_rows, time_range):
+    """Boolean mask of the rows with a timestamp within
+    [time_range[0], time_range[1]), resolved through a binary search on
+    the sorted time index produced by _get_time_index()."""
+    if time_index is None:
+        raise KeyError(
+            "time column not in dataframe. Cannot mask data based on time."
+        )
+
+    time_sorted, order = time_index
+    lb = time_sorted.searchsorted(time_range[0], side="left")
+    ub = time_sorted.searchsorted(time_range[1], side="left")
+
+    mask = np.zeros(num_rows, dtype=bool)
+    if order is None:
+        mask[lb:ub] = True
+    else:
+        mask[order[lb:ub]] = True
+    return mask
+
+
+def _get_uplift_paired_bootstrapping(
+    era_baseline,
+    era_controlled,
+    bin_freq,
+    N=1,
+    percentiles=[5.0, 95.0],
+    seed=None,
+    max_chunk_size=10_000_000,
+):
+    """Calculate the change in the balanced energy ratio between two
+    binned datasets, with confidence bounds from a paired bootstrap. In
+    every draw, both datasets are resampled within the same balanced
+    bins, see energy_ratio._get_bin_sums_resampled(), and the change in
+    energy ratio is evaluated for all wind direction bins and in total at
+    once. The draws are processed in chunks of at most max_chunk_size
+    resampled entries to limit memory usage.
+
+    Args:
+        era_baseline ([energy_ratio]): Binned baseline dataset, after
+            _calculate_bins() and _calculate_bin_sums() have been called.
+        era_controlled ([energy_ratio]): Binned controlled dataset, with
+            the same bins as era_baseline.
+        bin_freq ([np.array]): Array of shape (n_wd_bins, n_ws_bins) with
+            the balanced frequency of every bin.
+        N (int, optional): Number of bootstrap evaluations. Defaults to 1.
+        percentiles (list, optional): Confidence bounds in percents.
+            Defaults to [5., 95.].
+        seed (int, optional): Seed for the random generator. Defaults to
+            None.
+        max_chunk_size (int, optional): Maximum number of resampled entries
+            processed at once. Defaults to 10_000_000.
+
+    Returns:
+        df_uplift, df_uplift_total: See
+            energy_ratio_suite.get_energy_ratio_uplift().
+    """
+    era_list = [era_baseline, era_controlled]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        weights = [
+            np.where(era.bin_count > 0, bin_freq / era.bin_count, 0.0)
+            for era in era_list
+        ]
+
+    def get_energy_ratios(bin_sum_ref, bin_sum_test, weights):
+        # Energy ratio of every wind direction bin and over all bins
+        num = np.sum(weights * bin_sum_test, axis=-1)
+        den = np.sum(weights * bin_sum_ref, axis=-1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.concatenate(
+                [num / den, np.sum(num, -1, keepdims=True) /
+                 np.sum(den, -1, keepdims=True)],
+                axis=-1,
+            )
+
+    # Nominal energy ratios in the first draw, bootstrapped in the others
+    er_draws = [
+        np.zeros((N, bin_freq.shape[0] + 1)) for _ in range(len(era_list))
+    ]
+    for jj, era in enumerate(era_list):
+        er_draws[jj][0] = get_energy_ratios(
+            era.bin_sum_ref, era.bin_sum_test, weights[jj]
+        )
+
+    if N > 1:
+        rng = np.random.default_rng(er._get_seed_sequence(seed))
+        resamplers = [era._get_bin_sums_resampler() for era in era_list]
+        n_rows = np.sum([len(r["cell_idx"]) for r in resamplers])
+        chunk_size = int(np.max([1, max_chunk_size // np.max([n_rows, 1])]))
+        for i0 in range(1, N, chunk_size):
+            n_draws = np.min([chunk_size, N - i0])
+            for jj, era in enumerate(era_list):
+                bin_sum_ref, bin_sum_test = era._get_bin_sums_resampled(
+                    resamplers[jj], n_draws, rng
+                )
+                er_draws[jj][i0:i0 + n_draws] = get_energy_ratios(
+                    bin_sum_ref, bin_sum_test, weights[jj]
+                )
+
+    er_baseline, er_controlled = er_draws
+    with np.errstate(divide="ignore", invalid="ignore"):
+        delta = er_controlled - er_baseline
+        uplift = 100.0 * (er_controlled / er_baseline - 1.0)
+    uplift[~np.isfinite(uplift)] = np.nan  # Zero baseline energy ratios
+
+    # Balanced number of distinct entries over all bins. Since entries can
+    # fall into multiple overlapping wind direction bins, the entries are
+    # balanced per wind rose segment and wind speed bin instead.
+    seg_counts = []
+    for era in era_list:
+        seg_bin_idx = era._get_seg_bin_idx()
+        is_valid = np.array(era.df.notna().all(axis=1), dtype=bool)
+        seg_counts.append(np.bincount(
+            seg_bin_idx[is_valid & (seg_bin_idx >= 0)],
+            minlength=era.wd_seg_membership.shape[0] * bin_freq.shape[1],
+        ).reshape(-1, bin_freq.shape[1]))
+    in_wd_bin = np.any(era_baseline.wd_seg_membership, axis=1)
+    total_count = np.sum(np.min(seg_counts, axis=0)[in_wd_bin])
+
+    # Nominal values and bounds for every wind direction bin and in total
+    df_out = pd.DataFrame(
+        {
+            "bin_count": np.append(
+                np.sum(bin_freq, axis=1), total_count
+            ).astype(int),
+            "er_baseline": er_baseline[0],
+            "er_controlled": er_controlled[0],
+        }
+    )
+    for c, x in [("delta", delta), ("uplift", uplift)]:
+        df_out[c] = x[0]
+        if N > 1:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", category=RuntimeWarning)
+                bounds = np.nanpercentile(x, percentiles, axis=0)
+        else:
+            bounds = np.tile(x[0], (2, 1))
+        df_out[c + "_lb"] = bounds[0]
+        df_out[c + "_ub"] = bounds[1]
+
+    df_uplift_total = df_out.iloc[-1:].reset_index(drop=True)
+    df_uplift = df_out.iloc[:-1].copy()
+    df_uplift.insert(
+        0, "wd_bin", np.array(era_baseline.df_wd_bins["wd_bin"], dtype=float)
+    )
+    df_uplift = df_uplift[df_uplift["bin_count"] > 0]
+    df_uplift = df_uplift.sort_values(by="wd_bin", kind="stable")
+    return df_uplift.reset_index(drop=True), df_uplift_total
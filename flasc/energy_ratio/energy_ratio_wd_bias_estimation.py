@@ -11,16 +11,23 @@
 # the License.
 
 
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 import matplotlib.pyplot as plt
+import multiprocessing
 import numpy as np
 import os as os
+import pandas as pd
 from scipy import optimize as opt
+from scipy import sparse
 from scipy import stats as spst
 
 from floris.utilities import wrap_360
 
 from .. import floris_tools as ftools
 from ..utilities import printnow as print
+from ..energy_ratio import energy_ratio as er
+from ..energy_ratio import energy_ratio_binning as erb
 from ..energy_ratio import energy_ratio_suite
 
 
@@ -42,7 +49,8 @@ class bias_estimation():
         df_fi_approx,
         test_turbines_subset,
         df_ws_mapping_func,
-        df_pow_ref_mapping_func
+        df_pow_ref_mapping_func,
+        floris_cache_size=4,
     ):
         """Initialize the bias estimation class.
 
@@ -76,6 +84,14 @@ class bias_estimation():
             df_pow_ref_mapping_func ([type]): This is a function that
                 returns the reference power production based on an array of
                 wind directions as input.
+            floris_cache_size (int, optional): Number of wind direction
+                biases for which the shifted dataframe and its FLORIS
+                predictions are kept in memory, so that repeated
+                evaluations of the same bias, e.g., by the local search
+                of estimate_wd_bias(), are not recalculated. Only the
+                columns required for the energy ratios of the test
+                turbines are kept. Biases are rounded to 0.001 deg.
+                Defaults to 4.
         """
         print('Initializing a bias_estimation() object...')
 
@@ -86,6 +102,14 @@ class bias_estimation():
         self.df_pow_ref_mapping_func = df_pow_ref_mapping_func
         self.test_turbines_subset = test_turbines_subset
 
+        # Build the FLORIS surrogate once and cache its predictions
+        self._floris_interpolants = ftools.get_floris_approx_interpolants(
+            df_fi_approx
+        )
+        self._get_shifted_dataframes = lru_cache(maxsize=floris_cache_size)(
+            self._shift_dataframes
+        )
+
     # Private methods
 
     def _load_ersuites_for_wd_bias(
@@ -108,33 +132,18 @@ class bias_estimation():
             wd_bias ([float]): Hypothesized wind direction bias in degrees.
 
         Returns:
-            fsc ([energy_ratio_suite object]): The energy ratio suite
-                object in which the inserted dataframe has a shifted
-                wind direction measurement, offset by 'wd_bias' compared
-                to the nominal dataset.
+            fsc_list ([list]): List with an energy_ratio_suite object for
+                every test turbine, in which the inserted dataframe has a
+                shifted wind direction measurement, offset by 'wd_bias'
+                compared to the nominal dataset.
         """
         print('  Constructing energy ratio suites for wd_bias of %.2f deg.'
               % wd_bias)
 
         fsc_list = []
-        fsc_wd_bias_list = []
-
-        # Derive dataframe that covers all test_turbines
-        df_cor_all = self.df.copy()
-        df_cor_all['wd'] = wrap_360(df_cor_all['wd'] - wd_bias)
-
-        # Set columns 'ws' and 'pow_ref' for df_subset_cor
-        df_cor_all = self.df_ws_mapping_func(df_cor_all)
-        df_cor_all = self.df_pow_ref_mapping_func(df_cor_all)
-        df_cor_all = df_cor_all.dropna(subset=['wd', 'ws', 'pow_ref'])
-        df_cor_all = df_cor_all.reset_index(drop=True)
-
-        # Get FLORIS predictions
-        print('    Interpolating FLORIS predictions for dataframe.')
-        df_fi_all = df_cor_all[['time', 'wd', 'ws']].copy()
-        df_fi_all = ftools.interpolate_floris_from_df_approx(
-            df=df_fi_all, df_approx=self.df_fi_approx, verbose=False)
-        df_fi_all = self.df_pow_ref_mapping_func(df_fi_all)
+        df_cor_all, df_fi_all = self._get_shifted_dataframes(
+            np.round(float(np.squeeze(wd_bias)), 3)
+        )
 
         for ti in test_turbines:
             valid_entries = (
@@ -157,14 +166,56 @@ class bias_estimation():
             )
 
             fsc_list.append(fsc)
-            fsc_wd_bias_list.append(wd_bias)
 
-        # Save to self
-        self.fsc_list = fsc_list
-        self.fsc_wd_bias_list = fsc_wd_bias_list
-        self.fsc_test_turbine_list = test_turbines
+        return fsc_list
 
-    def _get_energy_ratios_allbins(
+    def _shift_dataframes(self, wd_bias):
+        """Shift the wind direction measurements by wd_bias and interpolate
+        the FLORIS predictions for the shifted dataframe. This function is
+        memoized by _get_shifted_dataframes() in __init__, so the returned
+        dataframes must not be modified.
+
+        Args:
+            wd_bias ([float]): Hypothesized wind direction bias in degrees.
+
+        Returns:
+            df_cor_all ([pd.DataFrame]): The dataframe with the corrected
+                wind direction and the mapped reference wind speed and
+                power production, limited to the columns required for the
+                energy ratios of the test turbines.
+            df_fi_all ([pd.DataFrame]): The FLORIS predictions for
+                df_cor_all, limited to the same columns.
+        """
+        # Derive dataframe that covers all test_turbines
+        df_cor_all = self.df.copy()
+        df_cor_all['wd'] = wrap_360(df_cor_all['wd'] - wd_bias)
+
+        # Set columns 'ws' and 'pow_ref' for df_subset_cor
+        df_cor_all = self.df_ws_mapping_func(df_cor_all)
+        df_cor_all = self.df_pow_ref_mapping_func(df_cor_all)
+        df_cor_all = df_cor_all.dropna(subset=['wd', 'ws', 'pow_ref'])
+        df_cor_all = df_cor_all.reset_index(drop=True)
+
+        # Get FLORIS predictions
+        print('    Interpolating FLORIS predictions for dataframe.')
+        df_fi_all = df_cor_all[['time', 'wd', 'ws']].copy()
+        df_fi_all = ftools.interpolate_floris_from_df_approx(
+            df=df_fi_all,
+            df_approx=self.df_fi_approx,
+            verbose=False,
+            interpolants=self._floris_interpolants,
+        )
+        df_fi_all = self.df_pow_ref_mapping_func(df_fi_all)
+
+        # Only keep the columns needed for the energy ratios
+        cols = ['time', 'wd', 'ws', 'ti', 'pow_ref']
+        cols += ['pow_{:03d}'.format(ti) for ti in self.test_turbines_subset]
+        df_cor_all = df_cor_all[[c for c in cols if c in df_cor_all.columns]]
+        df_fi_all = df_fi_all[[c for c in cols if c in df_fi_all.columns]]
+
+        return df_cor_all, df_fi_all
+
+    def _get_energy_ratios_for_wd_bias(
         self,
         wd_bias,
         time_mask=None,
@@ -175,43 +226,29 @@ class bias_estimation():
         ws_step=1.0,
         wd_bin_width=3.0,
         N_btstrp=1,
-        plot_iter_path=None,
         fast=True,
     ):
-        """Calculate the energy ratios for the energy_ratio_suite objects
-        contained in 'self.fsc_list'.
+        """Calculate the energy ratios of the SCADA data and of the FLORIS
+        predictions for every test turbine under a hypothesized wind
+        direction bias, by rebuilding the energy ratio suites. This
+        function does not modify the class, so it can be used as a cost
+        function evaluation. See _get_energy_ratios_allbins() for the
+        arguments.
 
-        Args:
-            wd_step (float, optional): Wind direction discretization step
-                size. This defines for what wind directions the energy ratio
-                is to be calculated. Note that this does not necessarily
-                also mean each bin has a width of this value. Namely, the
-                bin width can be specified separately. Defaults to 2.0.
-            ws_step (float, optional): Wind speed discretization step size.
-                This defines the resolution and widths of the wind speed
-                bins. Defaults to 1.0.
-            wd_bin_width ([type], optional): The wind direction bin width.
-                This value should be equal or larger than wd_step. When no
-                value is specified, will default to wd_bin_width = wd_step.
-                In the literature, it is not uncommon to specify a bin width
-                larger than the step size to cover for variability in the
-                wind direction measurements. By setting a large value for
-                wd_bin_width, one gets a better idea of the larger-scale
-                wake losses in the wind farm. Defaults to None.
-            N_btstrp (int, optional): Number of bootstrap evaluations for
-                uncertainty quantification (UQ). If N_btstrp=1, will not
-                perform any uncertainty quantification. Defaults to 1.
-            plot_iter_path ([type], optional): Path to save figures of the
-                energy ratios of each iteration to. If not specified, will
-                not plot or save any figures of iterations. Defaults to
-                None.
+        Returns:
+            fsc_list ([list]): List with an energy_ratio_suite object for
+                every test turbine.
+            energy_ratios_scada ([list]): List with the energy ratios of
+                the SCADA data for every test turbine.
+            energy_ratios_floris ([list]): List with the energy ratios of
+                the FLORIS predictions for every test turbine.
         """
         test_turbines = self.test_turbines_subset
         energy_ratios_scada = [[] for _ in test_turbines]
         energy_ratios_floris = [[] for _ in test_turbines]
 
         print("    Initializing energy ratio suites.")
-        self._load_ersuites_for_wd_bias(
+        fsc_list = self._load_ersuites_for_wd_bias(
             wd_bias=wd_bias,
             test_turbines=test_turbines,
             time_mask=time_mask,
@@ -222,8 +259,8 @@ class bias_estimation():
 
         for ii, ti in enumerate(test_turbines):
             print('    Determining energy ratios for test turbine = %03d.'
-                  % (ti) + ' WD bias: %.3f deg.' % self.fsc_wd_bias_list[ii])
-            fsc = self.fsc_list[ii]
+                  % (ti) + ' WD bias: %.3f deg.' % wd_bias)
+            fsc = fsc_list[ii]
             if fast == True:
                 fsc.get_energy_ratios_fast(
                     test_turbines=[ti],
@@ -245,22 +282,229 @@ class bias_estimation():
             energy_ratios_scada[ii] = fsc.df_list[0]['er_results']
             energy_ratios_floris[ii] = fsc.df_list[1]['er_results']
 
+        return fsc_list, energy_ratios_scada, energy_ratios_floris
+
+    def _get_energy_ratios_allbins(
+        self,
+        wd_bias,
+        time_mask=None,
+        ws_mask=(6.0, 10.0),
+        wd_mask=None,
+        ti_mask=None,
+        wd_step=3.0,
+        ws_step=1.0,
+        wd_bin_width=3.0,
+        N_btstrp=1,
+        plot_iter_path=None,
+        fast=True,
+    ):
+        """Calculate the energy ratios for the energy_ratio_suite objects
+        contained in 'self.fsc_list'.
+
+        Args:
+            wd_step (float, optional): Wind direction discretization step
+                size. This defines for what wind directions the energy ratio
+                is to be calculated. Note that this does not necessarily
+                also mean each bin has a width of this value. Namely, the
+                bin width can be specified separately. Defaults to 2.0.
+            ws_step (float, optional): Wind speed discretization step size.
+                This defines the resolution and widths of the wind speed
+                bins. Defaults to 1.0.
+            wd_bin_width ([type], optional): The wind direction bin width.
+                This value should be equal or larger than wd_step. When no
+                value is specified, will default to wd_bin_width = wd_step.
+                In the literature, it is not uncommon to specify a bin width
+                larger than the step size to cover for variability in the
+                wind direction measurements. By setting a large value for
+                wd_bin_width, one gets a better idea of the larger-scale
+                wake losses in the wind farm. Defaults to None.
+            N_btstrp (int, optional): Number of bootstrap evaluations for
+                uncertainty quantification (UQ). If N_btstrp=1, will not
+                perform any uncertainty quantification. Defaults to 1.
+            plot_iter_path ([type], optional): Path to save figures of the
+                energy ratios of each iteration to. If not specified, will
+                not plot or save any figures of iterations. Defaults to
+                None.
+        """
+        fsc_list, energy_ratios_scada, energy_ratios_floris = (
+            self._get_energy_ratios_for_wd_bias(
+                wd_bias=wd_bias,
+                time_mask=time_mask,
+                ws_mask=ws_mask,
+                wd_mask=wd_mask,
+                ti_mask=ti_mask,
+                wd_step=wd_step,
+                ws_step=ws_step,
+                wd_bin_width=wd_bin_width,
+                N_btstrp=N_btstrp,
+                fast=fast,
+            )
+        )
+
+        # Save to self
+        self.fsc_list = fsc_list
+        self.fsc_wd_bias_list = [wd_bias for _ in fsc_list]
+        self.fsc_test_turbine_list = self.test_turbines_subset
+        self.energy_ratios_scada = energy_ratios_scada
+        self.energy_ratios_floris = energy_ratios_floris
+
         # Debugging: plot iteration to path
         if plot_iter_path is not None:
             print('    Plotting energy ratios and saving figures')
             fp = os.path.join(
                 plot_iter_path,
-                "bias%+.3f" % (self.fsc_wd_bias_list[ii]),
+                "bias%+.3f" % (wd_bias),
                 "energy_ratios_test_turbine")
             self.plot_energy_ratios(save_path=fp, format='png', dpi=200)
             plt.close('all')
 
-        # Save to self
-        self.energy_ratios_scada = energy_ratios_scada
-        self.energy_ratios_floris = energy_ratios_floris
-
         return None
 
+    def _get_fine_histograms(
+        self,
+        time_mask=None,
+        ws_mask=(6.0, 10.0),
+        ti_mask=None,
+        wd_resolution=0.1,
+        ws_resolution=0.1,
+        max_segments=180,
+    ):
+        """This function bins the SCADA data once into fine wind direction
+        bins of width wd_resolution, summing the number of valid entries and
+        the reference and test power productions of every test turbine in
+        every bin. Additionally, the number of valid entries is counted per
+        fine wind direction and wind speed bin, and the FLORIS predictions
+        are evaluated on the grid of fine bin centers. A hypothesized wind
+        direction bias is then a circular shift of these histograms, see
+        _get_energy_ratios_from_fine_histograms(). The histograms are
+        cached for the masks and resolutions specified.
+
+        The reference wind speed and power production are mapped once for
+        every segment of consecutive fine wind direction bins over which
+        the mapping does not change, see _get_wd_mapping_segments(), rather
+        than for the wind directions corrected for every bias. A fixed set
+        of reference turbines yields a single segment, while mapping
+        functions that select, e.g., the upstream turbines by wind
+        direction yield a segment for every set of upstream turbines. The
+        histograms then have a leading axis over the segments, and the fine
+        bins of every corrected wind direction are taken from the
+        histograms of the segment it falls in.
+
+        Args:
+            time_mask, ws_mask, ti_mask: See estimate_wd_bias().
+            wd_resolution (float, optional): Width of the fine wind
+                direction bins in deg. Must divide 360 deg. Defaults to 0.1.
+            ws_resolution (float, optional): Width of the fine wind speed
+                bins in m/s over which the FLORIS predictions are evaluated.
+                Defaults to 0.1.
+            max_segments (int, optional): Maximum number of wind direction
+                segments of the mapping. The memory of the histograms grows
+                linearly with the number of segments, and a mapping that
+                changes continuously with the wind direction yields a
+                segment for every fine bin. Defaults to 180.
+
+        Raises:
+            ValueError: This error is raised if the reference wind speed or
+                power production mapping changes in more than
+                max_segments wind direction segments.
+
+        Returns:
+            hist ([dict]): Dictionary with the fine histograms.
+        """
+        key = (
+            None if time_mask is None else tuple(time_mask),
+            None if ws_mask is None else tuple(ws_mask),
+            None if ti_mask is None else tuple(ti_mask),
+            wd_resolution,
+            ws_resolution,
+        )
+        hist = getattr(self, "_fine_histograms", None)
+        if (hist is not None) and (hist["key"] == key):
+            return hist
+
+        n_wd = _get_num_fine_wd_bins(wd_resolution)
+        wd_segment, wd_segment_map = _get_wd_mapping_segments(
+            df=self.df,
+            df_ws_mapping_func=self.df_ws_mapping_func,
+            df_pow_ref_mapping_func=self.df_pow_ref_mapping_func,
+            wd_resolution=wd_resolution,
+        )
+        if len(wd_segment_map) > max_segments:
+            raise ValueError(
+                "The reference wind speed or power production mapping " +
+                "changes in {:d} wind direction ".format(len(wd_segment_map)) +
+                "segments, more than max_segments. Use " +
+                "use_fine_histograms=False instead."
+            )
+
+        # Map the reference wind speed and power production once for every
+        # wind direction segment
+        test_turbines = self.test_turbines_subset
+        cols = ['wd', 'ws', 'pow_ref']
+        cols += ['pow_{:03d}'.format(ti) for ti in test_turbines]
+        print('  Mapping the SCADA data for %d wind direction segments.'
+              % len(wd_segment_map))
+        df_list = [
+            _map_and_mask_df(
+                df=self.df,
+                df_ws_mapping_func=self.df_ws_mapping_func,
+                df_pow_ref_mapping_func=self.df_pow_ref_mapping_func,
+                time_mask=time_mask,
+                ws_mask=ws_mask,
+                ti_mask=ti_mask,
+                wd=(None if len(wd_segment_map) == 1 else wd_map),
+            )[cols]
+            for wd_map in wd_segment_map
+        ]
+        ws = np.concatenate([np.array(df['ws'], dtype=float) for df in df_list])
+        ws_min, n_ws = _get_fine_ws_grid(ws, ws_resolution)
+
+        print('  Binning the SCADA data into fine wind direction bins.')
+        scada_sums = []
+        floris_count = []
+        for df in df_list:
+            sums, count = _get_fine_scada_histograms(
+                df=df,
+                test_turbines=test_turbines,
+                wd_resolution=wd_resolution,
+                ws_min=ws_min,
+                ws_resolution=ws_resolution,
+                n_ws=n_ws,
+            )
+            scada_sums.append(sums)
+            floris_count.append(count)
+
+        # FLORIS predictions on the grid of fine bin centers
+        print('  Interpolating FLORIS predictions on the fine grid.')
+        df_fi = _get_floris_fine_grid(
+            df_fi_approx=self.df_fi_approx,
+            interpolants=self._floris_interpolants,
+            wd_resolution=wd_resolution,
+            ws_min=ws_min,
+            ws_resolution=ws_resolution,
+            n_ws=n_ws,
+        )
+        df_fi = self.df_pow_ref_mapping_func(df_fi)
+        floris_pow_ref = np.array(df_fi['pow_ref'], dtype=float)
+        floris_pow_test = np.array(
+            df_fi[['pow_{:03d}'.format(ti) for ti in test_turbines]],
+            dtype=float,
+        )
+
+        hist = {
+            "key": key,
+            "wd_resolution": wd_resolution,
+            "wd_segment": wd_segment,
+            "scada_sums": np.array(scada_sums),
+            "floris_count": np.array(floris_count),
+            "floris_pow_ref": floris_pow_ref.reshape(n_wd, n_ws),
+            "floris_pow_test": np.moveaxis(
+                floris_pow_test.reshape(n_wd, n_ws, -1), -1, 0
+            ),
+        }
+        self._fine_histograms = hist
+        return hist
+
     # Public methods
 
     def calculate_baseline(
@@ -301,6 +545,9 @@ class bias_estimation():
         er_wd_bin_width=None,
         er_N_btstrp=1,
         plot_iter_path=None,
+        use_fine_histograms=False,
+        wd_resolution=0.1,
+        ws_resolution=0.1,
     ):
         """Estimate the wind direction bias by comparing the SCADA data
         under various wind direction corrections to its FLORIS predictions.
@@ -329,6 +576,16 @@ class bias_estimation():
                 direction offsets to consider. Defaults to (-180., 180.).
             opt_search_brute_dx (float, optional): Number of points to
                 discretize the search space over. Defaults to 5.
+            opt_workers (int, optional): Number of worker processes over
+                which the cost function evaluations of the brute force
+                search are distributed. The fine histograms are shared with
+                the workers through shared memory. Without fine histograms,
+                the workers are forked from the current process so that
+                they inherit the data and mapping functions, which is only
+                supported on platforms with the 'fork' start method; on
+                other platforms and when plot_iter_path is specified, the
+                biases are evaluated sequentially. If opt_workers < 1, uses
+                all available CPU cores. Defaults to 4.
             er_wd_step (float, optional): Wind direction discretization step
                 size. This defines for what wind directions the energy ratio
                 is to be calculated. Note that this does not necessarily
@@ -352,6 +609,22 @@ class bias_estimation():
                 energy ratios of each iteration to. If not specified, will
                 not plot or save any figures of iterations. Defaults to
                 None.
+            use_fine_histograms (bool, optional): Evaluate the cost function
+                from fine wind direction histograms that are built once, see
+                _get_fine_histograms(), rather than rebuilding the energy
+                ratio suites for every wind direction bias. This is much
+                faster, but maps the reference wind speed and power
+                production only once for every wind direction segment over
+                which the mapping does not change, and rounds the
+                evaluated biases to wd_resolution. The optimal solution is
+                always evaluated on the rebuilt energy ratio suites.
+                Ignored if plot_iter_path is specified. Defaults to False.
+            wd_resolution (float, optional): Resolution of the fine wind
+                direction histograms in deg, to which the evaluated wind
+                direction biases are rounded. Defaults to 0.1.
+            ws_resolution (float, optional): Wind speed resolution in m/s of
+                the FLORIS predictions for the fine histograms. Defaults to
+                0.1.
 
         Returns:
             x_opt ([float]): Optimal wind direction offset.
@@ -359,56 +632,94 @@ class bias_estimation():
         """
         print('Estimating the wind direction bias')
 
-        def cost_fun(wd_bias):
-            self._get_energy_ratios_allbins(
-                wd_bias=wd_bias,
+        use_fine_histograms = use_fine_histograms and (plot_iter_path is None)
+        if use_fine_histograms:
+            hist = self._get_fine_histograms(
                 time_mask=time_mask,
                 ws_mask=ws_mask,
-                wd_mask=wd_mask,
                 ti_mask=ti_mask,
-                wd_step=er_wd_step,
-                ws_step=er_ws_step,
-                wd_bin_width=er_wd_bin_width,
-                plot_iter_path=plot_iter_path,
-                fast=True,
+                wd_resolution=wd_resolution,
+                ws_resolution=ws_resolution,
             )
 
-            # Unpack variables
-            energy_ratios_scada = self.energy_ratios_scada
-            energy_ratios_floris = self.energy_ratios_floris
-
-            # Calculate cost
-            cost_array = np.full(len(energy_ratios_scada), np.nan)
-            for ii in range(len(energy_ratios_scada)):
-                y_scada = np.array(energy_ratios_scada[ii]['baseline'])
-                y_floris = np.array(energy_ratios_floris[ii]['baseline'])
-                ids = ~np.isnan(y_scada) & ~np.isnan(y_floris)
-                if np.sum(ids) > 5:  # At least 6 valid data entries
-                    r, _ = spst.pearsonr(y_scada[ids], y_floris[ids])
-                else:
-                    r = np.nan
-                cost_array[ii] = -1. * r
-
-            cost = np.nanmean(cost_array)
-            return cost
-
-        opt_finish = (
-            lambda func, x0, args=(): opt.fmin(func, x0, args,
-                                               maxfun=10,
-                                               full_output=True,
-                                               xtol=0.1, disp=True)
-        )
+        def task(wd_bias):
+            return (wd_bias, wd_resolution, wd_mask, er_wd_step,
+                    er_wd_bin_width)
 
+        def cost_fun(wd_bias):
+            if use_fine_histograms:
+                return _get_wd_bias_cost_fine_histograms(task(wd_bias), hist)
+            if plot_iter_path is not None:
+                self._get_energy_ratios_allbins(
+                    wd_bias=wd_bias,
+                    time_mask=time_mask,
+                    ws_mask=ws_mask,
+                    wd_mask=wd_mask,
+                    ti_mask=ti_mask,
+                    wd_step=er_wd_step,
+                    ws_step=er_ws_step,
+                    wd_bin_width=er_wd_bin_width,
+                    plot_iter_path=plot_iter_path,
+                    fast=True,
+                )
+                energy_ratios_scada = self.energy_ratios_scada
+                energy_ratios_floris = self.energy_ratios_floris
+            else:
+                _, energy_ratios_scada, energy_ratios_floris = (
+                    self._get_energy_ratios_for_wd_bias(
+                        wd_bias=wd_bias,
+                        time_mask=time_mask,
+                        ws_mask=ws_mask,
+                        wd_mask=wd_mask,
+                        ti_mask=ti_mask,
+                        wd_step=er_wd_step,
+                        ws_step=er_ws_step,
+                        wd_bin_width=er_wd_bin_width,
+                        fast=True,
+                    )
+                )
+            return _get_wd_bias_cost(
+                [er['baseline'] for er in energy_ratios_scada],
+                [er['baseline'] for er in energy_ratios_floris],
+            )
+
+        # Brute force search over a grid of wind direction biases
         dran = opt_search_range[1]-opt_search_range[0]
-        x_opt, J_opt, x, J = opt.brute(
-            func=cost_fun,
-            ranges=[opt_search_range],
-            Ns=int(np.ceil(dran/opt_search_brute_dx) + 1),
-            full_output=True,
-            disp=True,
-            finish=opt_finish,
-            # workers=opt_workers,
+        x = np.linspace(
+            opt_search_range[0],
+            opt_search_range[1],
+            int(np.ceil(dran/opt_search_brute_dx) + 1),
         )
+        if (opt_workers is None) or (opt_workers < 1):
+            opt_workers = os.cpu_count()
+        if use_fine_histograms and (opt_workers > 1) and (len(x) > 1):
+            print('  Evaluating %d wind direction biases on %d workers.'
+                  % (len(x), opt_workers))
+            arrays = {
+                k: v for k, v in hist.items() if isinstance(v, np.ndarray)
+            }
+            J = np.array(er._run_tasks_parallel(
+                _get_wd_bias_cost_fine_histograms,
+                [task(wd_bias) for wd_bias in x],
+                arrays,
+                opt_workers,
+            ))
+        elif (
+            (plot_iter_path is None) and (opt_workers > 1) and (len(x) > 1)
+            and ("fork" in multiprocessing.get_all_start_methods())
+        ):
+            print('  Evaluating %d wind direction biases on %d workers.'
+                  % (len(x), opt_workers))
+            J = np.array(_run_tasks_forked(cost_fun, x, opt_workers))
+        else:
+            J = np.array([cost_fun(wd_bias) for wd_bias in x])
+
+        # Refine the best solution on the grid with a local search
+        x0 = x[np.nanargmin(J)] if np.any(~np.isnan(J)) else x[0]
+        x_opt, J_opt = opt.fmin(
+            cost_fun, np.array([x0]), maxfun=10, full_output=True,
+            xtol=0.1, disp=True
+        )[0:2]
 
         wd_bias = x_opt
         self.opt_wd_bias = wd_bias
@@ -457,3 +768,770 @@ class bias_estimation():
             ax_list.append(ax)
 
         return fig_list, ax_list
+
+
+class farm_bias_estimation():
+    """This class estimates the wind direction bias (northing offset) of
+    the wind direction measurements of many turbines together. Like
+    bias_estimation, the bias of every reference turbine maximizes the
+    Pearson correlation coefficient between the energy ratios of the SCADA
+    data and of the FLORIS predictions of its test turbines, where the
+    wind direction is taken from the measurement of the reference turbine.
+    The SCADA data of every reference turbine is binned once into fine
+    wind direction histograms and the FLORIS predictions are evaluated
+    once on the grid of fine bin centers for all turbines, after which
+    the cost function is evaluated for all turbines and all candidate
+    biases as a (turbines x biases) matrix.
+
+    Since the SCADA data is mapped only once, for the measured wind
+    directions, the reference wind speed and power production mappings
+    must not depend on the wind direction. Mappings that, e.g., select
+    the upstream turbines by wind direction are rejected with a
+    ValueError; use bias_estimation for such mappings instead.
+    """
+    def __init__(
+        self,
+        df,
+        df_fi_approx,
+        ref_turbines,
+        test_turbines_subsets,
+        df_ws_mapping_funcs,
+        df_pow_ref_mapping_funcs,
+    ):
+        """Initialize the farm bias estimation class.
+
+        Args:
+            df ([pd.DataFrame]): Dataframe with the SCADA data measurements
+                formatted in the generic format. The dataframe should contain
+                at the minimum the wind direction measurement of every
+                reference turbine, wd_000, wd_001, ..., and the power
+                production of every turbine, pow_000, pow_001, ...
+            df_fi_approx ([pd.DataFrame]): Dataframe containing a large set
+                of precomputed solutions of the FLORIS model, see
+                bias_estimation.
+            ref_turbines ([iterable]): List of turbines of which the wind
+                direction measurement is calibrated.
+            test_turbines_subsets ([iterable]): List with, for every
+                reference turbine, the list of test turbines for which the
+                energy ratios are compared to those of FLORIS, like
+                test_turbines_subset in bias_estimation.
+            df_ws_mapping_funcs ([function or list]): Function that sets the
+                reference wind speed 'ws' of a dataframe, or a list with
+                such a function for every reference turbine. The mapping
+                must not depend on the wind direction 'wd'.
+            df_pow_ref_mapping_funcs ([function or list]): Function that
+                sets the reference power production 'pow_ref' of a
+                dataframe, or a list with such a function for every
+                reference turbine. The mapping must not depend on the wind
+                direction 'wd'.
+        """
+        print('Initializing a farm_bias_estimation() object...')
+
+        ref_turbines = list(ref_turbines)
+        if callable(df_ws_mapping_funcs):
+            df_ws_mapping_funcs = [df_ws_mapping_funcs] * len(ref_turbines)
+        if callable(df_pow_ref_mapping_funcs):
+            df_pow_ref_mapping_funcs = (
+                [df_pow_ref_mapping_funcs] * len(ref_turbines)
+            )
+        if not (
+            len(ref_turbines) ==
+            len(test_turbines_subsets) ==
+            len(df_ws_mapping_funcs) ==
+            len(df_pow_ref_mapping_funcs)
+        ):
+            raise ValueError(
+                "Specify the test turbines and mapping functions for " +
+                "every reference turbine."
+            )
+
+        # Import inputs
+        self.df = df.reset_index(drop=('time' in df.columns))
+        self.df_fi_approx = df_fi_approx
+        self.ref_turbines = ref_turbines
+        self.test_turbines_subsets = [list(t) for t in test_turbines_subsets]
+        self.df_ws_mapping_funcs = df_ws_mapping_funcs
+        self.df_pow_ref_mapping_funcs = df_pow_ref_mapping_funcs
+
+        # Build the FLORIS surrogate once
+        self._floris_interpolants = ftools.get_floris_approx_interpolants(
+            df_fi_approx
+        )
+
+    # Private methods
+
+    def _get_fine_histograms(
+        self,
+        time_mask=None,
+        ws_mask=(6.0, 10.0),
+        ti_mask=None,
+        wd_resolution=0.1,
+        ws_resolution=0.5,
+    ):
+        """Bin the SCADA data of every reference turbine into fine wind
+        direction bins, see bias_estimation._get_fine_histograms(). Every
+        pair of a reference turbine and one of its test turbines is a row
+        of the histograms, and the FLORIS predictions are evaluated on a
+        single grid of fine bin centers shared by all rows. The histograms
+        are cached for the masks and resolutions specified.
+
+        Raises:
+            ValueError: This error is raised if the reference wind speed or
+                power production mapping of a reference turbine depends on
+                the wind direction.
+
+        Returns:
+            hist ([dict]): Dictionary with the fine histograms, in which
+                'row_ref' holds the index of the reference turbine of
+                every row.
+        """
+        key = (
+            None if time_mask is None else tuple(time_mask),
+            None if ws_mask is None else tuple(ws_mask),
+            None if ti_mask is None else tuple(ti_mask),
+            wd_resolution,
+            ws_resolution,
+        )
+        hist = getattr(self, "_fine_histograms", None)
+        if (hist is not None) and (hist["key"] == key):
+            return hist
+
+        n_wd = _get_num_fine_wd_bins(wd_resolution)
+
+        # Map the reference wind speed and power production of every
+        # reference turbine for its own wind direction measurement
+        print('  Mapping the SCADA data of %d reference turbines.'
+              % len(self.ref_turbines))
+        df_list = []
+        for ii, ti in enumerate(self.ref_turbines):
+            test_turbines = self.test_turbines_subsets[ii]
+            cols = ['pow_{:03d}'.format(t) for t in test_turbines]
+            df = self.df.copy()
+            df['wd'] = df['wd_{:03d}'.format(ti)]
+            if _is_wd_dependent_mapping(
+                df,
+                self.df_ws_mapping_funcs[ii],
+                self.df_pow_ref_mapping_funcs[ii],
+            ):
+                raise ValueError(
+                    "The mapping functions of reference turbine " +
+                    "{:03d} depend on the wind direction, ".format(ti) +
+                    "which farm_bias_estimation does not support. Use " +
+                    "bias_estimation instead."
+                )
+            df = _map_and_mask_df(
+                df=df,
+                df_ws_mapping_func=self.df_ws_mapping_funcs[ii],
+                df_pow_ref_mapping_func=self.df_pow_ref_mapping_funcs[ii],
+                time_mask=time_mask,
+                ws_mask=ws_mask,
+                ti_mask=ti_mask,
+            )
+            df_list.append(df[['wd', 'ws', 'pow_ref'] + cols])
+
+        # A single wind speed grid covering all reference turbines
+        ws = np.concatenate([np.array(df['ws'], dtype=float) for df in df_list])
+        ws_min, n_ws = _get_fine_ws_grid(ws, ws_resolution)
+
+        print('  Binning the SCADA data into fine wind direction bins.')
+        scada_sums = []
+        floris_count = []
+        for ii, df in enumerate(df_list):
+            sums, count = _get_fine_scada_histograms(
+                df=df,
+                test_turbines=self.test_turbines_subsets[ii],
+                wd_resolution=wd_resolution,
+                ws_min=ws_min,
+                ws_resolution=ws_resolution,
+                n_ws=n_ws,
+            )
+            scada_sums.append(sums)
+            floris_count.append(count)
+        row_ref = np.repeat(
+            np.arange(len(self.ref_turbines)),
+            [len(t) for t in self.test_turbines_subsets],
+        )
+        row_test = np.concatenate(self.test_turbines_subsets).astype(int)
+
+        # FLORIS predictions on the grid of fine bin centers, with the
+        # reference power production of every reference turbine
+        print('  Interpolating FLORIS predictions on the fine grid.')
+        df_fi = _get_floris_fine_grid(
+            df_fi_approx=self.df_fi_approx,
+            interpolants=self._floris_interpolants,
+            wd_resolution=wd_resolution,
+            ws_min=ws_min,
+            ws_resolution=ws_resolution,
+            n_ws=n_ws,
+        )
+        floris_pow_ref = np.array([
+            np.array(func(df_fi.copy())['pow_ref'], dtype=float)
+            for func in self.df_pow_ref_mapping_funcs
+        ])
+        floris_pow_test = np.array(
+            df_fi[['pow_{:03d}'.format(t) for t in row_test]],
+            dtype=float,
+        )
+
+        hist = {
+            "key": key,
+            "wd_resolution": wd_resolution,
+            "row_ref": row_ref,
+            "wd_segment": np.zeros(n_wd, dtype=int),
+            "scada_sums": np.concatenate(scada_sums, axis=0)[None],
+            "floris_count": np.concatenate(floris_count, axis=0)[None],
+            "floris_pow_ref": floris_pow_ref[row_ref].reshape(-1, n_wd, n_ws),
+            "floris_pow_test": np.moveaxis(
+                floris_pow_test.reshape(n_wd, n_ws, -1), -1, 0
+            ),
+        }
+        self._fine_histograms = hist
+        return hist
+
+    # Public methods
+
+    def estimate_wd_bias(
+        self,
+        time_mask=None,
+        ws_mask=(6.0, 10.0),
+        wd_mask=None,
+        ti_mask=None,
+        opt_search_range=(-180.0, 180.0),
+        opt_search_brute_dx=5.0,
+        opt_search_refine_dx=0.1,
+        er_wd_step=3.0,
+        er_wd_bin_width=None,
+        wd_resolution=0.1,
+        ws_resolution=0.5,
+    ):
+        """Estimate the wind direction bias of every reference turbine by
+        a brute force search over a grid of biases, followed by a finer
+        grid search around the best bias of every turbine. All turbines
+        are evaluated together from the fine histograms, see
+        _get_fine_histograms().
+
+        Args:
+            time_mask, ws_mask, wd_mask, ti_mask: See
+                bias_estimation.estimate_wd_bias().
+            opt_search_range (tuple, optional): Search range for the wind
+                direction biases to consider. Defaults to (-180., 180.).
+            opt_search_brute_dx (float, optional): Step size of the brute
+                force search in deg. Defaults to 5.0.
+            opt_search_refine_dx (float, optional): Step size in deg of the
+                refined search, which covers opt_search_brute_dx on either
+                side of the best bias of every turbine on the brute force
+                grid. Defaults to 0.1.
+            er_wd_step, er_wd_bin_width: See
+                bias_estimation.estimate_wd_bias().
+            wd_resolution (float, optional): Resolution of the fine wind
+                direction histograms in deg, to which the evaluated wind
+                direction biases are rounded. Defaults to 0.1.
+            ws_resolution (float, optional): Wind speed resolution in m/s of
+                the FLORIS predictions for the fine histograms. Defaults to
+                0.5.
+
+        Returns:
+            df_bias ([pd.DataFrame]): Dataframe with the columns
+                'ref_turbine', 'test_turbines', 'wd_bias' and 'cost', with
+                the estimated bias of every reference turbine.
+        """
+        print('Estimating the wind direction bias of %d turbines'
+              % len(self.ref_turbines))
+
+        hist = self._get_fine_histograms(
+            time_mask=time_mask,
+            ws_mask=ws_mask,
+            ti_mask=ti_mask,
+            wd_resolution=wd_resolution,
+            ws_resolution=ws_resolution,
+        )
+
+        def cost_fun(wd_bias):
+            return _get_wd_bias_cost_matrix(
+                hist=hist,
+                wd_bias=wd_bias,
+                wd_mask=wd_mask,
+                wd_step=er_wd_step,
+                wd_bin_width=er_wd_bin_width,
+            )
+
+        # Brute force search over a grid of wind direction biases
+        n_turbines = len(self.ref_turbines)
+        dran = opt_search_range[1]-opt_search_range[0]
+        x = np.linspace(
+            opt_search_range[0],
+            opt_search_range[1],
+            int(np.ceil(dran/opt_search_brute_dx) + 1),
+        )
+        print('  Evaluating %d wind direction biases.' % len(x))
+        J = cost_fun(np.tile(x, (n_turbines, 1)))
+
+        # Refine the best solution of every turbine on a finer grid
+        x0 = np.array([
+            x[np.nanargmin(Ji)] if np.any(~np.isnan(Ji)) else np.nan
+            for Ji in J
+        ])
+        dx = np.arange(
+            -opt_search_brute_dx,
+            opt_search_brute_dx + 0.5 * opt_search_refine_dx,
+            opt_search_refine_dx,
+        )
+        x_refine = x0[:, None] + dx
+        x_refine = np.round(x_refine / wd_resolution) * wd_resolution
+        print('  Evaluating %d refined wind direction biases.' % len(dx))
+        J_refine = cost_fun(np.nan_to_num(x_refine))
+        J_refine[np.isnan(x_refine)] = np.nan
+
+        x_opt = np.full(n_turbines, np.nan)
+        J_opt = np.full(n_turbines, np.nan)
+        for ii in range(n_turbines):
+            if np.any(~np.isnan(J_refine[ii])):
+                jj = np.nanargmin(J_refine[ii])
+                x_opt[ii] = x_refine[ii, jj]
+                J_opt[ii] = J_refine[ii, jj]
+
+        self.opt_wd_bias = x_opt
+        self.opt_cost = J_opt
+        self.opt_wd_grid = x
+        self.opt_wd_cost = J
+
+        return pd.DataFrame({
+            "ref_turbine": self.ref_turbines,
+            "test_turbines": self.test_turbines_subsets,
+            "wd_bias": x_opt,
+            "cost": J_opt,
+        })
+
+
+def _get_num_fine_wd_bins(wd_resolution):
+    """Return the number of fine wind direction bins of width
+    wd_resolution covering 360 deg."""
+    n_wd = int(np.round(360.0 / wd_resolution))
+    if np.abs(n_wd * wd_resolution - 360.0) > 1e-6:
+        raise ValueError("wd_resolution must divide 360 deg.")
+    return n_wd
+
+
+def _get_fine_ws_grid(ws, ws_resolution):
+    """Return the lower bound and the number of the fine wind speed bins
+    of width ws_resolution covering the wind speeds ws."""
+    if len(ws) == 0:
+        return 0.0, 1
+    ws_min = np.floor(np.min(ws) / ws_resolution) * ws_resolution
+    n_ws = int(np.floor((np.max(ws) - ws_min) / ws_resolution)) + 1
+    return ws_min, n_ws
+
+
+def _map_and_mask_df(
+    df,
+    df_ws_mapping_func,
+    df_pow_ref_mapping_func,
+    time_mask=None,
+    ws_mask=None,
+    ti_mask=None,
+    wd=None,
+):
+    """Set the reference wind speed and power production of a copy of df
+    for its measured wind directions, or for the wind direction wd if
+    specified, and apply the masks that do not depend on the wind
+    direction bias. The measured wind directions are kept in the 'wd'
+    column of the output.
+    """
+    df_map = df.copy()
+    if wd is not None:
+        df_map['wd'] = wd
+    df_map = df_ws_mapping_func(df_map)
+    df_map = df_pow_ref_mapping_func(df_map)
+    if wd is not None:
+        df_map['wd'] = df['wd']
+    df = df_map.dropna(subset=['wd', 'ws', 'pow_ref'])
+
+    ids = np.ones(df.shape[0], dtype=bool)
+    if ws_mask is not None:
+        ids &= (df['ws'] > ws_mask[0]) & (df['ws'] <= ws_mask[1])
+    if ti_mask is not None:
+        ids &= (df['ti'] > ti_mask[0]) & (df['ti'] <= ti_mask[1])
+    if time_mask is not None:
+        time = pd.to_datetime(df['time'])
+        ids &= (
+            (time >= pd.to_datetime(time_mask[0])) &
+            (time < pd.to_datetime(time_mask[1]))
+        )
+    return df[np.array(ids, dtype=bool)]
+
+
+def _is_wd_dependent_mapping(
+    df,
+    df_ws_mapping_func,
+    df_pow_ref_mapping_func,
+    wd_offsets=(90.0, 180.0, 270.0),
+    max_rows=10000,
+):
+    """Check whether the reference wind speed or power production mapping
+    depends on the wind direction, by comparing the mapped values of (a
+    subsample of) df with those after rotating the wind direction by
+    every offset in wd_offsets.
+    """
+    df = df.iloc[::int(np.max([1, np.ceil(df.shape[0] / max_rows)]))]
+
+    def map_df(dwd):
+        df_map = df.copy()
+        df_map['wd'] = wrap_360(df_map['wd'] + dwd)
+        df_map = df_pow_ref_mapping_func(df_ws_mapping_func(df_map))
+        return np.array(df_map[['ws', 'pow_ref']], dtype=float)
+
+    y_ref = map_df(0.0)
+    return any(
+        not np.allclose(map_df(dwd), y_ref, equal_nan=True)
+        for dwd in wd_offsets
+    )
+
+
+def _get_wd_mapping_segments(
+    df,
+    df_ws_mapping_func,
+    df_pow_ref_mapping_func,
+    wd_resolution,
+    max_rows=20,
+):
+    """Find the segments of consecutive fine wind direction bins over
+    which the reference wind speed and power production mappings do not
+    change, by mapping (a subsample of) df for the center of every fine
+    bin. A segment may wrap around 360 deg.
+
+    Returns:
+        wd_segment ([np.array]): Array of length n_wd with the segment of
+            every fine wind direction bin.
+        wd_segment_map ([np.array]): Array with, for every segment, the
+            center of one of its fine bins, for which the mapping of the
+            segment can be evaluated.
+    """
+    n_wd = _get_num_fine_wd_bins(wd_resolution)
+    wd_fine = (np.arange(n_wd) + 0.5) * wd_resolution
+    df = df.iloc[::int(np.max([1, np.ceil(df.shape[0] / max_rows)]))]
+
+    df_map = df.iloc[np.tile(np.arange(df.shape[0]), n_wd)].copy()
+    df_map = df_map.reset_index(drop=True)
+    df_map['wd'] = np.repeat(wd_fine, df.shape[0])
+    df_map = df_pow_ref_mapping_func(df_ws_mapping_func(df_map))
+    y = np.array(df_map[['ws', 'pow_ref']], dtype=float).reshape(n_wd, -1)
+
+    # A segment starts at every fine bin of which the mapping differs from
+    # that of the previous bin
+    is_start = ~np.all(
+        np.isclose(y, np.roll(y, 1, axis=0), equal_nan=True), axis=1
+    )
+    if not np.any(is_start):
+        return np.zeros(n_wd, dtype=int), wd_fine[:1]
+    wd_segment = (np.cumsum(is_start) - 1) % np.sum(is_start)
+    return wd_segment, wd_fine[is_start]
+
+
+def _get_fine_scada_histograms(
+    df,
+    test_turbines,
+    wd_resolution,
+    ws_min,
+    ws_resolution,
+    n_ws,
+):
+    """Sum the number of valid entries and the reference and test power
+    productions of every test turbine in fine wind direction bins, and
+    count the valid entries in fine wind direction and wind speed bins.
+
+    Returns:
+        scada_sums ([np.array]): Array of shape (n_turbines, 3, n_wd)
+            with the count, the summed reference power and the summed test
+            power production in every fine wind direction bin.
+        floris_count ([np.array]): Array of shape (n_turbines, n_wd, n_ws)
+            with the count in every fine wind direction and speed bin.
+    """
+    n_wd = _get_num_fine_wd_bins(wd_resolution)
+    ws = np.array(df['ws'], dtype=float)
+    wd_idx = np.floor(
+        np.array(wrap_360(df['wd']), dtype=float) / wd_resolution
+    ).astype(int) % n_wd
+    ws_idx = np.floor((ws - ws_min) / ws_resolution).astype(int)
+
+    pow_ref = np.array(df['pow_ref'], dtype=float)
+    scada_sums = np.zeros((len(test_turbines), 3, n_wd))
+    floris_count = np.zeros((len(test_turbines), n_wd, n_ws))
+    for ii, ti in enumerate(test_turbines):
+        pow_test = np.array(df['pow_{:03d}'.format(ti)], dtype=float)
+        valid = ~np.isnan(pow_test)
+        scada_sums[ii] = [
+            np.bincount(wd_idx[valid], weights=x, minlength=n_wd)
+            for x in [None, pow_ref[valid], pow_test[valid]]
+        ]
+        floris_count[ii] = np.bincount(
+            wd_idx[valid] * n_ws + ws_idx[valid], minlength=n_wd * n_ws
+        ).reshape(n_wd, n_ws)
+
+    return scada_sums, floris_count
+
+
+def _get_floris_fine_grid(
+    df_fi_approx,
+    interpolants,
+    wd_resolution,
+    ws_min,
+    ws_resolution,
+    n_ws,
+):
+    """Interpolate the FLORIS predictions on the grid of the centers of
+    the fine wind direction and wind speed bins. The rows are ordered by
+    wind direction first, i.e., reshape to (n_wd, n_ws).
+    """
+    n_wd = _get_num_fine_wd_bins(wd_resolution)
+    wd_grid, ws_grid = np.meshgrid(
+        (np.arange(n_wd) + 0.5) * wd_resolution,
+        ws_min + (np.arange(n_ws) + 0.5) * ws_resolution,
+        indexing='ij',
+    )
+    df_fi = pd.DataFrame({'wd': wd_grid.ravel(), 'ws': ws_grid.ravel()})
+    return ftools.interpolate_floris_from_df_approx(
+        df=df_fi,
+        df_approx=df_fi_approx,
+        verbose=False,
+        interpolants=interpolants,
+    )
+
+
+def _get_energy_ratios_from_fine_histograms(
+    hist,
+    wd_bias,
+    wd_mask=None,
+    wd_step=3.0,
+    wd_bin_width=None,
+):
+    """Calculate the energy ratios of the SCADA data and of the FLORIS
+    predictions for a hypothesized wind direction bias, from the fine
+    histograms of _get_fine_histograms(). The bias is rounded to the
+    fine wind direction resolution, and shifts the SCADA histograms
+    circularly with respect to the fine bins of the corrected wind
+    direction. The fine bins are then summed into the (possibly
+    overlapping) wind direction bins. Like
+    energy_ratio.get_energy_ratio_fast(), the energy ratios are not
+    weighed by the frequency of the wind speed bins.
+
+    Args:
+        hist ([dict]): Output of _get_fine_histograms().
+        wd_bias ([float]): Hypothesized wind direction bias in degrees,
+            or an array with the bias for every test turbine.
+        wd_mask, wd_step, wd_bin_width: See estimate_wd_bias().
+
+    Returns:
+        energy_ratios_scada ([np.array]): Array of shape (n_turbines,
+            n_wd_bins) with the energy ratios of the SCADA data for
+            every test turbine in test_turbines_subset.
+        energy_ratios_floris ([np.array]): Array of the same shape with
+            the energy ratios of the FLORIS predictions.
+        wd_bin ([np.array]): The mean wind direction of every bin.
+    """
+    wd_resolution = hist["wd_resolution"]
+    n_segments, n_turbines, _, n_wd = hist["scada_sums"].shape
+    shift = np.round(np.squeeze(wd_bias) / wd_resolution).astype(int)
+
+    # Fine bin of corrected wind direction j holds the measured
+    # wind directions of fine bin j + shift, as mapped for the
+    # segment of j
+    if (shift.ndim == 0) and (n_segments == 1):
+        scada_sums = np.roll(hist["scada_sums"][0], -shift, axis=-1)
+        floris_count = np.roll(hist["floris_count"][0], -shift, axis=1)
+    else:
+        ids = np.mod(
+            np.arange(n_wd) + np.broadcast_to(shift, n_turbines)[:, None],
+            n_wd,
+        )
+        rows = np.arange(n_turbines)[:, None]
+        seg = hist["wd_segment"]
+        scada_sums = np.moveaxis(
+            hist["scada_sums"][seg, rows, :, ids], -1, 1
+        )
+        floris_count = hist["floris_count"][seg, rows, ids]
+    floris_sums = np.stack(
+        [
+            np.sum(floris_count, axis=-1),
+            np.sum(floris_count * hist["floris_pow_ref"], axis=-1),
+            np.sum(floris_count * hist["floris_pow_test"], axis=-1),
+        ],
+        axis=1,
+    )
+
+    # Sum the fine bins into the wind direction bins, by their centers
+    wd_bins = erb.get_wd_bins(wd_step=wd_step, wd_bin_width=wd_bin_width)
+    wd_fine = (np.arange(n_wd) + 0.5) * wd_resolution
+    membership = (
+        np.mod(wd_fine[:, None] - wd_bins[:, 0], 360.0) <
+        (wd_bins[:, 1] - wd_bins[:, 0])
+    )
+    if wd_mask is not None:
+        membership &= (
+            (wd_fine > wd_mask[0]) & (wd_fine <= wd_mask[1])
+        )[:, None]
+    incidence = sparse.csr_matrix(np.array(membership, dtype=float).T)
+
+    energy_ratios = []
+    for sums in [scada_sums, floris_sums]:
+        bin_sums = np.asarray(incidence @ sums.reshape(-1, n_wd).T).T
+        bin_sums = bin_sums.reshape(n_turbines, 3, -1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            energy_ratios.append(np.where(
+                bin_sums[:, 0, :] > 0,
+                bin_sums[:, 2, :] / bin_sums[:, 1, :],
+                np.nan,
+            ))
+
+    return energy_ratios[0], energy_ratios[1], np.mean(wd_bins, axis=1)
+
+
+def _get_wd_bias_cost(energy_ratios_scada, energy_ratios_floris):
+    """Calculate the cost of a hypothesized wind direction bias, being the
+    negative Pearson correlation coefficient between the energy ratios of
+    the SCADA data and of the FLORIS predictions, averaged over the test
+    turbines. Test turbines with fewer than 6 wind direction bins in which
+    both energy ratios are valid are ignored.
+
+    Args:
+        energy_ratios_scada ([iterable]): Energy ratios of the SCADA data
+            for every test turbine.
+        energy_ratios_floris ([iterable]): Energy ratios of the FLORIS
+            predictions for every test turbine.
+
+    Returns:
+        cost ([float]): The cost of the wind direction bias.
+    """
+    cost_array = np.full(len(energy_ratios_scada), np.nan)
+    for ii in range(len(energy_ratios_scada)):
+        y_scada = np.array(energy_ratios_scada[ii], dtype=float)
+        y_floris = np.array(energy_ratios_floris[ii], dtype=float)
+        ids = ~np.isnan(y_scada) & ~np.isnan(y_floris)
+        if np.sum(ids) > 5:  # At least 6 valid data entries
+            r, _ = spst.pearsonr(y_scada[ids], y_floris[ids])
+        else:
+            r = np.nan
+        cost_array[ii] = -1. * r
+
+    return np.nanmean(cost_array)
+
+
+def _get_wd_bias_cost_fine_histograms(task, arrays):
+    """Evaluate the cost of a single hypothesized wind direction bias from
+    the fine histograms, of which the arrays are passed separately from
+    the scalar settings in task so that they can be shared between worker
+    processes, see er._run_tasks_parallel().
+    """
+    wd_bias, wd_resolution, wd_mask, wd_step, wd_bin_width = task
+    hist = dict(arrays, wd_resolution=wd_resolution)
+    energy_ratios_scada, energy_ratios_floris, _ = (
+        _get_energy_ratios_from_fine_histograms(
+            hist=hist,
+            wd_bias=wd_bias,
+            wd_mask=wd_mask,
+            wd_step=wd_step,
+            wd_bin_width=wd_bin_width,
+        )
+    )
+    return _get_wd_bias_cost(energy_ratios_scada, energy_ratios_floris)
+
+
+# Function evaluated by the forked worker processes of _run_tasks_forked()
+_forked_func = None
+
+
+def _call_forked_func(task):
+    return _forked_func(task)
+
+
+def _run_tasks_forked(func, tasks, n_jobs):
+    """Distribute the evaluation of func(task) for every task over a pool
+    of worker processes that are forked from the current process. The
+    workers inherit func, so unlike with er._run_tasks_parallel(), it may
+    be a closure or refer to objects that cannot be pickled, such as
+    user-defined mapping functions. Only the tasks and results are sent
+    between the processes. func should not depend on any changes it makes
+    to the state of the current process, as these are lost with the
+    workers.
+    """
+    global _forked_func
+    _forked_func = func
+    try:
+        with ProcessPoolExecutor(
+            max_workers=n_jobs,
+            mp_context=multiprocessing.get_context("fork"),
+        ) as executor:
+            return list(executor.map(_call_forked_func, tasks))
+    finally:
+        _forked_func = None
+
+
+def _get_pearson_correlation(y_a, y_b, min_count=6):
+    """Calculate the Pearson correlation coefficient between y_a and y_b
+    along their last axis, ignoring the entries where either is NaN. The
+    coefficient is NaN if fewer than min_count entries are valid.
+    """
+    valid = ~np.isnan(y_a) & ~np.isnan(y_b)
+    n = np.sum(valid, axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dev_a = np.where(valid, y_a, 0.0)
+        dev_b = np.where(valid, y_b, 0.0)
+        dev_a = np.where(valid, y_a - (np.sum(dev_a, -1) / n)[..., None], 0.)
+        dev_b = np.where(valid, y_b - (np.sum(dev_b, -1) / n)[..., None], 0.)
+        r = np.sum(dev_a * dev_b, axis=-1) / np.sqrt(
+            np.sum(dev_a**2, axis=-1) * np.sum(dev_b**2, axis=-1)
+        )
+    return np.where(n >= min_count, r, np.nan)
+
+
+def _get_wd_bias_cost_matrix(
+    hist,
+    wd_bias,
+    wd_mask=None,
+    wd_step=3.0,
+    wd_bin_width=None,
+):
+    """Evaluate the cost of many wind direction biases for every reference
+    turbine of farm_bias_estimation from its fine histograms. The cost is
+    defined as in _get_wd_bias_cost(), averaging the negative Pearson
+    correlation coefficients over the test turbines of every reference
+    turbine.
+
+    Args:
+        hist ([dict]): Output of farm_bias_estimation._get_fine_histograms().
+        wd_bias ([np.array]): Array of shape (n_turbines, n_biases) with
+            the wind direction biases to evaluate for every reference
+            turbine.
+        wd_mask, wd_step, wd_bin_width: See estimate_wd_bias().
+
+    Returns:
+        cost ([np.array]): Array of shape (n_turbines, n_biases) with the
+            cost of every bias.
+    """
+    row_ref = hist["row_ref"]
+    energy_ratios_scada = []
+    energy_ratios_floris = []
+    for ii in range(wd_bias.shape[1]):
+        er_scada, er_floris, _ = _get_energy_ratios_from_fine_histograms(
+            hist=hist,
+            wd_bias=wd_bias[row_ref, ii],
+            wd_mask=wd_mask,
+            wd_step=wd_step,
+            wd_bin_width=wd_bin_width,
+        )
+        energy_ratios_scada.append(er_scada)
+        energy_ratios_floris.append(er_floris)
+
+    # Average over the test turbines of every reference turbine
+    cost_rows = -1.0 * _get_pearson_correlation(
+        np.array(energy_ratios_scada), np.array(energy_ratios_floris)
+    )
+    valid = ~np.isnan(cost_rows)
+    membership = np.array(
+        row_ref[:, None] == np.arange(wd_bias.shape[0]), dtype=float
+    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cost = (
+            (np.where(valid, cost_rows, 0.0) @ membership) /
+            (valid @ membership)
+        )
+    return cost.T
@@ -11,9 +11,13 @@
 # the License.
 
 
-from copy import deepcopy as dcopy
+import atexit
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from copy import copy, deepcopy as dcopy
+from multiprocessing import shared_memory
 import matplotlib.pyplot as plt
 import numpy as np
+import os
 import pandas as pd
 from pandas.core.base import DataError
 from scipy import interpolate
@@ -21,14 +25,22 @@ from time import perf_counter as timerpc
 
 from flasc import utilities as fsut
 
+from floris.tools import FlorisInterface
 from floris.utilities import wrap_360, wrap_180
 
 
-def _run_fi_serial(df_subset, fi, include_unc=False,
-                   unc_pmfs=None, unc_options=None, verbose=False):
+def _run_fi(df_subset, fi, include_unc=False,
+            unc_pmfs=None, unc_options=None, verbose=False,
+            wd_resolution=None, ws_resolution=None,
+            ti_resolution=None, yaw_resolution=None, max_grid_size=1000,
+            num_workers=1):
     """Evaluate the FLORIS solutions for a set of wind directions,
-    wind speeds and turbulence intensities in serial (non-
-    parallelized) mode.
+    wind speeds and turbulence intensities. Duplicate conditions are
+    evaluated once, and the unique conditions are grouped into batches
+    that are each evaluated in a single grid-style FLORIS calculation,
+    see _get_floris_batches(). The batches are evaluated in serial
+    (non-parallelized) mode, or by a persistent pool of worker processes
+    if num_workers > 1, see _calc_floris_batches_parallel().
 
     Args:
         df_subset ([pd.DataFrame]): Dataframe containing the columns
@@ -37,6 +49,20 @@ def _run_fi_serial(df_subset, fi, include_unc=False,
         fi ([floris]): FLORIS object for the farm of interest.
         verbose (bool, optional): Print information to terminal, used
         for debugging. Defaults to False.
+        wd_resolution (float, optional): Resolution in deg to which the
+        wind directions are rounded before evaluating FLORIS, so that
+        more rows share the same conditions. If None, the conditions are
+        evaluated exactly. Defaults to None.
+        ws_resolution (float, optional): Idem for the wind speeds in m/s.
+        Defaults to None.
+        ti_resolution (float, optional): Idem for the turbulence
+        intensities. Defaults to None.
+        yaw_resolution (float, optional): Idem for the yaw offsets in deg,
+        relative to the wind direction, of every turbine. Defaults to None.
+        max_grid_size (int, optional): Maximum number of conditions
+        evaluated in a single FLORIS calculation. Defaults to 1000.
+        num_workers (int, optional): Number of worker processes over
+        which the batches are distributed. Defaults to 1.
 
     Returns:
         df_out ([pd.DataFrame]): Identical to the inserted dataframe,
@@ -76,115 +102,282 @@ def _run_fi_serial(df_subset, fi, include_unc=False,
     if 'ti' not in df_out.columns:
         df_out['ti'] = np.min(fi.floris.farm.turbulence_intensity)
 
-    # Perform grid-style calculation, if possible
-    n_unq = (
-        df_out["ws"].nunique() *
-        df_out["wd"].nunique() *
-        df_out["ti"].nunique()
+    # Group the unique conditions into batches of grid-style calculations
+    wd, ws, ti = [
+        np.array(df_out[c], dtype=float) for c in ["wd", "ws", "ti"]
+    ]
+    if wd_resolution is not None:
+        wd = wrap_360(np.round(wd / wd_resolution) * wd_resolution)
+    if ws_resolution is not None:
+        ws = np.round(ws / ws_resolution) * ws_resolution
+    if ti_resolution is not None:
+        ti = np.round(ti / ti_resolution) * ti_resolution
+    if yaw_resolution is not None:
+        yaw_rel = np.round(yaw_rel / yaw_resolution) * yaw_resolution
+    cases, case_ids = np.unique(
+        np.column_stack([ti, wd, ws, yaw_rel]), axis=0, return_inverse=True
     )
-    if n_unq == df_out.shape[0]:
-        # Reformat things to grid style calculation
-        wd_array = np.sort(df_out["wd"].unique())
-        ws_array = np.sort(df_out["ws"].unique())
-        ti = df_out["ti"].unique()[0]
-
-        # Specify interpolant to map data appropriately
-        X, Y = np.meshgrid(wd_array, ws_array, indexing='ij')
-        if use_yaw:
-            # Map the yaw angles in the appropriate format
-            F = interpolate.NearestNDInterpolator(
-                df_out[["wd", "ws"]],
-                yaw_rel
-            )
-            yaw_angles = F(X, Y)
-        else:
-            yaw_angles = np.zeros((len(wd_array), len(ws_array), nturbs))
+    batches = _get_floris_batches(cases, max_grid_size=max_grid_size)
+    if verbose:
+        print('  Evaluating %d unique conditions in %d FLORIS calls.'
+              % (cases.shape[0], len(batches)))
+
+    # Calculate the FLORIS solutions of every batch in grid-style
+    solutions = np.zeros((3, cases.shape[0], nturbs))
+    if (num_workers > 1) and (len(batches) > 1):
+        _calc_floris_batches_parallel(
+            fi, cases, batches, solutions, num_workers
+        )
+    else:
+        _calc_floris_batches(fi, cases, batches, solutions, verbose)
+
+    # Scatter the solutions back to the rows of the dataframe
+    df_out.loc[df_out.index, pow_cols] = solutions[0][case_ids] / 1000.0
+    df_out.loc[df_out.index, wd_cols] = np.tile(df_out["wd"], (nturbs, 1)).T
+    df_out.loc[df_out.index, ws_cols] = solutions[1][case_ids]
+    df_out.loc[df_out.index, ti_cols] = solutions[2][case_ids]
+
+    return df_out
+
 
-        # Calculate the FLORIS solutions in grid-style
+def _calc_floris_batches(fi, cases, batches, solutions, verbose=False):
+    """Evaluate the batches of conditions of _get_floris_batches() one by
+    one, writing the turbine powers, rotor-averaged wind speeds and
+    turbulence intensities of every condition into solutions, an array of
+    shape (3, n_cases, n_turbines).
+    """
+    nturbs = solutions.shape[2]
+    for ii, (ids, wd_array, ws_array, wd_idx, ws_idx) in enumerate(batches):
+        if verbose and (np.remainder(ii, 10) == 0):
+            print('  Progress: finished %.1f percent (%d/%d batches).'
+                  % (100. * ii / len(batches), ii, len(batches)))
+
+        yaw_angles = np.zeros((len(wd_array), len(ws_array), nturbs))
+        yaw_angles[wd_idx, ws_idx, :] = cases[ids, 3:]
         fi.reinitialize(
             wind_directions=wd_array,
             wind_speeds=ws_array,
-            turbulence_intensity=ti,
+            turbulence_intensity=cases[ids[0], 0],
         )
         fi.calculate_wake(yaw_angles=yaw_angles)
-        turbine_powers = fi.get_turbine_powers(
-            # include_unc=include_unc,
-            # unc_pmfs=unc_pmfs,
-            # unc_options=unc_options
-        )
+        # Reshape the flow fields, whose number of trailing dimensions per
+        # turbine differs between FLORIS versions
+        shape = (len(wd_array), len(ws_array), nturbs, -1)
+        flow_field = fi.floris.flow_field
+        solutions[0, ids] = fi.get_turbine_powers()[wd_idx, ws_idx, :]
+        solutions[1, ids] = np.mean(
+            flow_field.u.reshape(shape), axis=3
+        )[wd_idx, ws_idx, :]
+        solutions[2, ids] = flow_field.turbulence_intensity_field.reshape(
+            shape
+        )[wd_idx, ws_idx, :, 0]
+
+
+# Persistent pool of worker processes, see _get_floris_pool()
+_floris_pool = {"key": None, "executor": None}
+
+# FLORIS object of a worker process, set by _init_floris_worker()
+_floris_worker_fi = None
+
+
+def _get_floris_configuration(fi):
+    """Return the configuration dictionary of a FLORIS object, without the
+    ambient conditions that are set for every calculation."""
+    fi_dict = fi.floris.as_dict()
+    for key in ["wind_directions", "wind_speeds", "turbulence_intensity"]:
+        fi_dict["flow_field"].pop(key, None)
+    return fi_dict
+
+
+def _init_floris_worker(fi_dict):
+    """Initializer of the worker processes, creating the FLORIS object
+    once for all calculations of the worker."""
+    global _floris_worker_fi
+    fi_dict = dcopy(fi_dict)
+    fi_dict["flow_field"].update(
+        {"wind_directions": [270.0], "wind_speeds": [8.0],
+         "turbulence_intensity": 0.06}
+    )
+    _floris_worker_fi = FlorisInterface(fi_dict)
+
 
-        # Format the found solutions back to the dataframe format
-        Fp = interpolate.NearestNDInterpolator(
-            np.vstack([X.flatten(), Y.flatten()]).T,
-            np.reshape(turbine_powers, (-1, nturbs))
+def _get_floris_pool(fi, num_workers):
+    """Return a pool of num_workers worker processes holding the FLORIS
+    configuration of fi. The pool is kept alive between calls, and is only
+    replaced when the configuration or the number of workers changes, so
+    that repeated calculations with the same FLORIS model reuse the warm
+    worker processes.
+    """
+    fi_dict = _get_floris_configuration(fi)
+    key = (num_workers, repr(fi_dict))
+    if _floris_pool["key"] != key:
+        _shutdown_floris_pool()
+        _floris_pool["executor"] = ProcessPoolExecutor(
+            max_workers=num_workers,
+            initializer=_init_floris_worker,
+            initargs=(fi_dict,),
         )
-        Fws = interpolate.NearestNDInterpolator(
-            np.vstack([X.flatten(), Y.flatten()]).T,
-            np.reshape(
-                np.mean(fi.floris.flow_field.u, axis=(3, 4)),
-                (-1, nturbs)
-            )
+        _floris_pool["key"] = key
+    return _floris_pool["executor"]
+
+
+def _shutdown_floris_pool():
+    if _floris_pool["executor"] is not None:
+        _floris_pool["executor"].shutdown(wait=True)
+    _floris_pool["key"] = None
+    _floris_pool["executor"] = None
+
+
+atexit.register(_shutdown_floris_pool)
+
+
+def _calc_floris_batches_shared(specs, batches):
+    """Evaluate batches of conditions in a worker process, reading the
+    conditions from and writing the solutions into shared memory."""
+    shms = {
+        key: shared_memory.SharedMemory(name=name)
+        for key, (name, _) in specs.items()
+    }
+    try:
+        arrays = {
+            k: np.ndarray(shape, dtype=float, buffer=shms[k].buf)
+            for k, (_, shape) in specs.items()
+        }
+        _calc_floris_batches(
+            _floris_worker_fi, arrays["cases"], batches, arrays["solutions"]
         )
-        Fti = interpolate.NearestNDInterpolator(
-            np.vstack([X.flatten(), Y.flatten()]).T,
-            np.reshape(
-                fi.floris.flow_field.turbulence_intensity_field[:, :, :, 0, 0],
-                (-1, nturbs)
+    finally:
+        for shm in shms.values():
+            shm.close()
+
+
+def _calc_floris_batches_parallel(fi, cases, batches, solutions, num_workers):
+    """Distribute the batches of conditions over the persistent pool of
+    worker processes of _get_floris_pool(). The conditions and solutions
+    are held in shared memory, so that the workers only receive the small
+    batch descriptions and write their solutions in place.
+    """
+    executor = _get_floris_pool(fi, num_workers)
+    shms = {}
+    try:
+        specs = {}
+        for key, x in [("cases", cases), ("solutions", solutions)]:
+            shms[key] = shared_memory.SharedMemory(
+                create=True, size=np.max([x.nbytes, 1])
             )
+            np.ndarray(x.shape, dtype=float, buffer=shms[key].buf)[:] = x
+            specs[key] = (shms[key].name, x.shape)
+
+        # Submit the largest batches first to balance the load
+        order = np.argsort([-len(b[1]) * len(b[2]) for b in batches])
+        futures = [
+            executor.submit(_calc_floris_batches_shared, specs, [batches[ii]])
+            for ii in order
+        ]
+        for future in futures:
+            future.result()
+
+        solutions[:] = np.ndarray(
+            solutions.shape, dtype=float, buffer=shms["solutions"].buf
         )
+    finally:
+        for shm in shms.values():
+            shm.close()
+            shm.unlink()
+
+
+def _get_floris_batches(cases, max_grid_size=1000, call_overhead=20):
+    """Group a set of unique conditions into batches that can each be
+    evaluated by FLORIS in a single grid-style calculation. A batch shares
+    a single turbulence intensity and covers a grid of wind directions and
+    wind speeds, of which only some cells may hold a condition. Conditions
+    with the same wind direction, wind speed and turbulence intensity but
+    different yaw angles are placed in separate batches. The wind speeds
+    are visited in increasing order, and a wind speed is added to the
+    current batch if the number of additional grid cells does not exceed
+    the number of its conditions plus call_overhead, being the cost of a
+    separate FLORIS call expressed in evaluated cells.
 
-        # Finally save solutions to the dataframe
-        df_out.loc[df_out.index, pow_cols] = Fp(df_out[["wd", "ws"]]) / 1000.0
-        df_out.loc[df_out.index, wd_cols] = np.tile(df_out["wd"], (nturbs, 1)).T
-        df_out.loc[df_out.index, ws_cols] = Fws(df_out[["wd", "ws"]])
-        df_out.loc[df_out.index, ti_cols] = Fti(df_out[["wd", "ws"]])
+    Args:
+        cases ([np.array]): Array of shape (n_cases, 3 + n_turbines) with
+            the unique conditions, with columns ti, wd, ws and the yaw
+            angles of every turbine.
+        max_grid_size (int, optional): Maximum number of grid cells
+            evaluated in a single FLORIS calculation. Defaults to 1000.
+        call_overhead (int, optional): Overhead of a FLORIS calculation
+            expressed in number of grid cells. Defaults to 20.
 
-    else:
-        # If cannot process in grid-style format, process one by one (SLOW)
-        for iii, idx in enumerate(df_out.index):
-            if (
-                verbose and
-                ((np.remainder(idx, 100) == 0) or idx == df_out.shape[0]-1)
-            ): 
-                print('  Progress: finished %.1f percent (%d/%d cases).'
-                    % (100.*idx/df_out.shape[0], idx, df_out.shape[0]))
-
-            # # Update model parameters, if present in dataframe
-            # if use_model_params:
-            #     params = df_out.loc[idx, 'model_params_dict']
-            #     fi.set_model_parameters(params=params, verbose=False)
-
-            fi.reinitialize(
-                wind_speeds=[df_out.loc[idx, 'ws']],
-                wind_directions=[df_out.loc[idx, 'wd']],
-                turbulence_intensity=df_out.loc[idx, 'ti']
-            )
+    Returns:
+        batches ([list]): List of tuples (ids, wd_array, ws_array, wd_idx,
+            ws_idx), where ids are the indices of the conditions in the
+            batch, and wd_idx and ws_idx locate them on the grid defined
+            by wd_array and ws_array.
+    """
+    # Number the conditions sharing the same ti, wd and ws
+    order = np.lexsort(cases[:, 2::-1].T)
+    new_group = np.ones(len(order), dtype=bool)
+    new_group[1:] = np.any(np.diff(cases[order, 0:3], axis=0) != 0, axis=1)
+    group_start = np.maximum.accumulate(
+        np.where(new_group, np.arange(len(order)), 0)
+    )
+    layer = np.empty(len(order), dtype=int)
+    layer[order] = np.arange(len(order)) - group_start
 
-            fi.calculate_wake(np.expand_dims(yaw_rel[iii, :], axis=[0, 1]))
-            turbine_powers = np.squeeze(
-                fi.get_turbine_powers(
-                # include_unc=include_unc,
-                # unc_pmfs=unc_pmfs,
-                # unc_options=unc_options
-                )
-            )
-            df_out.loc[idx, pow_cols] = turbine_powers / 1000.
-            df_out.loc[idx, wd_cols] = np.repeat(
-                df_out.loc[idx, 'wd'],
-                nturbs   # Assumed to be uniform
-            ) 
-            df_out.loc[idx, ws_cols] = np.squeeze(
-                np.mean(fi.floris.flow_field.u, axis=(3, 4))
-            )
-            df_out.loc[idx, ti_cols] = np.squeeze(
-                fi.floris.flow_field.turbulence_intensity_field
-            )
+    batches = []
 
-    return df_out
+    def append_batch(ids):
+        wd_array, wd_idx = np.unique(cases[ids, 1], return_inverse=True)
+        ws_array, ws_idx = np.unique(cases[ids, 2], return_inverse=True)
+        batches.append((ids, wd_array, ws_array, wd_idx, ws_idx))
+
+    _, group_ids = np.unique(
+        np.column_stack([cases[:, 0], layer]), axis=0, return_inverse=True
+    )
+    for ids_group in _get_group_indices(group_ids):
+        ws_values, ws_ids = np.unique(cases[ids_group, 2], return_inverse=True)
+        ids_block, wd_block, n_ws_block = [], set(), 0
+        for ids_ws in _get_group_indices(ws_ids, len(ws_values)):
+            ids_ws = ids_group[ids_ws]
+            wd_ws = set(cases[ids_ws, 1])
+            n_cells = len(wd_block | wd_ws) * (n_ws_block + 1)
+            if (n_ws_block > 0) and (n_cells <= max_grid_size) and (
+                n_cells <= len(wd_block) * n_ws_block + len(wd_ws) +
+                call_overhead
+            ):
+                ids_block.append(ids_ws)
+                wd_block |= wd_ws
+                n_ws_block += 1
+                continue
+
+            if n_ws_block > 0:
+                append_batch(np.concatenate(ids_block))
+            if len(ids_ws) > max_grid_size:
+                # Split wind speeds with too many wind directions
+                for ii in range(0, len(ids_ws), max_grid_size):
+                    append_batch(ids_ws[ii:ii + max_grid_size])
+                ids_block, wd_block, n_ws_block = [], set(), 0
+            else:
+                ids_block, wd_block, n_ws_block = [ids_ws], wd_ws, 1
+        if n_ws_block > 0:
+            append_batch(np.concatenate(ids_block))
+
+    return batches
+
+
+def _get_group_indices(group_ids, n_groups=None):
+    """Return the indices of the entries of every group, for group
+    numbers 0 to n_groups - 1."""
+    if n_groups is None:
+        n_groups = int(np.max(group_ids, initial=-1)) + 1
+    order = np.argsort(group_ids, kind="stable")
+    bounds = np.searchsorted(group_ids[order], np.arange(n_groups + 1))
+    return [order[bounds[ii]:bounds[ii + 1]] for ii in range(n_groups)]
 
 
 def calc_floris(df, fi, num_workers, job_worker_ratio=5, include_unc=False,
-                unc_pmfs=None, unc_options=None, use_mpi=False):
+                unc_pmfs=None, unc_options=None, use_mpi=False,
+                wd_resolution=None, ws_resolution=None, ti_resolution=None,
+                yaw_resolution=None, max_grid_size=1000):
     """Calculate the FLORIS predictions for a particular wind direction, wind speed
     and turbulence intensity set. This function calculates the exact solutions.
 
@@ -193,13 +386,37 @@ def calc_floris(df, fi, num_workers, job_worker_ratio=5, include_unc=False,
         and 'ws'. Can optionally also have the column 'ti' and 'time'.
 
         If the dataframe has columns 'yaw_000' through 'yaw_<nturbs>', then it
-        will calculate the floris solutions for those yaw angles too.
+        will calculate the floris solutions for those yaw angles too. Every
+        cell of a grid-style calculation carries its own yaw offsets, so
+        yawed conditions are batched like any other. Conditions that
+        share the wind direction, wind speed and turbulence intensity but
+        differ in yaw offsets are evaluated in separate batches.
 
         If the dataframe has column 'model_params_dict', then it will change
         the floris model parameters for every run with the values therein.
 
         fi ([FlorisInterface]): Floris object for the wind farm of interest
 
+        wd_resolution, ws_resolution, ti_resolution, yaw_resolution (float,
+        optional): Resolutions to which the wind directions, wind speeds,
+        turbulence intensities and yaw offsets relative to the wind
+        direction are rounded before evaluating FLORIS. Rows
+        with identical rounded conditions are evaluated only once, and the
+        unique conditions are evaluated in batches of grid-style
+        calculations, which is much faster for scattered data such as
+        SCADA measurements. If None, the conditions are not rounded.
+        Defaults to None.
+
+        max_grid_size (int, optional): Maximum number of conditions
+        evaluated in a single FLORIS calculation. Defaults to 1000.
+
+        If num_workers > 1, the batches of conditions are distributed over
+        a persistent pool of worker processes that hold the FLORIS model,
+        with the conditions and solutions in shared memory. The pool is
+        reused by later calls with the same FLORIS model. With use_mpi,
+        the dataframe is instead split into num_workers * job_worker_ratio
+        jobs for an MPI pool.
+
     Returns:
         [type]: [description]
     """
@@ -216,8 +433,8 @@ def calc_floris(df, fi, num_workers, job_worker_ratio=5, include_unc=False,
         if np.any(df[yaw_cols] < 0.):
             raise DataError('Yaw should be defined in domain [0, 360) deg.')
 
-    # Split dataframe into subset dataframes for parallelization, if necessary
-    if num_workers > 1:
+    # Split dataframe into subset dataframes for parallelization with MPI
+    if (num_workers > 1) and use_mpi:
         df_list = []
 
         # See if we can simply split the problem up into a grid of conditions
@@ -244,15 +461,24 @@ def calc_floris(df, fi, num_workers, job_worker_ratio=5, include_unc=False,
 
     # Calculate solutions
     start_time = timerpc()
-    if num_workers <= 1:
-        print("Calculating floris solutions (non-parallelized)")
-        df_out = _run_fi_serial(
+    if not ((num_workers > 1) and use_mpi):
+        if num_workers <= 1:
+            print("Calculating floris solutions (non-parallelized)")
+        else:
+            print('Calculating with num_workers = %d' % num_workers)
+        df_out = _run_fi(
             df_subset=df,
             fi=fi,
             include_unc=include_unc,
             unc_pmfs=unc_pmfs,
             unc_options=unc_options,
-            verbose=True
+            verbose=(num_workers <= 1),
+            wd_resolution=wd_resolution,
+            ws_resolution=ws_resolution,
+            ti_resolution=ti_resolution,
+            yaw_resolution=yaw_resolution,
+            max_grid_size=max_grid_size,
+            num_workers=num_workers,
         )
     else:
         print('Calculating with num_workers = %d and job_worker_ratio = %d'
@@ -264,18 +490,16 @@ def calc_floris(df, fi, num_workers, job_worker_ratio=5, include_unc=False,
         for df_mp in df_list:
             df_mp = df_mp.reset_index(drop=True)
             multiargs.append(
-                (df_mp, dcopy(fi), include_unc, unc_pmfs, unc_options, False)
+                (df_mp, dcopy(fi), include_unc, unc_pmfs, unc_options, False,
+                 wd_resolution, ws_resolution, ti_resolution,
+                 yaw_resolution, max_grid_size)
             )
 
-        if use_mpi:
-            # Use an MPI implementation, useful for HPC
-            from mpi4py.futures import MPIPoolExecutor as pool_executor
-        else:
-            # Use Pythons internal multiprocessing functionality
-            from multiprocessing import Pool as pool_executor
+        # Use an MPI implementation, useful for HPC
+        from mpi4py.futures import MPIPoolExecutor as pool_executor
 
         with pool_executor(num_workers) as pool:
-            df_list = pool.starmap(_run_fi_serial, multiargs)
+            df_list = pool.starmap(_run_fi, multiargs)
 
         df_out = pd.concat(df_list).reset_index(drop=True)
         if 'index' in df_out.columns:
@@ -288,39 +512,26 @@ def calc_floris(df, fi, num_workers, job_worker_ratio=5, include_unc=False,
     return df_out
 
 
-def interpolate_floris_from_df_approx(
-    df,
-    df_approx,
-    method='linear',
-    verbose=True
-):
-    # Format dataframe and get number of turbines
-    df = df.reset_index(drop=('time' in df.columns))
-    nturbs = fsut.get_num_turbines(df_approx)
+def get_floris_approx_interpolants(df_approx, method='linear'):
+    """Build gridded interpolants of the precalculated FLORIS solutions in
+    df_approx, which can be reused by interpolate_floris_from_df_approx()
+    for many dataframes without rebuilding the grid.
 
-    # Check if turbulence intensity is provided in the dataframe 'df'
-    if 'ti' not in df.columns:
-        if df_approx["ti"].nunique() > 3:
-            raise ValueError("You must include a 'ti' column in your df.")
-        ti_ref = np.median(df_approx["ti"])
-        print("No 'ti' column found in dataframe. Assuming {}".format(ti_ref))
-        df["ti"] = ti_ref
+    Args:
+        df_approx ([pd.DataFrame]): Dataframe with the precalculated FLORIS
+            solutions, e.g., from calc_floris_approx_table().
+        method (str, optional): Interpolation method of the
+            RegularGridInterpolator. Defaults to 'linear'.
 
-    # Define which variables we must map from df_approx to df
-    varnames = ['pow']
-    if 'ws_000' in df_approx.columns:
-        varnames.append('ws')
-    if 'wd_000' in df_approx.columns:
-        varnames.append('wd')
-    if 'ti_000' in df_approx.columns:
-        varnames.append('ti')
+    Returns:
+        interpolants ([dict]): Dictionary with a RegularGridInterpolator
+            over (wd, ws, ti) for every variable, e.g., 'pow', returning
+            the values of all turbines.
+    """
+    nturbs = fsut.get_num_turbines(df_approx)
 
-    # Map individual data entries to full DataFrame
-    if verbose:
-        print("Mapping the precalculated solutions " +
-              "from FLORIS to the dataframe...")
-        print("  Creating a gridded interpolant with " +
-              "interpolation method '%s'." % method)
+    # Define which variables we must map from df_approx to df
+    varnames = _get_floris_approx_varnames(df_approx)
 
     # Make a copy from wd=0.0 deg to wd=360.0 deg for wrapping
     if not (df_approx["wd"] == 360.0).any():
@@ -359,14 +570,58 @@ def interpolate_floris_from_df_approx(
         indexing='ij',
     )
 
-    grid_dict = dict()
+    interpolants = dict()
     for varname in varnames:
         colnames = ['{:s}_{:03d}'.format(varname, ti) for ti in range(nturbs)]
         f = interpolate.NearestNDInterpolator(
             df_approx[["wd", "ws", "ti"]],
             df_approx[colnames]
         )
-        grid_dict["{:s}".format(varname)] = f(xg, yg, zg)
+        interpolants[varname] = interpolate.RegularGridInterpolator(
+            points=(wd_array_approx, ws_array_approx, ti_array_approx),
+            values=f(xg, yg, zg),
+            method=method,
+            bounds_error=False,
+        )
+
+    return interpolants
+
+
+def interpolate_floris_from_df_approx(
+    df,
+    df_approx,
+    method='linear',
+    verbose=True,
+    interpolants=None,
+):
+    # Format dataframe and get the turbines and turbulence intensities
+    df = df.reset_index(drop=('time' in df.columns))
+    if isinstance(df_approx, floris_surrogate):
+        turbines = df_approx.turbines
+        ti_approx = df_approx.ti
+    else:
+        turbines = range(fsut.get_num_turbines(df_approx))
+        ti_approx = df_approx["ti"]
+
+    # Check if turbulence intensity is provided in the dataframe 'df'
+    if 'ti' not in df.columns:
+        if len(np.unique(ti_approx)) > 3:
+            raise ValueError("You must include a 'ti' column in your df.")
+        ti_ref = np.median(ti_approx)
+        print("No 'ti' column found in dataframe. Assuming {}".format(ti_ref))
+        df["ti"] = ti_ref
+
+    # Map individual data entries to full DataFrame
+    if interpolants is None:
+        if verbose:
+            print("Mapping the precalculated solutions " +
+                  "from FLORIS to the dataframe...")
+            print("  Creating a gridded interpolant with " +
+                  "interpolation method '%s'." % method)
+        if isinstance(df_approx, floris_surrogate):
+            interpolants = df_approx.get_interpolants(method)
+        else:
+            interpolants = get_floris_approx_interpolants(df_approx, method)
 
     # Prepare an minimal output dataframe
     cols_to_copy = ["wd", "ws", "ti"]
@@ -375,28 +630,406 @@ def interpolate_floris_from_df_approx(
     df_out = df[cols_to_copy].copy()
 
     # Use interpolant to determine values for all turbines and variables
-    for varname in varnames:
+    for varname, f in interpolants.items():
         if verbose:
             print('     Interpolating ' + varname + ' for all turbines...')
-        colnames = ['{:s}_{:03d}'.format(varname, ti) for ti in range(nturbs)]
-        f = interpolate.RegularGridInterpolator(
-            points=(wd_array_approx, ws_array_approx, ti_array_approx),
-            values=grid_dict[varname],
-            method=method,
-            bounds_error=False,
-        )
+        colnames = ['{:s}_{:03d}'.format(varname, ti) for ti in turbines]
         df_out.loc[df_out.index, colnames] = f(df[['wd', 'ws', 'ti']])
 
     return df_out
 
 
+def _get_floris_approx_varnames(df_approx):
+    """Return the variables with turbine-specific columns in df_approx."""
+    varnames = ['pow']
+    for varname in ['ws', 'wd', 'ti']:
+        if '{:s}_000'.format(varname) in df_approx.columns:
+            varnames.append(varname)
+    return varnames
+
+
+class floris_surrogate():
+    """Gridded surrogate of precalculated FLORIS solutions. The solutions
+    are held in a single dense array of shape (n_wd, n_ws, n_ti,
+    n_turbines, n_variables), which is saved to and memory-mapped from
+    disk. Subsets of turbines and variables are only read from disk when
+    they are interpolated or converted.
+    """
+    def __init__(self, wd, ws, ti, values, varnames, turbines=None):
+        """Initialize the surrogate.
+
+        Args:
+            wd ([iterable]): Strictly increasing wind directions in deg.
+            ws ([iterable]): Strictly increasing wind speeds in m/s.
+            ti ([iterable]): Strictly increasing turbulence intensities.
+            values ([np.array]): Array of shape (n_wd, n_ws, n_ti,
+                n_turbines, n_variables) with the FLORIS solutions. Can be
+                a memory-mapped array.
+            varnames ([list]): Variable names along the last axis of
+                values, e.g., ['pow', 'ws'].
+            turbines ([list], optional): Turbine numbers along the
+                turbine axis of values. If None, uses 0, 1, ..., n_turbines
+                - 1. Defaults to None.
+        """
+        self.wd = np.array(wd, dtype=float)
+        self.ws = np.array(ws, dtype=float)
+        self.ti = np.array(ti, dtype=float)
+        self.values = values
+        self._all_varnames = [str(v) for v in varnames]
+        if turbines is None:
+            turbines = range(values.shape[3])
+        self._all_turbines = [int(t) for t in turbines]
+
+        shape = (len(self.wd), len(self.ws), len(self.ti),
+                 len(self._all_turbines), len(self._all_varnames))
+        if values.shape != shape:
+            raise ValueError(
+                "The shape of values {} does not match the axes {}.".format(
+                    values.shape, shape)
+            )
+        for x in [self.wd, self.ws, self.ti]:
+            if np.any(np.diff(x) <= 0.0):
+                raise ValueError("The axes must be strictly increasing.")
+
+        self._turbine_ids = np.arange(len(self._all_turbines))
+        self._var_ids = np.arange(len(self._all_varnames))
+
+    @property
+    def turbines(self):
+        return [self._all_turbines[i] for i in self._turbine_ids]
+
+    @property
+    def varnames(self):
+        return [self._all_varnames[i] for i in self._var_ids]
+
+    def select(self, turbines=None, varnames=None):
+        """Return a surrogate limited to a subset of the turbines and/or
+        variables. The values are shared with this surrogate and are not
+        read from disk.
+
+        Args:
+            turbines ([list], optional): Turbine numbers to keep. If None,
+                keeps the current turbines. Defaults to None.
+            varnames ([list], optional): Variable names to keep. If None,
+                keeps the current variables. Defaults to None.
+
+        Returns:
+            surrogate ([floris_surrogate]): The surrogate of the subset.
+        """
+        surrogate = copy(self)
+        if turbines is not None:
+            missing = [t for t in turbines if t not in self.turbines]
+            if len(missing) > 0:
+                raise KeyError("Turbines {} not found.".format(missing))
+            surrogate._turbine_ids = np.array(
+                [self._all_turbines.index(t) for t in turbines], dtype=int
+            )
+        if varnames is not None:
+            missing = [v for v in varnames if v not in self.varnames]
+            if len(missing) > 0:
+                raise KeyError("Variables {} not found.".format(missing))
+            surrogate._var_ids = np.array(
+                [self._all_varnames.index(v) for v in varnames], dtype=int
+            )
+        return surrogate
+
+    def get_values(self, varname):
+        """Read the values of a variable for the selected turbines into an
+        array of shape (n_wd, n_ws, n_ti, n_turbines)."""
+        if varname not in self.varnames:
+            raise KeyError("Variable '{}' not found.".format(varname))
+        var_id = self._all_varnames.index(varname)
+        return np.stack(
+            [self.values[:, :, :, ti, var_id] for ti in self._turbine_ids],
+            axis=3,
+        )
+
+    def get_interpolants(self, method='linear'):
+        """Build interpolants of the selected turbines and variables that
+        read only the grid points surrounding the requested conditions.
+        The wind direction wraps around from the last grid point to the
+        first, and the wind speed and turbulence intensity are held
+        constant beyond the grid within 0 to 99 m/s and 0 to 1,
+        respectively, in line with get_floris_approx_interpolants().
+        Conditions outside these bounds or outside 0 to 360 deg return
+        NaN.
+
+        Args:
+            method (str, optional): Interpolation method, either 'linear'
+                or 'nearest'. Defaults to 'linear'.
+
+        Returns:
+            interpolants ([dict]): Dictionary with an interpolant over
+                (wd, ws, ti) for every variable, returning the values of
+                the selected turbines.
+        """
+        if method not in ['linear', 'nearest']:
+            raise ValueError("Unknown interpolation method '%s'." % method)
+        return {
+            varname: _gridded_interpolant(
+                self, self._all_varnames.index(varname), method
+            )
+            for varname in self.varnames
+        }
+
+    @classmethod
+    def from_df_approx(cls, df_approx, dtype=np.float32):
+        """Convert a long-format df_approx table, e.g., from
+        calc_floris_approx_table(), into a gridded surrogate. Conditions
+        missing from the table are filled with the nearest solution.
+
+        Args:
+            df_approx ([pd.DataFrame]): Dataframe with the columns 'wd',
+                'ws', 'ti' and the turbine variables 'pow_000', ....
+            dtype ([np.dtype], optional): Data type of the gridded values.
+                Defaults to np.float32.
+
+        Returns:
+            surrogate ([floris_surrogate]): The gridded surrogate.
+        """
+        nturbs = fsut.get_num_turbines(df_approx)
+        varnames = _get_floris_approx_varnames(df_approx)
+        wd = np.unique(df_approx["wd"])
+        ws = np.unique(df_approx["ws"])
+        ti = np.unique(df_approx["ti"])
+
+        values = np.full(
+            (len(wd), len(ws), len(ti), nturbs, len(varnames)),
+            np.nan,
+            dtype=dtype,
+        )
+        ids = (
+            np.searchsorted(wd, df_approx["wd"]),
+            np.searchsorted(ws, df_approx["ws"]),
+            np.searchsorted(ti, df_approx["ti"]),
+        )
+        for jj, varname in enumerate(varnames):
+            colnames = ['{:s}_{:03d}'.format(varname, t) for t in range(nturbs)]
+            values[ids + (slice(None), jj)] = df_approx[colnames]
+
+        # Fill conditions missing from the table with the nearest solution
+        is_missing = np.ones(values.shape[0:3], dtype=bool)
+        is_missing[ids] = False
+        if np.any(is_missing):
+            colnames = [c for v in varnames for c in
+                        ['{:s}_{:03d}'.format(v, t) for t in range(nturbs)]]
+            f = interpolate.NearestNDInterpolator(
+                df_approx[["wd", "ws", "ti"]], df_approx[colnames]
+            )
+            xg, yg, zg = np.meshgrid(wd, ws, ti, indexing='ij')
+            values[is_missing] = f(
+                xg[is_missing], yg[is_missing], zg[is_missing]
+            ).reshape(-1, len(varnames), nturbs).transpose(0, 2, 1)
+
+        return cls(wd, ws, ti, values, varnames)
+
+    def to_df_approx(self):
+        """Convert the selected turbines and variables into a long-format
+        df_approx table, sorted by 'ti', 'ws' and 'wd'.
+
+        Returns:
+            df_approx ([pd.DataFrame]): Dataframe with the columns 'wd',
+                'ws', 'ti' and the turbine variables 'pow_000', ....
+        """
+        ti_mesh, ws_mesh, wd_mesh = np.meshgrid(
+            self.ti, self.ws, self.wd, indexing='ij'
+        )
+        df_dict = {
+            "wd": wd_mesh.flatten(),
+            "ws": ws_mesh.flatten(),
+            "ti": ti_mesh.flatten(),
+        }
+        for varname in self.varnames:
+            values = self.get_values(varname).transpose(2, 1, 0, 3)
+            values = values.reshape(-1, len(self._turbine_ids))
+            for ii, turbi in enumerate(self.turbines):
+                df_dict["{:s}_{:03d}".format(varname, turbi)] = values[:, ii]
+        return pd.DataFrame(df_dict)
+
+    def save(self, path):
+        """Save the selected turbines and variables to a directory holding
+        the gridded values in 'values.npy' and the axes in 'axes.npz'.
+
+        Args:
+            path ([str]): Path to the directory.
+        """
+        values = _create_floris_surrogate_file(
+            path, self.wd, self.ws, self.ti, self.turbines, self.varnames,
+            dtype=self.values.dtype,
+        )
+        for jj, varname in enumerate(self.varnames):
+            values[:, :, :, :, jj] = self.get_values(varname)
+        values.flush()
+        del values
+
+    @classmethod
+    def load(cls, path, turbines=None, varnames=None, mmap_mode='r'):
+        """Load a surrogate previously saved with save(). The values are
+        memory-mapped, so that only the selected turbines and variables
+        are read from disk when they are used.
+
+        Args:
+            path ([str]): Path to the directory.
+            turbines ([list], optional): Turbine numbers to load. If None,
+                loads all turbines. Defaults to None.
+            varnames ([list], optional): Variable names to load. If None,
+                loads all variables. Defaults to None.
+            mmap_mode (str, optional): Memory-map mode of np.load(). If
+                None, reads all values into memory. Defaults to 'r'.
+
+        Returns:
+            surrogate ([floris_surrogate]): The loaded surrogate.
+        """
+        values = np.load(os.path.join(path, "values.npy"), mmap_mode=mmap_mode)
+        with np.load(os.path.join(path, "axes.npz"), allow_pickle=False) as f:
+            surrogate = cls(
+                f["wd"], f["ws"], f["ti"], values,
+                varnames=f["varnames"], turbines=f["turbines"],
+            )
+        return surrogate.select(turbines=turbines, varnames=varnames)
+
+
+def _create_floris_surrogate_file(
+    path, wd, ws, ti, turbines, varnames, dtype=np.float32
+):
+    """Create the files of a floris_surrogate in the directory path: the
+    axes in 'axes.npz' and an empty, memory-mapped array of shape (n_wd,
+    n_ws, n_ti, n_turbines, n_variables) in 'values.npy', which is
+    returned to be filled in."""
+    os.makedirs(path, exist_ok=True)
+    np.savez(
+        os.path.join(path, "axes.npz"),
+        wd=np.array(wd, dtype=float),
+        ws=np.array(ws, dtype=float),
+        ti=np.array(ti, dtype=float),
+        turbines=np.array(turbines, dtype=int),
+        varnames=np.array(varnames),
+    )
+    return np.lib.format.open_memmap(
+        os.path.join(path, "values.npy"),
+        mode='w+',
+        dtype=dtype,
+        shape=(len(wd), len(ws), len(ti), len(turbines), len(varnames)),
+    )
+
+
+class _gridded_interpolant():
+    """Interpolant over (wd, ws, ti) of one variable of a floris_surrogate,
+    which gathers the surrounding grid points from the (memory-mapped)
+    values on every call."""
+    def __init__(self, surrogate, var_id, method):
+        self.values = surrogate.values
+        self.axes = [surrogate.wd, surrogate.ws, surrogate.ti]
+        self.bounds = [(0.0, 360.0), (0.0, 99.0), (0.0, 1.0)]
+        self.turbine_ids = surrogate._turbine_ids
+        self.var_id = var_id
+        self.method = method
+
+    def _get_axis_weights(self, axis, x):
+        """Return the lower and upper grid indices and the weight of the
+        upper grid point for every value in x."""
+        x = np.array(x, dtype=float)
+        lb, ub = self.bounds[axis]
+        is_valid = (x >= lb) & (x <= ub)
+        if axis == 0:
+            # Periodic wind direction, wrapping from the last grid point to
+            # the first grid point plus 360 deg
+            x = self.axes[0][0] + wrap_360(x - self.axes[0][0])
+            x_grid = np.append(self.axes[0], self.axes[0][0] + 360.0)
+            if x_grid[-1] - x_grid[-2] < 1.0e-6:
+                x_grid = x_grid[:-1]  # Grid already ends at 360 deg
+        else:
+            x_grid = self.axes[axis]
+            x = np.clip(x, x_grid[0], x_grid[-1])
+
+        x[~is_valid] = x_grid[0]
+        i_lb = np.searchsorted(x_grid, x, side='right') - 1
+        i_lb = np.clip(i_lb, 0, np.max([len(x_grid) - 2, 0]))
+        i_ub = np.clip(i_lb + 1, None, len(x_grid) - 1)
+        dx = x_grid[i_ub] - x_grid[i_lb]
+        w = np.divide(
+            x - x_grid[i_lb], dx, out=np.zeros_like(x), where=(dx > 0.0)
+        )
+        if self.method == 'nearest':
+            w = (w > 0.5).astype(float)
+
+        n = len(self.axes[axis])
+        return np.remainder(i_lb, n), np.remainder(i_ub, n), w, is_valid
+
+    def __call__(self, points):
+        points = np.array(points, dtype=float)
+        weights = [self._get_axis_weights(ii, points[:, ii]) for ii in range(3)]
+
+        out = np.zeros((points.shape[0], len(self.turbine_ids)))
+        for corner in np.ndindex(2, 2, 2):
+            ids = tuple(wgt[c] for wgt, c in zip(weights, corner))
+            w_corner = np.prod(
+                [w[2] if c else 1.0 - w[2] for w, c in zip(weights, corner)],
+                axis=0,
+            )
+            if not np.any(w_corner > 0.0):
+                continue
+            vals = self.values[ids][:, self.turbine_ids, self.var_id]
+            out += w_corner[:, None] * vals
+
+        is_valid = np.all([w[3] for w in weights], axis=0)
+        out[~is_valid, :] = np.nan
+        return out
+
+
 def calc_floris_approx_table(
     fi,
     wd_array=np.arange(0.0, 360.0, 1.0),
     ws_array=np.arange(0.001, 26.001, 1.0),
     ti_array=None,
+    num_workers=1,
+    max_grid_size=1000,
+    save_path=None,
+    return_surrogate=False,
     ):
+    """Calculate a table of FLORIS solutions for every combination of the
+    wind directions, wind speeds and turbulence intensities specified. The
+    grid is split into chunks of a single turbulence intensity and a range
+    of wind directions, each evaluated in a single grid-style FLORIS
+    calculation, and the solutions are written into a preallocated array.
+
+    Args:
+        fi ([FlorisInterface]): Floris object for the wind farm of interest.
+        wd_array ([iterable], optional): Wind directions in deg. Defaults
+            to np.arange(0.0, 360.0, 1.0).
+        ws_array ([iterable], optional): Wind speeds in m/s. Defaults to
+            np.arange(0.001, 26.001, 1.0).
+        ti_array ([iterable], optional): Turbulence intensities. If None,
+            uses the turbulence intensity of the FLORIS object. Defaults
+            to None.
+        num_workers (int, optional): Number of worker processes over which
+            the chunks are distributed, using the persistent pool of
+            calc_floris(). Defaults to 1.
+        max_grid_size (int, optional): Maximum number of conditions in a
+            chunk, which bounds the memory of every FLORIS calculation.
+            Defaults to 1000.
+        save_path ([str], optional): Directory in which the solutions are
+            stored in the format of floris_surrogate.save(), i.e., in a
+            memory-mapped array 'values.npy' of shape (n_wd, n_ws, n_ti,
+            n_turbines, 1) with the axes in 'axes.npz', along with the
+            completed chunks in 'chunks_done.npy'. The finished table can
+            be loaded with floris_surrogate.load(save_path). If this
+            directory already holds a partially completed table for the
+            same grid, only the remaining chunks are calculated. If None,
+            the solutions are kept in memory. Defaults to None.
+        return_surrogate (bool, optional): Return the solutions as a
+            floris_surrogate rather than as a dataframe, which avoids
+            building the full table in memory. If save_path is specified,
+            the surrogate is memory-mapped from save_path. Defaults to
+            False.
 
+    Returns:
+        df_approx ([pd.DataFrame]): Dataframe with the columns 'wd', 'ws',
+            'ti' and the power production of every turbine, 'pow_000',
+            ..., sorted by 'ti', 'ws' and 'wd'. If return_surrogate is
+            True, a floris_surrogate with the variable 'pow' is returned
+            instead.
+    """
     # if ti_array is None, use the current value in the FLORIS object
     if ti_array is None:
         ti = fi.floris.flow_field.turbulence_intensity
@@ -406,41 +1039,136 @@ def calc_floris_approx_table(
     num_turbines = len(fi.layout_x)
 
     # Format input arrays
-    wd_array = np.sort(wd_array)
-    ws_array = np.sort(ws_array)
-    ti_array = np.sort(ti_array)
-    wd_mesh, ws_mesh = np.meshgrid(wd_array, ws_array, indexing='ij')
+    wd_array = np.sort(np.array(wd_array, dtype=float))
+    ws_array = np.sort(np.array(ws_array, dtype=float))
+    ti_array = np.sort(np.array(ti_array, dtype=float))
     N_approx = len(wd_array) * len(ws_array) * len(ti_array)
     print(
         'Generating a df_approx table of FLORIS solutions ' +
         'covering a total of {:d} cases.'.format(N_approx)
     )
 
-    # Create solutions, one set per turbulence intensity
-    df_list = []
-    for turb_intensity in ti_array:
-        # Calculate solutions
-        fi.reinitialize(
-            wind_directions=wd_array,
-            wind_speeds=ws_array,
-            turbulence_intensity=turb_intensity,
+    # Split the grid into chunks of wind directions per turbulence intensity
+    dN = int(np.max([np.floor(max_grid_size / len(ws_array)), 1]))
+    chunks = [
+        (ii, jj, np.min([jj + dN, len(wd_array)]))
+        for ii in range(len(ti_array))
+        for jj in range(0, len(wd_array), dN)
+    ]
+
+    # Preallocate the solutions, resuming from a previous run if possible
+    shape = (len(wd_array), len(ws_array), len(ti_array), num_turbines, 1)
+    if save_path is None:
+        solutions = np.zeros(shape)
+        chunks_done = np.zeros(len(chunks), dtype=bool)
+    else:
+        solutions, chunks_done = _open_floris_approx_table(
+            save_path, wd_array, ws_array, ti_array, shape, len(chunks)
         )
-        fi.calculate_wake()
-        turbine_powers = fi.get_turbine_powers()
-
-        # Create a dictionary to save solutions in
-        solutions_dict = {"wd": wd_mesh.flatten(), "ws": ws_mesh.flatten()}
-        solutions_dict["ti"] = turb_intensity * np.ones(len(wd_array) * len(ws_array))
-        for turbi in range(num_turbines):
-            solutions_dict["pow_{:03d}".format(turbi)] = \
-                turbine_powers[:, :, turbi].flatten()
-        df_list.append(pd.DataFrame(solutions_dict))
+        if np.any(chunks_done):
+            print('Resuming from {:d} of {:d} completed chunks.'.format(
+                int(np.sum(chunks_done)), len(chunks)))
+
+    def save_chunk(chunk_id, turbine_powers):
+        ii, jj_0, jj_1 = chunks[chunk_id]
+        solutions[jj_0:jj_1, :, ii, :, 0] = turbine_powers
+        chunks_done[chunk_id] = True
+        if save_path is not None:
+            solutions.flush()
+            np.save(os.path.join(save_path, "chunks_done.npy"), chunks_done)
+        n_done = int(np.sum(chunks_done))
+        if (np.remainder(n_done, 10) == 0) or (n_done == len(chunks)):
+            print('  Progress: finished %.1f percent (%d/%d chunks).'
+                  % (100. * n_done / len(chunks), n_done, len(chunks)))
+
+    # Calculate the solutions of the remaining chunks
+    chunk_ids = np.where(~chunks_done)[0]
+    if (num_workers > 1) and (len(chunk_ids) > 1):
+        executor = _get_floris_pool(fi, num_workers)
+        futures = {
+            executor.submit(
+                _calc_floris_approx_chunk,
+                None,
+                wd_array[chunks[kk][1]:chunks[kk][2]],
+                ws_array,
+                ti_array[chunks[kk][0]],
+            ): kk
+            for kk in chunk_ids
+        }
+        try:
+            for future in as_completed(futures):
+                save_chunk(futures[future], future.result())
+        finally:
+            for future in futures:
+                future.cancel()
+    else:
+        for kk in chunk_ids:
+            save_chunk(kk, _calc_floris_approx_chunk(
+                fi,
+                wd_array[chunks[kk][1]:chunks[kk][2]],
+                ws_array,
+                ti_array[chunks[kk][0]],
+            ))
 
     print('Finished calculating the FLORIS solutions for the dataframe.')
-    df_approx = pd.concat(df_list, axis=0).sort_values(by=["ti", "ws", "wd"])
-    df_approx = df_approx.reset_index(drop=True)
+    if save_path is not None:
+        del solutions  # Close the writable memory map
+        surrogate = floris_surrogate.load(save_path)
+    else:
+        surrogate = floris_surrogate(
+            wd_array, ws_array, ti_array, solutions, varnames=['pow']
+        )
+    if return_surrogate:
+        return surrogate
+    return surrogate.to_df_approx()
+
+
+def _calc_floris_approx_chunk(fi, wd_array, ws_array, turb_intensity):
+    """Calculate the turbine powers of shape (n_wd, n_ws, n_turbines) on a
+    grid of wind directions and wind speeds. If fi is None, uses the
+    FLORIS object of the worker process."""
+    if fi is None:
+        fi = _floris_worker_fi
+    fi.reinitialize(
+        wind_directions=wd_array,
+        wind_speeds=ws_array,
+        turbulence_intensity=turb_intensity,
+    )
+    fi.calculate_wake()
+    return fi.get_turbine_powers()
+
 
-    return df_approx
+def _open_floris_approx_table(
+    save_path, wd_array, ws_array, ti_array, shape, num_chunks
+):
+    """Open the memory-mapped solutions and the completed chunks of a
+    FLORIS approximation table in save_path, in the format of
+    floris_surrogate.save(), creating them if they do not exist yet or if
+    they were generated for a different grid.
+    """
+    fn_values = os.path.join(save_path, "values.npy")
+    fn_axes = os.path.join(save_path, "axes.npz")
+    fn_done = os.path.join(save_path, "chunks_done.npy")
+
+    if all(os.path.exists(fn) for fn in [fn_values, fn_axes, fn_done]):
+        chunks_done = np.load(fn_done)
+        with np.load(fn_axes, allow_pickle=False) as f:
+            same_grid = all(
+                np.array_equal(f[key], x) for key, x in
+                [("wd", wd_array), ("ws", ws_array), ("ti", ti_array)]
+            )
+        if same_grid and (len(chunks_done) == num_chunks):
+            solutions = np.load(fn_values, mmap_mode='r+')
+            if solutions.shape == shape:
+                return solutions, chunks_done
+
+    solutions = _create_floris_surrogate_file(
+        save_path, wd_array, ws_array, ti_array,
+        turbines=range(shape[3]), varnames=['pow'], dtype=float,
+    )
+    chunks_done = np.zeros(num_chunks, dtype=bool)
+    np.save(fn_done, chunks_done)
+    return solutions, chunks_done
 
 
 def get_turbs_in_radius(x_turbs, y_turbs, turb_no, max_radius,
@@ -0,0 +1,188 @@
+import os
+import numpy as np
+import pandas as pd
+
+import unittest
+from flasc.energy_ratio import energy_ratio
+from flasc.energy_ratio.energy_ratio_accumulator import (
+    energy_ratio_accumulator,
+)
+from flasc.energy_ratio.energy_ratio_cube import (
+    energy_ratio_cube,
+    get_balanced_bin_freq,
+    get_fine_cube,
+)
+
+
+def load_data(seed=0, N=2000):
+    # Random dataset with some missing values
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "time": pd.date_range("2020-01-01", periods=N, freq="10min"),
+        "wd": rng.uniform(0.0, 360.0, N),
+        "ws": rng.uniform(2.0, 14.0, N),
+        "ti": rng.uniform(0.03, 0.20, N),
+    })
+    for ti in range(3):
+        df["pow_{:03d}".format(ti)] = rng.uniform(100.0, 1000.0, N)
+        df.loc[rng.choice(N, N // 50), "pow_{:03d}".format(ti)] = np.nan
+    df["pow_ref"] = df["pow_000"]
+    return df
+
+
+class TestEnergyRatioCube(unittest.TestCase):
+    def test_energy_ratio_from_cube(self):
+        df = load_data()
+        cube = energy_ratio_cube(
+            df,
+            test_turbines_list=[[1], [1, 2]],
+            wd_step=5.0,
+            ws_step=2.0,
+            wd_bin_width=10.0,
+            store_moments=True,
+        )
+
+        # Energy ratios must equal those calculated from the raw data
+        for test_turbines in [[1], [1, 2]]:
+            era = energy_ratio.energy_ratio(df_in=df)
+            out, dict_out = era.get_energy_ratio(
+                test_turbines=test_turbines,
+                wd_step=5.0,
+                ws_step=2.0,
+                wd_bin_width=10.0,
+                return_detailed_output=True,
+            )
+            out_cube = cube.get_energy_ratio(test_turbines)
+            pd.testing.assert_frame_equal(out, out_cube)
+
+            dict_out_cube = cube.get_detailed_output(test_turbines)
+            for key in ["df_per_wd_bin", "df_per_ws_bin"]:
+                df_a = dict_out[key]
+                df_b = dict_out_cube[key]
+                self.assertEqual(list(df_a.columns), list(df_b.columns))
+                for c in ["bin_count", "pow_test_mean", "ws_std"]:
+                    self.assertTrue(
+                        np.allclose(
+                            np.array(df_a[c], dtype=float),
+                            np.array(df_b[c], dtype=float),
+                            equal_nan=True,
+                        )
+                    )
+
+    def test_cube_selection_and_io(self):
+        df = load_data()
+        cube = energy_ratio_cube(
+            df,
+            wd_step=10.0,
+            ws_step=4.0,
+            ti_bins=[[0.0, 0.1], [0.1, 0.2]],
+            time_bucket="1D",
+        )
+        self.assertEqual(len(cube.test_turbines_list), 3)
+
+        # Selecting bins in the cube equals filtering the raw data
+        df_subset = df[
+            (df["ti"] >= 0.1) & (df["ti"] < 0.2) &
+            (df["time"] >= "2020-01-03") & (df["time"] < "2020-01-10")
+        ]
+        era = energy_ratio.energy_ratio(df_in=df_subset)
+        out = era.get_energy_ratio(test_turbines=[2], wd_step=10.0, ws_step=4.0)
+        out_cube = cube.get_energy_ratio(
+            [2], ti_range=[0.1, 0.2], time_range=["2020-01-03", "2020-01-10"]
+        )
+        pd.testing.assert_frame_equal(out, out_cube)
+
+        # Save and load the cube
+        fn = os.path.join(os.path.dirname(__file__), "cube_test.npz")
+        try:
+            cube.save(fn)
+            cube_loaded = energy_ratio_cube.load(fn)
+        finally:
+            if os.path.exists(fn):
+                os.remove(fn)
+        pd.testing.assert_frame_equal(
+            cube.get_energy_ratio_batch(), cube_loaded.get_energy_ratio_batch()
+        )
+
+        # Balancing a cube with itself yields its own bin frequencies
+        bin_freq = get_balanced_bin_freq([cube, cube_loaded])
+        self.assertTrue(np.array_equal(bin_freq, cube.get_bin_freq()))
+
+    def test_energy_ratio_time_series(self):
+        df = load_data(N=5000)
+        cube = energy_ratio_cube(
+            df, test_turbines_list=[[1]], wd_step=30.0, ws_step=4.0,
+            time_bucket="1D",
+        )
+        out = cube.get_energy_ratio_time_series([1], window="7D", step=2)
+        self.assertEqual(out.shape, (int(np.ceil((35 - 7 + 1) / 2)), 12))
+
+        # Every window equals the energy ratio over its time range
+        bin_freq = cube.get_bin_freq()
+        for t in out.index[[0, 5, -1]]:
+            out_window = cube.get_energy_ratio(
+                [1],
+                time_range=[t, t + pd.Timedelta("7D")],
+                bin_freq=bin_freq,
+            )
+            np.testing.assert_allclose(
+                out.loc[t, out_window["wd_bin"]], out_window["baseline"]
+            )
+
+    def test_accumulator(self):
+        df = load_data()
+        acc = energy_ratio_accumulator(
+            test_turbines_list=[[1], [2]], wd_step=5.0, ws_step=2.0
+        )
+        self.assertRaises(ValueError, acc.result)
+
+        # Stream the data in chunks, keeping a rolling window of 1000 rows
+        for i0 in range(0, 2000, 250):
+            acc.update(df.iloc[i0:i0 + 250])
+            if i0 >= 1000:
+                acc.subtract(df.iloc[i0 - 1000:i0 - 750])
+
+        era = energy_ratio.energy_ratio(df_in=df.iloc[1000:])
+        out = era.get_energy_ratio(test_turbines=[2], wd_step=5.0, ws_step=2.0)
+        pd.testing.assert_frame_equal(out, acc.result([2]))
+        self.assertEqual(acc.num_entries, 1000)
+
+        # Cannot subtract data that was never added
+        self.assertRaises(ValueError, acc.subtract, df.iloc[:250])
+
+    def test_rebin_fine_cube(self):
+        df = load_data()
+        fine_cube = get_fine_cube(
+            df, wd_resolution=0.5, ws_resolution=0.5, test_turbines_list=[[2]]
+        )
+
+        # Coarse and overlapping bins equal those binned from the raw data
+        for kwargs in [
+            {"wd_step": 2.0, "ws_step": 1.0},
+            {"wd_step": 5.0, "ws_step": 2.0, "wd_bin_width": 15.0},
+        ]:
+            cube = energy_ratio_cube(df, test_turbines_list=[[2]], **kwargs)
+            pd.testing.assert_frame_equal(
+                fine_cube.rebin(**kwargs).get_energy_ratio([2]),
+                cube.get_energy_ratio([2]),
+            )
+
+        # Bin edges must align with the fine bins
+        self.assertRaises(ValueError, fine_cube.rebin, wd_step=0.3)
+
+    def test_rebin_after_update(self):
+        df = load_data()
+        acc = energy_ratio_accumulator(
+            test_turbines_list=[[2]], wd_step=5.0, ws_step=2.0
+        )
+        kwargs = {"wd_step": 10.0, "ws_step": 2.0}
+
+        # Rebinning after an update reflects all data added so far
+        acc.update(df.iloc[:1000])
+        acc.cube.rebin(**kwargs)
+        acc.update(df.iloc[1000:])
+        cube = energy_ratio_cube(df, test_turbines_list=[[2]], **kwargs)
+        pd.testing.assert_frame_equal(
+            acc.cube.rebin(**kwargs).get_energy_ratio([2]),
+            cube.get_energy_ratio([2]),
+        )
@@ -1,11 +1,14 @@
 from io import StringIO
 import os
+import numpy as np
 import pandas as pd
 
 import unittest
 
 from floris import tools as wfct
 from flasc.energy_ratio import energy_ratio
+from flasc.energy_ratio import energy_ratio_binning as erb
+from flasc.energy_ratio import energy_ratio_suite
 from flasc.dataframe_operations import dataframe_manipulations as dfm
 from flasc import floris_tools as ftools
 
@@ -159,3 +162,352 @@ class TestEnergyRatio(unittest.TestCase):
         self.assertEqual(out.loc[3, "bin_count"], 34)
         self.assertEqual(out.loc[4, "bin_count"], 38)
         self.assertEqual(out.loc[5, "bin_count"], 6)
+
+    def test_energy_ratio_bootstrapping(self):
+        # Load data and FLORIS model
+        fi = load_floris()
+        df = load_data()
+        df = dfm.set_wd_by_all_turbines(df)
+        df_upstream = ftools.get_upstream_turbs_floris(fi)
+        df = dfm.set_ws_by_upstream_turbines(df, df_upstream)
+        df = dfm.set_pow_ref_by_turbines(df, turbine_numbers=[0, 6])
+
+        # Bootstrapping must be reproducible regardless of n_jobs
+        era = energy_ratio.energy_ratio(df_in=df, verbose=True)
+        out_serial = era.get_energy_ratio(
+            test_turbines=[1], wd_step=2.0, ws_step=1.0, wd_bin_width=3.0,
+            N=50, seed=0, n_jobs=1,
+        )
+        out_parallel = era.get_energy_ratio(
+            test_turbines=[1], wd_step=2.0, ws_step=1.0, wd_bin_width=3.0,
+            N=50, seed=0, n_jobs=2,
+        )
+        self.assertTrue(out_serial.equals(out_parallel))
+        out_serial = out_serial.dropna()
+        self.assertTrue(out_serial.shape[0] > 0)
+        self.assertTrue(
+            (out_serial["baseline_lb"] <= out_serial["baseline_ub"]).all()
+        )
+
+    def test_energy_ratio_batch(self):
+        # Load data and FLORIS model
+        fi = load_floris()
+        df = load_data()
+        df = dfm.set_wd_by_all_turbines(df)
+        df_upstream = ftools.get_upstream_turbs_floris(fi)
+        df = dfm.set_ws_by_upstream_turbines(df, df_upstream)
+        df = dfm.set_pow_ref_by_turbines(df, turbine_numbers=[0, 6])
+
+        # Batch results must equal those of the individual calls
+        era = energy_ratio.energy_ratio(df_in=df, verbose=True)
+        test_turbines_list = [[1], [2], [3, 4]]
+        out_batch = era.get_energy_ratio_batch(
+            test_turbines_list, wd_step=2.0, ws_step=1.0, wd_bin_width=3.0,
+        )
+        for test_turbines in test_turbines_list:
+            out = era.get_energy_ratio(
+                test_turbines=test_turbines,
+                wd_step=2.0,
+                ws_step=1.0,
+                wd_bin_width=3.0,
+            )
+            ids = out_batch["test_turbines"] == tuple(test_turbines)
+            out_set = out_batch[ids].drop(columns="test_turbines")
+            pd.testing.assert_frame_equal(
+                out_set.reset_index(drop=True), out
+            )
+
+    def test_energy_ratio_detailed_output(self):
+        # Load data and FLORIS model
+        fi = load_floris()
+        df = load_data()
+        df = dfm.set_wd_by_all_turbines(df)
+        df_upstream = ftools.get_upstream_turbs_floris(fi)
+        df = dfm.set_ws_by_upstream_turbines(df, df_upstream)
+        df = dfm.set_pow_ref_by_turbines(df, turbine_numbers=[0, 6])
+
+        # Overlapping wind direction bins
+        era = energy_ratio.energy_ratio(df_in=df, verbose=True)
+        out, dict_out = era.get_energy_ratio(
+            test_turbines=[1],
+            wd_step=2.0,
+            ws_step=1.0,
+            wd_bin_width=3.0,
+            return_detailed_output=True,
+        )
+        df_per_wd_bin = dict_out["df_per_wd_bin"]
+        df_per_ws_bin = dict_out["df_per_ws_bin"]
+        self.assertTrue(
+            np.allclose(
+                df_per_wd_bin["energy_ratio_balanced"],
+                out["baseline"],
+                equal_nan=True,
+            )
+        )
+        self.assertTrue(
+            np.array_equal(df_per_wd_bin["bin_count"], out["bin_count"])
+        )
+
+        # Statistics must equal those of the rows in every bin
+        for wd_bin, ws_bin in [(21.0, 1.5), (23.0, 2.5)]:
+            ids = (
+                (df["wd"] >= wd_bin - 1.5) &
+                (df["wd"] < wd_bin + 1.5) &
+                (df["ws"] >= ws_bin - 0.5) &
+                (df["ws"] < ws_bin + 0.5)
+            )
+            df_bin = df.loc[ids, ["wd", "ws", "pow_ref", "pow_001"]]
+            row = df_per_ws_bin.loc[wd_bin]
+            row = row[row["ws_bin"] == ws_bin].iloc[0]
+            self.assertEqual(row["bin_count"], df_bin.shape[0])
+            self.assertAlmostEqual(row["wd_std"], df_bin["wd"].std())
+            self.assertAlmostEqual(row["ws_mean"], df_bin["ws"].mean())
+            self.assertAlmostEqual(
+                row["pow_test_std"], df_bin["pow_001"].std()
+            )
+
+    def test_energy_ratio_analytic_uq(self):
+        # Random dataset with a test power that correlates with pow_ref
+        rng = np.random.default_rng(0)
+        N = 20000
+        df = pd.DataFrame({
+            "wd": rng.uniform(0.0, 360.0, N),
+            "ws": rng.uniform(4.0, 12.0, N),
+            "pow_000": rng.uniform(100.0, 1000.0, N),
+        })
+        df["pow_001"] = 0.8 * df["pow_000"] + rng.normal(0.0, 50.0, N)
+        df["pow_ref"] = df["pow_000"]
+
+        # Analytic bounds must be close to the bootstrapped bounds
+        era = energy_ratio.energy_ratio(df_in=df)
+        kwargs = {"test_turbines": [1], "wd_step": 30.0, "ws_step": 2.0}
+        out_analytic = era.get_energy_ratio(uq_method="analytic", **kwargs)
+        out_bootstrap = era.get_energy_ratio(N=500, seed=0, **kwargs)
+        self.assertTrue(
+            np.allclose(out_analytic["baseline"], out_bootstrap["baseline"])
+        )
+        width_analytic = (
+            out_analytic["baseline_ub"] - out_analytic["baseline_lb"]
+        )
+        width_bootstrap = (
+            out_bootstrap["baseline_ub"] - out_bootstrap["baseline_lb"]
+        )
+        self.assertTrue(
+            np.allclose(width_analytic, width_bootstrap, rtol=0.2)
+        )
+
+        self.assertRaises(
+            ValueError, era.get_energy_ratio, uq_method="jackknife", **kwargs
+        )
+
+    def test_energy_ratio_block_bootstrapping(self):
+        # Random 1-minute dataset with autocorrelated test power
+        rng = np.random.default_rng(0)
+        N = 5000
+        df = pd.DataFrame({
+            "time": pd.date_range("2020-01-01", periods=N, freq="1min"),
+            "wd": np.cumsum(rng.normal(0.0, 2.0, N)) % 360.0,
+            "ws": rng.uniform(4.0, 12.0, N),
+            "pow_000": rng.uniform(100.0, 1000.0, N),
+        })
+        noise = np.repeat(rng.normal(0.0, 50.0, N // 100), 100)
+        df["pow_001"] = 0.8 * df["pow_000"] + noise
+        df["pow_ref"] = df["pow_000"]
+
+        era = energy_ratio.energy_ratio(df_in=df)
+        kwargs = {
+            "test_turbines": [1], "wd_step": 90.0, "ws_step": 4.0,
+            "N": 200, "seed": 0,
+        }
+        out_iid = era.get_energy_ratio(**kwargs)
+
+        # Blocks of a single data entry are equivalent to i.i.d. resampling
+        out_block = era.get_energy_ratio(block_length="1min", **kwargs)
+        pd.testing.assert_frame_equal(out_iid, out_block)
+
+        # Blocks of correlated data entries widen the confidence bounds
+        out_block = era.get_energy_ratio(block_length="2h", **kwargs)
+        width_iid = out_iid["baseline_ub"] - out_iid["baseline_lb"]
+        width_block = out_block["baseline_ub"] - out_block["baseline_lb"]
+        self.assertTrue((width_block > width_iid).all())
+
+    def test_energy_ratio_suite_balancing(self):
+        # Load data and FLORIS model
+        fi = load_floris()
+        df = load_data()
+        df = dfm.set_wd_by_all_turbines(df)
+        df_upstream = ftools.get_upstream_turbs_floris(fi)
+        df = dfm.set_ws_by_upstream_turbines(df, df_upstream)
+        df = dfm.set_pow_ref_by_turbines(df, turbine_numbers=[0, 6])
+        df_subset = df.iloc[::2].reset_index(drop=True)
+
+        s = energy_ratio_suite.energy_ratio_suite()
+        s.add_df(df, "full")
+        s.add_df(df_subset, "subset")
+        s.get_energy_ratios(
+            test_turbines=[1], wd_step=2.0, ws_step=1.0, verbose=False
+        )
+
+        # The subset holds the minimum count of every bin, so balancing
+        # does not change its energy ratios
+        era = energy_ratio.energy_ratio(df_in=df_subset)
+        out = era.get_energy_ratio(test_turbines=[1], wd_step=2.0, ws_step=1.0)
+        pd.testing.assert_frame_equal(s.df_list[1]["er_results"], out)
+
+    def test_energy_ratio_matrix(self):
+        # Random dataset with missing power values
+        rng = np.random.default_rng(0)
+        N = 2000
+        df = pd.DataFrame({
+            "wd": rng.uniform(0.0, 360.0, N),
+            "ws": rng.uniform(4.0, 12.0, N),
+        })
+        for ti in range(4):
+            x = rng.uniform(100.0, 1000.0, N)
+            x[rng.choice(N, N // 20)] = np.nan
+            df["pow_{:03d}".format(ti)] = x
+        df["pow_ref"] = df["pow_000"]
+
+        era = energy_ratio.energy_ratio(df_in=df)
+        out, wd_bin = era.get_energy_ratio_matrix(
+            test_turbines=[1, 2, 3], ref_turbines=[0, 3], wd_step=30.0,
+            ws_step=2.0, max_chunk_size=10_000,
+        )
+        self.assertEqual(out.shape, (3, 2, 12))
+
+        # Every pair equals the energy ratio with that reference turbine
+        for ii, jj in [(0, 0), (1, 1), (2, 1)]:
+            df_pair = df.copy()
+            df_pair["pow_ref"] = df["pow_{:03d}".format([0, 3][jj])]
+            era = energy_ratio.energy_ratio(df_in=df_pair)
+            out_pair = era.get_energy_ratio(
+                test_turbines=[ii + 1], wd_step=30.0, ws_step=2.0
+            )
+            ids = np.searchsorted(wd_bin, out_pair["wd_bin"])
+            np.testing.assert_allclose(out[ii, jj, ids], out_pair["baseline"])
+
+    def test_energy_ratio_uplift(self):
+        # Random datasets with a 5 % higher test power when controlled
+        rng = np.random.default_rng(0)
+        df_list = []
+        for N, gain in [(4000, 1.0), (3000, 1.05)]:
+            df = pd.DataFrame({
+                "wd": rng.uniform(0.0, 360.0, N),
+                "ws": rng.uniform(4.0, 12.0, N),
+                "pow_000": rng.uniform(100.0, 1000.0, N),
+            })
+            df["pow_001"] = gain * 0.8 * df["pow_000"]
+            df["pow_001"] += rng.normal(0.0, 50.0, N)
+            df["pow_ref"] = df["pow_000"]
+            df_list.append(df)
+
+        s = energy_ratio_suite.energy_ratio_suite()
+        s.add_df(df_list[0], "baseline")
+        s.add_df(df_list[1], "controlled")
+        kwargs = {"wd_step": 30.0, "ws_step": 2.0, "verbose": False}
+        df_uplift, df_total = s.get_energy_ratio_uplift(
+            test_turbines=[1], N=200, seed=0, **kwargs
+        )
+
+        # Nominal energy ratios match the balanced energy ratios
+        s.get_energy_ratios(test_turbines=[1], **kwargs)
+        for ii, c in enumerate(["er_baseline", "er_controlled"]):
+            np.testing.assert_allclose(
+                df_uplift[c], s.df_list[ii]["er_results"]["baseline"]
+            )
+        np.testing.assert_allclose(
+            df_uplift["delta"],
+            df_uplift["er_controlled"] - df_uplift["er_baseline"],
+        )
+
+        self.assertEqual(df_total.shape[0], 1)
+        df = pd.concat([df_uplift, df_total])
+        for c in ["delta", "uplift"]:
+            self.assertTrue((df[c + "_lb"] <= df[c]).all())
+            self.assertTrue((df[c + "_ub"] >= df[c]).all())
+        self.assertTrue(
+            df_total["uplift_lb"][0] < 5.0 < df_total["uplift_ub"][0]
+        )
+
+        # With overlapping bins, the total counts every entry only once
+        df_uplift, df_total = s.get_energy_ratio_uplift(
+            test_turbines=[1], wd_bin_width=60.0, **kwargs
+        )
+        self.assertGreater(df_uplift["bin_count"].sum(), 4000)
+        self.assertLessEqual(df_total["bin_count"][0], 3000)
+        self.assertGreater(df_total["bin_count"][0], 2500)
+
+        # Bins with a zero baseline energy ratio have no finite uplift
+        df_list[0].loc[df_list[0]["wd"] < 30.0, "pow_001"] = 0.0
+        s = energy_ratio_suite.energy_ratio_suite()
+        s.add_df(df_list[0], "baseline")
+        s.add_df(df_list[1], "controlled")
+        df_uplift, _ = s.get_energy_ratio_uplift(
+            test_turbines=[1], N=50, seed=0, **kwargs
+        )
+        is_zero = (df_uplift["er_baseline"] == 0.0)
+        self.assertTrue(is_zero.any())
+        for c in ["uplift", "uplift_lb", "uplift_ub"]:
+            self.assertTrue(df_uplift.loc[is_zero, c].isna().all())
+            self.assertTrue(np.isfinite(df_uplift.loc[~is_zero, c]).all())
+
+    def test_energy_ratio_suite_masks(self):
+        rng = np.random.default_rng(0)
+        N = 1000
+        df = pd.DataFrame({
+            "time": pd.date_range("2020-01-01", periods=N, freq="10min"),
+            "wd": rng.uniform(0.0, 360.0, N),
+            "ws": rng.uniform(0.0, 4.0, N),
+            "pow_000": rng.uniform(100.0, 1000.0, N),
+        })
+        df["pow_ref"] = df["pow_000"]
+        df_shuffled = df.sample(frac=1.0, random_state=0)
+
+        s = energy_ratio_suite.energy_ratio_suite()
+        s.add_df(df, "sorted")
+        s.add_df(df_shuffled, "shuffled")
+        t0 = pd.to_datetime("2020-01-02 12:00")
+        t1 = pd.to_datetime("2020-01-05 00:00")
+        s.set_masks(ws_range=[1.0, 3.0], time_range=[t0, t1])
+
+        for ii, d in enumerate(s.df_list):
+            mask = (
+                (d["df"]["time"] >= t0) & (d["df"]["time"] < t1) &
+                (d["df"]["ws"] > 1.0) & (d["df"]["ws"] <= 3.0)
+            )
+            np.testing.assert_array_equal(
+                s.get_subset_ids(ii), np.flatnonzero(mask)
+            )
+            pd.testing.assert_frame_equal(s.get_df_subset(ii), d["df"][mask])
+            cols = ["wd", "pow_ref", "not_a_column"]
+            pd.testing.assert_frame_equal(
+                s.get_df_subset(ii, columns=cols), d["df"][mask][cols[:2]]
+            )
+
+        # The energy ratio class stores the masked data without a copy
+        df_subset = s._get_df_subset_for_energy_ratio(0, [0])
+        era = energy_ratio.energy_ratio(df_in=df_subset, copy_df=False)
+        self.assertIs(era.df_full, df_subset)
+
+        # Time masks require a 'time' column
+        s = energy_ratio_suite.energy_ratio_suite()
+        s.add_df(df.drop(columns=["time"]), "no_time")
+        self.assertRaises(KeyError, s.set_masks, time_range=[t0, t1])
+
+    def test_bin_indices(self):
+        # Wind speed bins with a gap, measurements outside bins and NaNs
+        ws = np.array([0.5, 1.0, 2.7, 4.2, 6.0, np.nan])
+        ws_bins = np.array([[0.0, 1.0], [1.0, 2.0], [3.0, 5.0]])
+        ws_bin_idx = erb.get_ws_bin_indices(ws, ws_bins)
+        self.assertTrue(np.array_equal(ws_bin_idx, [0, 1, -1, 2, -1, -1]))
+
+        # Overlapping wind direction bins, wrapping around 360 deg, as
+        # sliding-window sums over the segments
+        wd = np.array([359.0, 1.0, 2.8, 180.0, np.nan])
+        wd_bins = np.array([[-1.5, 1.5], [0.5, 3.5], [178.5, 181.5]])
+        edges, membership = erb.get_wd_bin_segments(wd_bins)
+        seg_idx = erb.get_wd_segment_indices(wd, edges)
+        ids = (seg_idx >= 0)
+        seg_count = np.bincount(seg_idx[ids], minlength=len(edges))
+        bin_count = erb.get_wd_bin_sums(seg_count, membership)
+        self.assertTrue(np.array_equal(bin_count, [2, 2, 1]))
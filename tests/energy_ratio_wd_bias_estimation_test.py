@@ -0,0 +1,227 @@
+import os
+import numpy as np
+import pandas as pd
+
+import unittest
+from flasc.dataframe_operations import dataframe_manipulations as dfm
+from flasc.energy_ratio import energy_ratio_wd_bias_estimation as best
+from flasc import floris_tools as ftools
+
+
+def load_data(wd_bias=10.0, N=5000):
+    # FLORIS predictions at a single turbulence intensity
+    file_path = os.path.dirname(os.path.abspath(__file__))
+    df_approx = pd.read_feather(
+        os.path.join(file_path, "../examples/demo_dataset/df_approx.ftr")
+    )
+    df_approx = df_approx[df_approx["ti"] == 0.06].reset_index(drop=True)
+
+    # Noisy FLORIS predictions with a biased wind direction measurement
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        "time": pd.date_range("2020-01-01", periods=N, freq="10min"),
+        "wd": rng.uniform(0.0, 360.0, N),
+        "ws": rng.uniform(5.0, 11.0, N),
+    })
+    df = ftools.interpolate_floris_from_df_approx(
+        df, df_approx, verbose=False
+    )
+    for c in [c for c in df.columns if c.startswith("pow_")]:
+        df[c] = df[c] * rng.normal(1.0, 0.03, N)
+    df["wd"] = (df["wd"] + wd_bias) % 360.0
+    df = df.drop(columns=["ti"])
+    return df, df_approx
+
+
+def set_pow_ref(df):
+    return dfm.set_pow_ref_by_turbines(df, turbine_numbers=[0, 2, 4, 6])
+
+
+def set_pow_ref_by_wd(df):
+    # Reference turbine that depends on the wind direction
+    df = df.copy()
+    df["pow_ref"] = np.where(df["wd"] < 180.0, df["pow_006"], df["pow_000"])
+    return df
+
+
+class TestBiasEstimation(unittest.TestCase):
+    def test_fine_histograms(self):
+        df, df_approx = load_data()
+        b = best.bias_estimation(
+            df=df,
+            df_fi_approx=df_approx,
+            test_turbines_subset=[1, 3],
+            df_ws_mapping_func=lambda df: df,
+            df_pow_ref_mapping_func=set_pow_ref,
+        )
+
+        # Energy ratios from the shifted histograms match the rebuilt
+        # energy ratio suites
+        hist = b._get_fine_histograms(ws_mask=(6.0, 10.0))
+        for wd_bias in [0.0, -7.5]:
+            er_scada, er_floris, wd_bin = (
+                best._get_energy_ratios_from_fine_histograms(
+                    hist, wd_bias, wd_step=3.0, wd_bin_width=6.0
+                )
+            )
+            b._get_energy_ratios_allbins(
+                wd_bias, ws_mask=(6.0, 10.0), wd_step=3.0, wd_bin_width=6.0
+            )
+            for ii in range(2):
+                for y, er in [
+                    (er_scada, b.energy_ratios_scada),
+                    (er_floris, b.energy_ratios_floris),
+                ]:
+                    ids = np.searchsorted(wd_bin, er[ii]["wd_bin"])
+                    np.testing.assert_allclose(
+                        y[ii, ids], er[ii]["baseline"], atol=5e-3
+                    )
+
+        wd_bias, _ = b.estimate_wd_bias(
+            ws_mask=(6.0, 10.0),
+            opt_search_range=(-20.0, 20.0),
+            er_wd_bin_width=3.0,
+            use_fine_histograms=True,
+        )
+        self.assertAlmostEqual(float(wd_bias[0]), 10.0, delta=0.5)
+
+    def test_wd_dependent_mapping(self):
+        df, df_approx = load_data(wd_bias=10.0, N=2000)
+
+        b = best.bias_estimation(
+            df=df,
+            df_fi_approx=df_approx,
+            test_turbines_subset=[1, 3],
+            df_ws_mapping_func=lambda df: df,
+            df_pow_ref_mapping_func=set_pow_ref_by_wd,
+        )
+        kwargs = {
+            "ws_mask": (6.0, 10.0),
+            "opt_search_range": (0.0, 20.0),
+            "er_wd_bin_width": 3.0,
+        }
+
+        # The reference power production is mapped for every bias
+        wd_bias, J = b.estimate_wd_bias(**kwargs)
+        self.assertAlmostEqual(float(wd_bias[0]), 10.0, delta=0.5)
+
+        # The fine histograms map the data once for every wind direction
+        # segment of the mapping, and match the rebuilt energy ratio suites
+        hist = b._get_fine_histograms(ws_mask=(6.0, 10.0))
+        self.assertEqual(hist["scada_sums"].shape[0], 2)
+        self.assertEqual(len(np.unique(hist["wd_segment"][1795:1805])), 2)
+        for wd_bias in [0.0, 12.3]:
+            er_scada, _, wd_bin = best._get_energy_ratios_from_fine_histograms(
+                hist, wd_bias, wd_step=3.0, wd_bin_width=3.0
+            )
+            b._get_energy_ratios_allbins(
+                wd_bias, ws_mask=(6.0, 10.0), wd_step=3.0, wd_bin_width=3.0
+            )
+            for ii in range(2):
+                er = b.energy_ratios_scada[ii]
+                ids = np.searchsorted(wd_bin, er["wd_bin"])
+                np.testing.assert_allclose(
+                    er_scada[ii, ids], er["baseline"], atol=5e-3
+                )
+        wd_bias, _ = b.estimate_wd_bias(use_fine_histograms=True, **kwargs)
+        self.assertAlmostEqual(float(wd_bias[0]), 10.0, delta=0.5)
+        self.assertRaises(
+            ValueError, b._get_fine_histograms, ws_mask=(6.0, 10.0),
+            wd_resolution=0.5, max_segments=1,
+        )
+        self.assertTrue(
+            best._is_wd_dependent_mapping(df, lambda df: df, set_pow_ref_by_wd)
+        )
+        self.assertFalse(
+            best._is_wd_dependent_mapping(df, lambda df: df, set_pow_ref)
+        )
+
+    def test_parallel_brute_force(self):
+        df, df_approx = load_data(wd_bias=-4.0, N=2000)
+        b = best.bias_estimation(
+            df=df,
+            df_fi_approx=df_approx,
+            test_turbines_subset=[1, 3],
+            df_ws_mapping_func=lambda df: df,
+            df_pow_ref_mapping_func=set_pow_ref,
+        )
+
+        # Distributing the grid over worker processes does not change the
+        # results, nor does the cost function evaluation modify the class,
+        # both with the fine histograms and with the rebuilt energy ratio
+        # suites of which the workers inherit the mapping functions
+        results = []
+        for use_fine_histograms in [True, False]:
+            for opt_workers in [1, 2]:
+                wd_bias, J = b.estimate_wd_bias(
+                    ws_mask=(6.0, 10.0),
+                    opt_search_range=(-10.0, 10.0),
+                    opt_search_brute_dx=2.0,
+                    opt_workers=opt_workers,
+                    er_wd_bin_width=3.0,
+                    use_fine_histograms=use_fine_histograms,
+                )
+                results.append((wd_bias, J, b.opt_wd_grid, b.opt_wd_cost))
+        # The rebuilt energy ratio suites of the optimal bias of the second
+        # estimation reuse the cached FLORIS predictions of the first one
+        self.assertGreaterEqual(b._get_shifted_dataframes.cache_info().hits, 1)
+        df_cor, df_fi = b._get_shifted_dataframes(0.0)
+        for d in [df_cor, df_fi]:
+            cols = [c for c in d.columns if c.startswith("pow_")]
+            self.assertEqual(cols, ["pow_ref", "pow_001", "pow_003"])
+        for x, y in zip(results[0], results[1]):
+            np.testing.assert_allclose(x, y)
+        for x, y in zip(results[2], results[3]):
+            np.testing.assert_allclose(x, y)
+        self.assertAlmostEqual(float(results[0][0][0]), -4.0, delta=0.5)
+        self.assertTrue(np.all(np.array(b.fsc_wd_bias_list) == wd_bias))
+
+    def test_farm_bias_estimation(self):
+        df, df_approx = load_data(wd_bias=0.0)
+        df["wd_000"] = (df["wd"] + 10.0) % 360.0
+        df["wd_005"] = (df["wd"] - 6.0) % 360.0
+
+        fb = best.farm_bias_estimation(
+            df=df,
+            df_fi_approx=df_approx,
+            ref_turbines=[0, 5],
+            test_turbines_subsets=[[1, 3], [1, 3]],
+            df_ws_mapping_funcs=lambda df: df,
+            df_pow_ref_mapping_funcs=set_pow_ref,
+        )
+        df_bias = fb.estimate_wd_bias(
+            ws_mask=(6.0, 10.0),
+            opt_search_range=(-20.0, 20.0),
+            er_wd_bin_width=3.0,
+        )
+        np.testing.assert_allclose(df_bias["wd_bias"], [10.0, -6.0], atol=0.5)
+
+        # The cost of every turbine matches that of bias_estimation
+        b = best.bias_estimation(
+            df=df.assign(wd=df["wd_000"]),
+            df_fi_approx=df_approx,
+            test_turbines_subset=[1, 3],
+            df_ws_mapping_func=lambda df: df,
+            df_pow_ref_mapping_func=set_pow_ref,
+        )
+        b.estimate_wd_bias(
+            ws_mask=(6.0, 10.0),
+            opt_search_range=(-20.0, 20.0),
+            opt_workers=1,
+            er_wd_bin_width=3.0,
+            use_fine_histograms=True,
+            ws_resolution=0.5,
+        )
+        np.testing.assert_allclose(fb.opt_wd_grid, b.opt_wd_grid)
+        np.testing.assert_allclose(fb.opt_wd_cost[0], b.opt_wd_cost)
+
+        # Mappings that depend on the wind direction are rejected
+        fb = best.farm_bias_estimation(
+            df=df,
+            df_fi_approx=df_approx,
+            ref_turbines=[0, 5],
+            test_turbines_subsets=[[1, 3], [1, 3]],
+            df_ws_mapping_funcs=lambda df: df,
+            df_pow_ref_mapping_funcs=[set_pow_ref, set_pow_ref_by_wd],
+        )
+        self.assertRaises(ValueError, fb.estimate_wd_bias, ws_mask=(6.0, 10.0))
@@ -1,10 +1,15 @@
 import os
+import tempfile
 import numpy as np
 import pandas as pd
 
 import unittest
+from flasc import floris_tools as ftools
 from flasc.floris_tools import (
+    calc_floris,
     calc_floris_approx_table,
+    floris_surrogate,
+    get_floris_approx_interpolants,
     interpolate_floris_from_df_approx
 )
 
@@ -39,6 +44,8 @@ class TestFlorisTools(unittest.TestCase):
             wd_array=np.arange(0.0, 10.0, 2.0),
             ws_array=[8.0, 9.0],
             ti_array=[0.08],
+            num_workers=2,
+            max_grid_size=4,
         )
 
         # Make sure singlecore and multicore solutions are equal
@@ -68,3 +75,234 @@ class TestFlorisTools(unittest.TestCase):
         # self.assertTrue(("ti_002" in df.columns))
         self.assertTrue(("pow_003" in df.columns))
         self.assertAlmostEqual(df.shape[0], 3)
+
+        # Reusing prebuilt interpolants gives identical results
+        interpolants = get_floris_approx_interpolants(df_fi_approx)
+        df_reuse = interpolate_floris_from_df_approx(
+            df[["time", "wd", "ws"]], df_fi_approx, interpolants=interpolants
+        )
+        pd.testing.assert_frame_equal(df, df_reuse)
+
+    def test_floris_approx_table_chunks(self):
+        fi = load_floris()
+        kwargs = {
+            "wd_array": np.arange(0.0, 30.0, 3.0),
+            "ws_array": [6.0, 8.0, 10.0],
+            "ti_array": [0.10, 0.06],
+        }
+        df_ref = calc_floris_approx_table(fi, max_grid_size=1000, **kwargs)
+        self.assertTrue(np.all(np.diff(df_ref["ti"]) >= 0.0))
+
+        with tempfile.TemporaryDirectory() as save_path:
+            # Chunked calculation streamed into a memory-mapped array
+            df_out = calc_floris_approx_table(
+                fi, max_grid_size=6, save_path=save_path, **kwargs
+            )
+            pd.testing.assert_frame_equal(df_out, df_ref)
+            chunks_done = np.load(os.path.join(save_path, "chunks_done.npy"))
+            self.assertEqual(len(chunks_done), 10)
+            self.assertTrue(np.all(chunks_done))
+
+            # Emulate an interrupted run: completed chunks are not
+            # recalculated and only the remaining chunks are filled in
+            values = np.load(
+                os.path.join(save_path, "values.npy"), mmap_mode="r+"
+            )
+            values[0:2, :, 0, :, :] = -1.0  # Completed chunk, kept as is
+            values[2:4, :, 1, :, :] = np.nan  # Unfinished chunk
+            values.flush()
+            del values
+            chunks_done[6] = False
+            np.save(os.path.join(save_path, "chunks_done.npy"), chunks_done)
+
+            df_resumed = calc_floris_approx_table(
+                fi, max_grid_size=6, save_path=save_path, **kwargs
+            )
+            ids_kept = (df_ref["ti"] == 0.06) & (df_ref["wd"] < 5.0)
+            self.assertTrue((df_resumed.loc[ids_kept, "pow_000"] == -1.0).all())
+            pd.testing.assert_frame_equal(df_resumed[~ids_kept], df_ref[~ids_kept])
+
+            # The table is stored in the format of the gridded surrogate,
+            # which can be returned without building the dataframe
+            surrogate = calc_floris_approx_table(
+                fi, max_grid_size=6, save_path=save_path,
+                return_surrogate=True, **kwargs
+            )
+            self.assertIsInstance(surrogate.values, np.memmap)
+            self.assertEqual(surrogate.values.shape, (10, 3, 2, 7, 1))
+            pd.testing.assert_frame_equal(surrogate.to_df_approx(), df_resumed)
+
+        surrogate = calc_floris_approx_table(
+            fi, max_grid_size=6, return_surrogate=True, **kwargs
+        )
+        pd.testing.assert_frame_equal(surrogate.to_df_approx(), df_ref)
+
+    def test_floris_surrogate(self):
+        file_path = os.path.dirname(os.path.abspath(__file__))
+        df_approx = pd.read_feather(
+            os.path.join(file_path, "../examples/demo_dataset/df_approx.ftr")
+        )
+        df_approx = df_approx[df_approx["ti"] <= 0.09].reset_index(drop=True)
+
+        # Converting to a surrogate and back yields the same table
+        surrogate = floris_surrogate.from_df_approx(df_approx, dtype=float)
+        self.assertEqual(surrogate.values.shape, (120, 27, 3, 7, 4))
+        df_out = surrogate.to_df_approx()
+        df_ref = df_approx.sort_values(by=["ti", "ws", "wd"])
+        df_ref = df_ref.reset_index(drop=True)[df_out.columns]
+        pd.testing.assert_frame_equal(df_out, df_ref)
+
+        # Interpolation equals the interpolants of df_approx, also for
+        # conditions outside the grid
+        rng = np.random.default_rng(0)
+        points = np.column_stack([
+            rng.uniform(-10.0, 370.0, 500),
+            rng.uniform(-1.0, 30.0, 500),
+            rng.uniform(0.0, 0.12, 500),
+        ])
+        for method in ["linear", "nearest"]:
+            y_ref = get_floris_approx_interpolants(df_approx, method)["pow"]
+            y_ref = y_ref(points)
+            y = surrogate.get_interpolants(method)["pow"](points)
+            np.testing.assert_allclose(y, y_ref, rtol=1.0e-9, atol=1.0e-6)
+
+        with tempfile.TemporaryDirectory() as save_path:
+            floris_surrogate.from_df_approx(df_approx).save(save_path)
+
+            # Load a memory-mapped subset of turbines and variables
+            surrogate = floris_surrogate.load(
+                save_path, turbines=[4, 1], varnames=["pow"]
+            )
+            self.assertIsInstance(surrogate.values, np.memmap)
+            self.assertEqual(surrogate.values.dtype, np.float32)
+            self.assertEqual(surrogate.turbines, [4, 1])
+            self.assertEqual(surrogate.varnames, ["pow"])
+            with self.assertRaises(KeyError):
+                surrogate.select(turbines=[7])
+
+            df = pd.DataFrame({"wd": points[:, 0] % 360.0, "ws": 8.2, "ti": 0.07})
+            df_out = interpolate_floris_from_df_approx(df, surrogate)
+            self.assertEqual(
+                list(df_out.columns), ["wd", "ws", "ti", "pow_004", "pow_001"]
+            )
+            df_ref = interpolate_floris_from_df_approx(df, df_approx)
+            np.testing.assert_allclose(
+                df_out[["pow_004", "pow_001"]],
+                df_ref[["pow_004", "pow_001"]],
+                rtol=1.0e-6,
+            )
+
+    def test_calc_floris_batching(self):
+        fi = load_floris()
+
+        # Scattered conditions with duplicates, of which some differ in yaw
+        rng = np.random.default_rng(0)
+        df = pd.DataFrame({
+            "wd": np.round(rng.uniform(0.0, 360.0, 12), 1),
+            "ws": np.round(rng.uniform(5.0, 12.0, 12), 1),
+            "ti": 0.08,
+        })
+        df.loc[8:11, ["wd", "ws"]] = df.loc[0:3, ["wd", "ws"]].to_numpy()
+        for ti in range(len(fi.layout_x)):
+            df["yaw_{:03d}".format(ti)] = df["wd"]
+        df.loc[0:1, "yaw_002"] = (df.loc[0:1, "wd"] + 10.0) % 360.0
+
+        # Batched solutions equal those evaluated row by row
+        df_out = calc_floris(df.copy(), fi.copy(), num_workers=1)
+        for idx in df.index:
+            fi.reinitialize(
+                wind_directions=[df.loc[idx, "wd"]],
+                wind_speeds=[df.loc[idx, "ws"]],
+                turbulence_intensity=0.08,
+            )
+            yaw_angles = np.array(
+                df.loc[idx, ["yaw_{:03d}".format(ti) for ti in range(7)]]
+                - df.loc[idx, "wd"],
+                dtype=float,
+            )
+            fi.calculate_wake(yaw_angles=yaw_angles.reshape(1, 1, -1))
+            np.testing.assert_allclose(
+                df_out.loc[idx, ["pow_{:03d}".format(ti) for ti in range(7)]]
+                .to_numpy(dtype=float),
+                fi.get_turbine_powers().flatten() / 1000.0,
+            )
+
+        # Rounded conditions equal the exact solutions of the rounded data
+        df = df[["wd", "ws", "ti"]]
+        df_round = df.copy()
+        df_round["wd"] = np.round(df["wd"] / 2.0) * 2.0 % 360.0
+        df_round["ws"] = np.round(df["ws"])
+        df_out = calc_floris(
+            df.copy(), fi.copy(), num_workers=1, wd_resolution=2.0,
+            ws_resolution=1.0
+        )
+        df_out_round = calc_floris(df_round, fi.copy(), num_workers=1)
+        cols = ["pow_{:03d}".format(ti) for ti in range(7)]
+        np.testing.assert_allclose(
+            df_out.loc[df.index, cols].to_numpy(dtype=float),
+            df_out_round.loc[df.index, cols].to_numpy(dtype=float),
+        )
+
+    def test_calc_floris_parallel(self):
+        fi = load_floris()
+        rng = np.random.default_rng(1)
+        df = pd.DataFrame({
+            "wd": rng.uniform(0.0, 360.0, 200),
+            "ws": rng.uniform(5.0, 12.0, 200),
+            "ti": 0.08,
+        })
+
+        # Solutions of the worker pool equal the serial solutions, and the
+        # pool is reused by repeated calls with the same FLORIS model
+        kwargs = {"wd_resolution": 10.0, "ws_resolution": 1.0}
+        df_serial = calc_floris(df.copy(), fi, num_workers=1, **kwargs)
+        df_out = calc_floris(df.copy(), fi, num_workers=2, **kwargs)
+        executor = ftools._floris_pool["executor"]
+        df_out_warm = calc_floris(df.copy(), fi, num_workers=2, **kwargs)
+        self.assertIs(ftools._floris_pool["executor"], executor)
+        for d in [df_out, df_out_warm]:
+            pd.testing.assert_frame_equal(d, df_serial)
+
+    def test_calc_floris_yaw_batching(self):
+        fi = load_floris()
+        nturbs = len(fi.layout_x)
+
+        # Steering campaign: toggling yaw offsets from a lookup table with
+        # measurement noise on a coarse grid of conditions
+        rng = np.random.default_rng(2)
+        N = 400
+        df = pd.DataFrame({
+            "wd": rng.choice(np.arange(250.0, 290.0, 5.0), N),
+            "ws": rng.choice([7.0, 8.0, 9.0], N),
+            "ti": 0.08,
+        })
+        steering = rng.integers(0, 2, N) * np.round((df["wd"] - 270.0) / 2.0)
+        for ti in range(nturbs):
+            yaw_offset = steering * (ti % 2) + rng.normal(0.0, 0.1, N)
+            df["yaw_{:03d}".format(ti)] = (df["wd"] + yaw_offset) % 360.0
+
+        # Quantized yaw offsets equal the exact solutions of quantized data
+        df_quantized = df.copy()
+        for ti in range(nturbs):
+            yaw_offset = (df["yaw_{:03d}".format(ti)] - df["wd"] + 180.0)
+            yaw_offset = np.round(yaw_offset % 360.0 - 180.0)
+            df_quantized["yaw_{:03d}".format(ti)] = (
+                (df["wd"] + yaw_offset) % 360.0
+            )
+        df_out = calc_floris(df.copy(), fi, num_workers=1, yaw_resolution=1.0)
+        df_out_quantized = calc_floris(df_quantized, fi, num_workers=1)
+        cols = ["pow_{:03d}".format(ti) for ti in range(nturbs)]
+        np.testing.assert_allclose(
+            df_out.loc[df.index, cols].to_numpy(dtype=float),
+            df_out_quantized.loc[df.index, cols].to_numpy(dtype=float),
+        )
+
+        # The steering and baseline conditions take two grid batches
+        yaw_rel = np.array(
+            df_quantized[["yaw_{:03d}".format(ti) for ti in range(nturbs)]]
+        ) - np.array(df["wd"])[:, None]
+        yaw_rel = (yaw_rel + 180.0) % 360.0 - 180.0
+        cases = np.unique(
+            np.column_stack([df["ti"], df["wd"], df["ws"], yaw_rel]), axis=0
+        )
+        self.assertEqual(len(ftools._get_floris_batches(cases)), 2)